@@ -3,9 +3,11 @@ Handles the AI aspect of the program.
 '''
 
 import random
+import time
+from array import array
+from chessEval import PIECES, PIECE_VALUES, piece_score
 
-piece_score = {'k': 0, 'q': 10, 'r': 5, 'b': 3, 'n': 3, 'p': 1} #assigning a value for every piece on the board
-CHECKMATE = 1000
+CHECKMATE = 30000 #in centipawns like the evaluation, and small enough for the transposition table's 16 bit scores
 STALEMATE = 0
 
 '''
@@ -15,40 +17,635 @@ the goal of the AI for white is to try to make black score as low as possible, a
 def find_random_move(valid_moves):
     return valid_moves[random.randint(0, len(valid_moves)-1)]
 
-#currently only looking 2 moves ahead
-def find_best_move(gs, valid_moves):
-    turn_multiplier = 1 if gs.white_to_move else -1 #triggers player turn exchange
-    opponent_min_max_score = CHECKMATE #this is the worst possible score for black
-    best_player_move = None
-    random.shuffle(valid_moves) #so that the AI doesn't repeat the same move over and over
-    #black will try to bring this score down
-    for player_move in valid_moves:
-        gs.make_move(player_move)
-        opponents_moves = gs.get_valid_moves()
-        if gs.stale_mate:
-            opponent_max_score = STALEMATE
-        elif gs.check_mate:
-            opponent_max_score = -CHECKMATE
+DEPTH = 4 #how many plies find_best_move searches by default
+MAX_DEPTH = 64 #how deep a search limited only by time or nodes may go
+TT_SIZE_MB = 16 #memory for the default transposition table
+nodes_searched = 0 #positions visited by the last search
+depth_reached = 0 #deepest iteration the last search completed
+transposition_table = None #shared by every search that doesn't pass its own table, created on first use
+search_deadline = None #time.perf_counter() value at which the running search stops, None for no time limit
+search_node_limit = None #number of nodes after which the running search stops, None for no limit
+search_stop = None #event (anything with is_set()) that stops the running search as soon as it is set, None if there isn't one
+BATCH_LEAVES = False #score the children of depth 1 nodes in one NumPy call (chessBatchEval) instead of one by one, only without QUIESCENCE
+QUIESCENCE = True #search captures and promotions past the leaves until the position is quiet, see quiescence()
+DELTA_MARGIN = 200 #centipawns, quiescence skips captures that can't get within this of alpha even if the piece is won for free
+chessBatchEval = None #imported the first time BATCH_LEAVES is used, so NumPy doesn't slow down starting up
+LEAF_EVALUATION = None #function(gs) -> score for white in centipawns used at the leaves instead of gs.evaluation, e.g. to compare evaluations in chessMatch
+RANDOM_ORDER = True #shuffle the root moves first, so equally ordered moves (and equal scores) are picked at random and the AI doesn't repeat the same game
+MAX_PLY = 128 #distance from the root the killer moves have slots for
+killer_moves = [[0, 0] for ply in range(MAX_PLY)] #per ply, the ids of the last two quiet moves that caused a beta cutoff there
+history = [0] * 4096 #per from/to square pair (move_id & 4095), how much quiet moves between them caused cutoffs, deeper ones counting more
+#selective search, each of them can be switched off on its own
+NULL_MOVE = True #null move pruning: if passing still leaves the opponent failing high on a shallower search, cut off
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2 #plies the null move search is shallower, one more from depth 7 on
+LATE_MOVE_REDUCTIONS = True #search quiet moves late in the order one or two plies shallower, again at full depth if they beat alpha
+LMR_MIN_DEPTH = 3
+LMR_FULL_MOVES = 3 #moves searched at full depth before reductions start
+PRINCIPAL_VARIATION = True #search every move after the first with a null window, and again with the full window only if it beats alpha
+ASPIRATION_WINDOWS = True #start every iteration with a window around the last iteration's score, widened when the score falls outside
+ASPIRATION_WINDOW = 50 #centipawns either side of the last score
+OPENING_BOOK = None #path of a Polyglot book (see chessBook) find_best_move plays from while the position is in it, None for no book
+opening_book = None #the book at OPENING_BOOK, opened on first use
+TABLEBASES = None #directory of endgame tables (see chessTablebase) probed at the root and in the search, None for none
+tablebases = None #the tables of TABLEBASES, opened on first use
+
+#kept for chessMain: returns only the move of search()
+def find_best_move(gs, valid_moves, depth=None, time_limit=None, node_limit=None, stop=None):
+    book = default_opening_book()
+    if book is not None:
+        move = book.book_move(gs, valid_moves)
+        if move is not None:
+            return move
+    return search(gs, valid_moves, depth, time_limit=time_limit, node_limit=node_limit, stop=stop)[0]
+
+def default_transposition_table():
+    global transposition_table
+    if transposition_table is None:
+        transposition_table = TranspositionTable(TT_SIZE_MB)
+    return transposition_table
+
+#the book at OPENING_BOOK, opened again when OPENING_BOOK changes. Opening it only maps the file, so it costs nothing
+def default_opening_book():
+    global opening_book
+    if OPENING_BOOK is None:
+        return None
+    if opening_book is None or opening_book.path != OPENING_BOOK:
+        import chessBook
+        if opening_book is not None:
+            opening_book.close()
+        opening_book = chessBook.OpeningBook(OPENING_BOOK)
+    return opening_book
+
+#the tables of TABLEBASES, opened again when TABLEBASES changes. Each table file is only mapped once it is needed
+def default_tablebases():
+    global tablebases
+    if TABLEBASES is None:
+        return None
+    if tablebases is None or tablebases.directory != TABLEBASES:
+        import chessTablebase
+        if tablebases is not None:
+            tablebases.close()
+        tablebases = chessTablebase.Tablebases(TABLEBASES)
+    return tablebases
+
+#raised inside the search when its time or node budget runs out
+class SearchAborted(Exception):
+    pass
+
+'''
+iterative deepening negamax search with alpha-beta pruning: searches 1 ply deep, then 2, and so on up to depth.
+time_limit (seconds) and node_limit cap the whole search; when either runs out, the result of the last completed
+iteration is returned, so e.g. time_limit=0.2 always answers within about 200 ms. depth defaults to DEPTH without
+limits and to MAX_DEPTH with them. Setting the stop event ends the search the same way from another thread or process,
+but at any time: stopped during the first iteration, the move returned is None.
+returns the best move and its score from the point of view of the side to move (positive is good for them).
+positions already searched deeply enough are looked up in tt (the default table if None) instead of searched again.
+on_iteration(depth, move, score) is called after every completed iteration, e.g. to report progress
+'''
+def search(gs, valid_moves, depth=None, tt=None, time_limit=None, node_limit=None, stop=None, on_iteration=None):
+    global nodes_searched, depth_reached, search_deadline, search_node_limit, search_stop
+    start_time = time.perf_counter()
+    nodes_searched = 0
+    depth_reached = 0
+    search_deadline = None
+    search_node_limit = None
+    search_stop = stop
+    if depth is None:
+        depth = DEPTH if time_limit is None and node_limit is None and stop is None else MAX_DEPTH
+    if tt is None:
+        tt = default_transposition_table()
+    tt.new_search()
+    clear_move_ordering()
+    if RANDOM_ORDER:
+        random.shuffle(valid_moves) #so that the AI doesn't repeat the same move over and over
+    root = tablebase_root_move(gs, valid_moves)
+    if root is not None: #the tables already know the shortest mate (or that it is a draw), nothing to search
+        depth_reached = 1
+        if on_iteration is not None:
+            on_iteration(1, root[0], root[1])
+        search_stop = None
+        return root
+    root_moves_made = len(gs.moveLog)
+    best_move = None
+    best_score = 0
+    for current_depth in range(1, depth + 1):
+        try:
+            if ASPIRATION_WINDOWS and best_move is not None:
+                move, score = aspiration_search(gs, valid_moves, current_depth, tt, best_move, best_score)
+            else:
+                move, score = search_root(gs, valid_moves, current_depth, tt, best_move)
+        except SearchAborted:
+            while len(gs.moveLog) > root_moves_made: #unwind the moves the aborted iteration left on the board
+                gs.undo_move()
+            break
+        best_move, best_score = move, score
+        depth_reached = current_depth
+        if on_iteration is not None and best_move is not None:
+            on_iteration(current_depth, best_move, best_score)
+        #the budget only applies once there is a move to fall back on
+        search_deadline = start_time + time_limit if time_limit is not None else None
+        search_node_limit = node_limit
+        if best_move is None or abs(best_score) > CHECKMATE - 500: #no moves, or a forced mate was found
+            break
+        if time_limit is not None and time.perf_counter() - start_time > time_limit / 2: #the next iteration would not finish in time
+            break
+    search_deadline = None
+    search_node_limit = None
+    search_stop = None
+    return best_move, best_score
+
+'''
+one iteration of the search. previous_best is the best move of the last iteration, which is tried first.
+the score is only exact if it ends up between alpha and beta, otherwise it is a bound and the move may not be the best
+'''
+def search_root(gs, valid_moves, depth, tt, previous_best, alpha=-CHECKMATE - 1, beta=CHECKMATE + 1):
+    turn_multiplier = 1 if gs.white_to_move else -1
+    if previous_best is not None:
+        hash_move = previous_best.move_id
+    else:
+        entry = tt.probe(gs.zobrist_key)
+        hash_move = entry[3] if entry else 0
+    original_alpha = alpha
+    best_move = None
+    best_score = -CHECKMATE - 1
+    for i, move in enumerate(order_moves(valid_moves, hash_move)):
+        gs.make_move(move)
+        if i == 0 or not PRINCIPAL_VARIATION:
+            score = -negamax(gs, depth - 1, -beta, -alpha, -turn_multiplier, 1, tt)
         else:
-            opponent_max_score = -CHECKMATE #check opponent's best move when responding to the AI's move
-            for opponents_move in opponents_moves:
-                gs.make_move(opponents_move)
-                gs.get_valid_moves()
-                if gs.check_mate:
-                    score = CHECKMATE
-                elif gs.stale_mate:
-                    score = STALEMATE
-                else:
-                    score = -turn_multiplier * score_material(gs.board) #pass in the board state and return a score based on the current game state
-                if (score > opponent_max_score):
-                    opponent_max_score = score #find a move that lowers the score for black. That move will be the best move
+            score = -negamax(gs, depth - 1, -alpha - 1, -alpha, -turn_multiplier, 1, tt)
+            if alpha < score < beta:
+                score = -negamax(gs, depth - 1, -beta, -alpha, -turn_multiplier, 1, tt)
+        gs.undo_move()
+        if score > best_score: #the fail-soft score is kept apart from alpha, so a first move failing low doesn't widen the window
+            best_score = score
+            best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+    if best_move is not None and original_alpha < best_score < beta:
+        tt.store(gs.zobrist_key, depth, score_to_tt(best_score, 0), EXACT, best_move.move_id)
+    return best_move, best_score
+
+'''
+search_root with a window of ASPIRATION_WINDOW around the score of the last iteration, which cuts off more of the tree.
+if the score falls outside, the window is widened on that side and the iteration searched again
+'''
+def aspiration_search(gs, valid_moves, depth, tt, previous_best, previous_score):
+    if abs(previous_score) > CHECKMATE - 500:
+        return search_root(gs, valid_moves, depth, tt, previous_best)
+    below = above = ASPIRATION_WINDOW
+    while below < 1000 and above < 1000:
+        alpha, beta = previous_score - below, previous_score + above
+        move, score = search_root(gs, valid_moves, depth, tt, previous_best, alpha, beta)
+        if score <= alpha:
+            below *= 4
+        elif score >= beta:
+            above *= 4
+            previous_best = move #it is at least this good, so try it first next time
+        else:
+            return move, score
+    return search_root(gs, valid_moves, depth, tt, previous_best)
+
+#checked every few nodes, raises SearchAborted once the time or node budget is used up or the search is stopped
+def check_budget():
+    if search_stop is not None and search_stop.is_set():
+        raise SearchAborted()
+    if search_deadline is not None and time.perf_counter() >= search_deadline:
+        raise SearchAborted()
+    if search_node_limit is not None and nodes_searched >= search_node_limit:
+        raise SearchAborted()
+
+'''
+score of the position for the side to move, searching depth more plies. ply is the distance from the root,
+so that a quicker checkmate scores higher than a slower one
+'''
+def negamax(gs, depth, alpha, beta, turn_multiplier, ply, tt, null_allowed=True):
+    global nodes_searched
+    if TABLEBASES is not None:
+        score = tablebase_score(default_tablebases().probe(gs), ply)
+        if score is not None:
+            return score
+    if depth == 0 and QUIESCENCE:
+        return quiescence(gs, alpha, beta, turn_multiplier, ply)
+    nodes_searched += 1
+    if nodes_searched & 15 == 0:
+        check_budget()
+    if depth == 0:
+        #cheap terminal detection: a leaf can only be checkmate if it is in check, so only then are its moves generated
+        if gs.in_check() and len(gs.get_valid_moves()) == 0:
+            return -CHECKMATE + ply
+        if LEAF_EVALUATION is not None:
+            return turn_multiplier * LEAF_EVALUATION(gs)
+        return turn_multiplier * gs.evaluation #kept up to date by make_move and undo_move
+
+    key = gs.zobrist_key
+    original_alpha = alpha
+    entry = tt.probe(key)
+    hash_move = 0
+    if entry:
+        entry_depth, entry_score, bound, hash_move = entry
+        if entry_depth >= depth: #searched at least as deep before, so the stored score can be trusted
+            entry_score = score_from_tt(entry_score, ply)
+            if bound == EXACT:
+                return entry_score
+            elif bound == LOWER_BOUND:
+                alpha = max(alpha, entry_score)
+            else:
+                beta = min(beta, entry_score)
+            if alpha >= beta:
+                return entry_score
+
+    #only needed where null moves or reductions can apply
+    in_check = ((NULL_MOVE and null_allowed and depth >= NULL_MOVE_MIN_DEPTH) or (LATE_MOVE_REDUCTIONS and depth >= LMR_MIN_DEPTH)) and \
+        gs.in_check()
+    '''
+    null move pruning: let the opponent move twice in a row. If a shallower search still fails high, a real move would
+    too, so this position is cut off without searching its moves. Not in check (passing would be illegal), not right
+    after another null move, not when beta is a mate score, and not with only king and pawns left, where having to
+    move can be a disadvantage (zugzwang) and passing would give a wrong score
+    '''
+    if NULL_MOVE and null_allowed and depth >= NULL_MOVE_MIN_DEPTH and not in_check and abs(beta) < CHECKMATE - 500 and \
+            turn_multiplier * (LEAF_EVALUATION(gs) if LEAF_EVALUATION is not None else gs.evaluation) >= beta and \
+            gs.has_non_pawn_material(gs.white_to_move):
+        reduction = NULL_MOVE_REDUCTION + (1 if depth >= 7 else 0)
+        gs.make_null_move()
+        moves_made = len(gs.moveLog)
+        try:
+            score = -negamax(gs, max(0, depth - 1 - reduction), -beta, -beta + 1, -turn_multiplier, ply + 1, tt, False)
+        except SearchAborted: #the search unwinds only real moves, so take back the ones above the null move and the null move here
+            while len(gs.moveLog) > moves_made:
                 gs.undo_move()
-        #score minimization part
-        if opponent_max_score < opponent_min_max_score:
-            opponent_min_max_score = opponent_max_score
-            best_player_move = player_move
+            gs.undo_null_move()
+            raise
+        gs.undo_null_move()
+        if score >= beta:
+            return beta
+
+    moves = gs.get_valid_moves()
+    if len(moves) == 0:
+        return -CHECKMATE + ply if gs.check_mate else STALEMATE
+    best_score = -CHECKMATE - 1
+    best_move_id = 0
+    leaf_scores = None
+    if depth == 1 and BATCH_LEAVES and not QUIESCENCE and load_batch_eval():
+        moves = order_moves(moves, hash_move, ply)
+        leaf_scores = score_leaves(gs, moves, -turn_multiplier, ply + 1)
+    else:
+        scores = score_moves(moves, hash_move, ply)
+    for i in range(len(moves)):
+        if leaf_scores is not None:
+            move = moves[i]
+            score = -leaf_scores[i]
+        else:
+            move = pick_move(moves, scores, i) #only sorted as far as the search gets before a cutoff
+            gs.make_move(move)
+            #late quiet moves (not captures, promotions, killers or checks) are unlikely to be best, so search them shallower
+            reduction = 0
+            if LATE_MOVE_REDUCTIONS and i >= LMR_FULL_MOVES and depth >= LMR_MIN_DEPTH and not in_check and \
+                    scores[i] < KILLER_SCORE and not gs.in_check():
+                reduction = 1 if i < 6 else 2
+            if i == 0 or not (PRINCIPAL_VARIATION or reduction):
+                score = -negamax(gs, depth - 1, -beta, -alpha, -turn_multiplier, ply + 1, tt)
+            else:
+                window_beta = alpha + 1 if PRINCIPAL_VARIATION else beta
+                score = -negamax(gs, depth - 1 - reduction, -window_beta, -alpha, -turn_multiplier, ply + 1, tt)
+                if reduction and score > alpha: #better than expected, search it again at full depth
+                    score = -negamax(gs, depth - 1, -window_beta, -alpha, -turn_multiplier, ply + 1, tt)
+                if PRINCIPAL_VARIATION and alpha < score < beta: #beat the null window, so its exact score is needed
+                    score = -negamax(gs, depth - 1, -beta, -alpha, -turn_multiplier, ply + 1, tt)
+            gs.undo_move()
+        if score > best_score:
+            best_score = score
+            best_move_id = move.move_id
+            if score > alpha:
+                alpha = score
+                if alpha >= beta: #the opponent already has a better option earlier in the tree, so it won't allow this position
+                    record_cutoff(move, depth, ply)
+                    break
+    if best_score <= original_alpha: #every move failed low, the real score is at most best_score
+        bound = UPPER_BOUND
+    elif best_score >= beta: #cut off, the real score is at least best_score
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT
+    tt.store(key, depth, score_to_tt(best_score, ply), bound, best_move_id)
+    return best_score
+
+'''
+a tablebase result (chessTablebase's (WIN, DRAW or LOSS, plies to mate) for the side to move, or None) as a search
+score at ply, with the mates the same as the search would score them
+'''
+def tablebase_score(result, ply):
+    if result is None:
+        return None
+    outcome, plies = result
+    if outcome > 0:
+        return CHECKMATE - ply - plies
+    if outcome < 0:
+        return -CHECKMATE + ply + plies
+    return STALEMATE
+
+'''
+the best root move and its score by the tables: the shortest win, else a draw, else the longest loss. None if there are
+no tables for the position or for one of the positions its moves lead to
+'''
+def tablebase_root_move(gs, valid_moves):
+    tables = default_tablebases()
+    if tables is None or not valid_moves or tables.probe(gs) is None:
+        return None
+    best_move = None
+    best_score = 0
+    for move in valid_moves:
+        gs.make_move(move)
+        score = tablebase_score(tables.probe(gs), 1)
         gs.undo_move()
-    return best_player_move
+        if score is None:
+            return None
+        if best_move is None or -score > best_score:
+            best_move, best_score = move, -score
+    return best_move, best_score
+
+'''
+quiescence search: a leaf isn't scored as it stands, since a piece may still be hanging. Captures and promotions are
+played out until the position is quiet. The side to move may also stop capturing and take the static evaluation
+(stand pat), so it is a lower bound and returns right away if it already reaches beta. Delta pruning skips captures
+that couldn't bring the score up to alpha even if the captured piece came for free. In check there is no standing
+pat: every evasion is searched, which also finds checkmates
+'''
+def quiescence(gs, alpha, beta, turn_multiplier, ply):
+    global nodes_searched
+    nodes_searched += 1
+    if nodes_searched & 15 == 0:
+        check_budget()
+    in_check = gs.in_check()
+    if in_check:
+        moves = gs.get_valid_moves()
+        if len(moves) == 0:
+            return -CHECKMATE + ply
+        stand_pat = best_score = -CHECKMATE - 1
+    else:
+        stand_pat = best_score = turn_multiplier * (LEAF_EVALUATION(gs) if LEAF_EVALUATION is not None else gs.evaluation)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        moves = gs.get_valid_moves(captures_only=True)
+    scores = score_moves(moves, 0, ply)
+    for i in range(len(moves)):
+        move = pick_move(moves, scores, i)
+        if not in_check and stand_pat + DELTA_GAINS[move.piece_captured] + PROMOTION_GAINS[move.promotion_piece] + DELTA_MARGIN <= alpha:
+            continue
+        gs.make_move(move)
+        score = -quiescence(gs, -beta, -alpha, -turn_multiplier, ply + 1)
+        gs.undo_move()
+        if score > best_score:
+            best_score = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+    return best_score
+
+#what a capture or promotion can win at most, in centipawns, for delta pruning
+DELTA_GAINS = dict(PIECE_VALUES, **{'--': 0})
+PROMOTION_GAINS = {None: 0, 'q': PIECE_VALUES['wq'] - PIECE_VALUES['wp'], 'r': PIECE_VALUES['wr'] - PIECE_VALUES['wp'],
+                   'b': PIECE_VALUES['wb'] - PIECE_VALUES['wp'], 'n': PIECE_VALUES['wn'] - PIECE_VALUES['wp']}
+
+#imports chessBatchEval once, returns False if NumPy isn't installed
+def load_batch_eval():
+    global chessBatchEval, BATCH_LEAVES
+    if chessBatchEval is None:
+        try:
+            import chessBatchEval
+        except ImportError:
+            BATCH_LEAVES = False
+            return False
+    return True
+
+'''
+the depth 0 scores of the positions after each of moves, like negamax would return them, but with every
+position that isn't checkmate gathered into one batch for chessBatchEval. turn_multiplier and ply are the children's
+'''
+def score_leaves(gs, moves, turn_multiplier, ply):
+    global nodes_searched
+    scores = [0] * len(moves)
+    batched = []
+    rows = []
+    for i, move in enumerate(moves):
+        nodes_searched += 1
+        gs.make_move(move)
+        if gs.in_check() and len(gs.get_valid_moves()) == 0:
+            scores[i] = -CHECKMATE + ply
+        else:
+            batched.append(i)
+            rows.extend([''.join(row) for row in gs.board])
+        gs.undo_move()
+    if batched:
+        evaluations = chessBatchEval.evaluate_batch(chessBatchEval.decode_text(''.join(rows)))
+        for i, evaluation in zip(batched, evaluations.tolist()):
+            scores[i] = turn_multiplier * evaluation
+    check_budget() #a batch counts many nodes at once, so check after every one
+    return scores
+
+'''
+move ordering, so that alpha-beta finds cutoffs early: the hash move (the best move found here before, at the root the
+best move of the last iteration) first, then captures and promotions, the most valuable victim first and among those
+the least valuable attacker first (MVV-LVA), then the killer moves of the ply, then the other quiet moves by history
+'''
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORE = 1 << 27
+HISTORY_LIMIT = KILLER_SCORE - 1 #so no quiet move is tried before a killer
+MVV_LVA = {victim: {attacker: 10 * piece_score[victim[1]] - piece_score[attacker[1]] for attacker in PIECES}
+           for victim in PIECES}
+MVV_LVA['--'] = {attacker: 0 for attacker in PIECES} #quiet promotions
+PROMOTION_SCORES = {None: 0, 'q': 100, 'r': 50, 'b': 30, 'n': 30}
+
+#the ordering score of every move, in the same order as moves
+def score_moves(moves, hash_move, ply):
+    killers = killer_moves[ply] if ply < MAX_PLY else (0, 0)
+    scores = []
+    for move in moves:
+        move_id = move.move_id
+        if move_id == hash_move:
+            scores.append(HASH_MOVE_SCORE)
+        elif move.piece_captured != '--' or move.is_pawn_promotion:
+            scores.append(CAPTURE_SCORE + MVV_LVA[move.piece_captured][move.piece_moved] + PROMOTION_SCORES[move.promotion_piece])
+        elif move_id == killers[0]:
+            scores.append(KILLER_SCORE + 1)
+        elif move_id == killers[1]:
+            scores.append(KILLER_SCORE)
+        else:
+            scores.append(min(history[move_id & 4095], HISTORY_LIMIT))
+    return scores
+
+'''
+selection sort one step at a time: swaps the best scored of moves[start:] to start (in both lists) and returns it.
+ties go to the move that comes first
+'''
+def pick_move(moves, scores, start):
+    best = max(range(start, len(moves)), key=scores.__getitem__)
+    if best != start:
+        moves[start], moves[best] = moves[best], moves[start]
+        scores[start], scores[best] = scores[best], scores[start]
+    return moves[start]
+
+#moves sorted best first, keeping the order they came in for equal scores
+def order_moves(moves, hash_move=0, ply=0):
+    scores = score_moves(moves, hash_move, ply)
+    return [moves[i] for i in sorted(range(len(moves)), key=scores.__getitem__, reverse=True)]
+
+#a quiet move caused a beta cutoff: make it a killer of its ply and raise its history
+def record_cutoff(move, depth, ply):
+    if move.piece_captured != '--' or move.is_pawn_promotion or ply >= MAX_PLY:
+        return
+    killers = killer_moves[ply]
+    if killers[0] != move.move_id:
+        killers[1] = killers[0]
+        killers[0] = move.move_id
+    history[move.move_id & 4095] += depth * depth
+
+#called when a search starts: killers only make sense within one search, history is halved so old cutoffs fade
+def clear_move_ordering():
+    for killers in killer_moves:
+        killers[0] = killers[1] = 0
+    for i in range(4096):
+        history[i] >>= 1
+
+'''
+the line the search expects, starting with move: after it, the best move stored in tt for every following position,
+as long as that move is legal there. At most max_length moves
+'''
+def principal_variation(gs, move, tt, max_length):
+    line = [move]
+    gs.make_move(move)
+    seen = {gs.zobrist_key} #stop at a repetition, the table can lead around in a loop
+    while len(line) < max_length:
+        entry = tt.probe(gs.zobrist_key)
+        if not entry or not entry[3]:
+            break
+        next_move = None
+        for valid_move in gs.get_valid_moves():
+            if valid_move.move_id == entry[3]:
+                next_move = valid_move
+        if next_move is None:
+            break
+        gs.make_move(next_move)
+        line.append(next_move)
+        if gs.zobrist_key in seen:
+            break
+        seen.add(gs.zobrist_key)
+    for _ in line:
+        gs.undo_move()
+    return line
+
+#number of moves until mate for a score: positive if the side to move mates, negative if it gets mated, None if it isn't a mate score
+def mate_distance(score):
+    if score > CHECKMATE - 500:
+        return (CHECKMATE - score + 1) // 2
+    if score < -CHECKMATE + 500:
+        return -((CHECKMATE + score) // 2)
+    return None
+
+#mate scores are stored relative to the position instead of the root, so they stay right when reached at another ply
+def score_to_tt(score, ply):
+    if score > CHECKMATE - 500:
+        return score + ply
+    if score < -CHECKMATE + 500:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score > CHECKMATE - 500:
+        return score - ply
+    if score < -CHECKMATE + 500:
+        return score + ply
+    return score
+
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2 #what a stored score means
+
+'''
+fixed size transposition table keyed by GameState.zobrist_key.
+each entry is two 64 bit words, the full key and the packed data: bits 0-15 best move id, 16-23 depth,
+24-25 bound, 26-41 score + 32768, 42-49 the search it was stored in. So size_mb megabytes hold size_mb * 65536 entries.
+entries come in pairs: the first slot keeps the deepest result (unless it is from an older search),
+the second is always overwritten, so deep results survive while recent ones are still kept
+'''
+class TranspositionTable():
+    ENTRY_BYTES = 16
+
+    def __init__(self, size_mb=TT_SIZE_MB):
+        buckets = self.bucket_count(size_mb)
+        self.mask = buckets - 1
+        self.keys = array('Q', bytes(16 * buckets))
+        self.data = array('Q', bytes(16 * buckets))
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    #largest power of two number of entry pairs that fits in size_mb
+    @classmethod
+    def bucket_count(cls, size_mb):
+        buckets = 1
+        while buckets * 4 * cls.ENTRY_BYTES <= size_mb * 1024 * 1024:
+            buckets *= 2
+        return buckets
+
+    def __len__(self):
+        return len(self.keys)
+
+    #call once per search, so that entries from earlier searches can be replaced
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    #returns (depth, score, bound, move id) stored for key, or None
+    def probe(self, key):
+        i = (key & self.mask) << 1
+        keys = self.keys
+        if keys[i] == key:
+            data = self.data[i]
+        elif keys[i+1] == key:
+            data = self.data[i+1]
+        else:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return (data >> 16) & 0xFF, ((data >> 26) & 0xFFFF) - 32768, (data >> 24) & 3, data & 0xFFFF
+
+    def store(self, key, depth, score, bound, move_id):
+        i = (key & self.mask) << 1
+        data = move_id | (depth << 16) | (bound << 24) | ((score + 32768) << 26) | (self.age << 42)
+        old = self.data[i]
+        if self.keys[i] == key or depth >= (old >> 16) & 0xFF or (old >> 42) & 0xFF != self.age:
+            if self.keys[i] != key and old: #demote the replaced entry instead of losing it
+                self.keys[i+1] = self.keys[i]
+                self.data[i+1] = old
+            self.keys[i] = key
+            self.data[i] = data
+        else:
+            self.keys[i+1] = key
+            self.data[i+1] = data
+        self.stores += 1
+
+    def clear(self):
+        self.keys = array('Q', bytes(8 * len(self.keys)))
+        self.data = array('Q', bytes(8 * len(self.data)))
+        self.hits = self.misses = self.stores = 0
+
+    '''
+    hit and miss counts since the table was created or cleared, and how full it is (sampled from the first 1000 slots)
+    '''
+    def stats(self):
+        probes = self.hits + self.misses
+        sample = self.data[:1000]
+        return {'size_mb': len(self.keys) * self.ENTRY_BYTES / (1024 * 1024), 'entries': len(self.keys),
+                'hits': self.hits, 'misses': self.misses, 'stores': self.stores,
+                'hit_rate': self.hits / probes if probes else 0.0,
+                'fill_rate': sum(1 for data in sample if data) / len(sample)}
 
 '''
 score the board based on material
@@ -0,0 +1,214 @@
+'''
+Batch analysis of FEN/EPD files too big to load at once: positions are read one line at a time, searched on a pool of
+worker processes at a fixed depth, node count or time, and every result (bestmove, score, nodes, time, ...) is written
+to a JSONL or CSV file as soon as it and everything before it is done, in input order.
+
+    python chessAnalysis.py positions.epd results.jsonl --depth 4 --workers 8
+    python chessAnalysis.py positions.epd results.csv --nodes 20000 --resume
+
+Only a few positions per worker are in flight at a time, so memory stays the same however long the input is. Every
+CHECKPOINT_EVERY results the byte offset reached in the input and the size of the output are saved next to the output
+(results.jsonl.checkpoint). --resume carries on from there, after cutting off any results written after the checkpoint,
+so a job that was stopped or crashed ends up with every position exactly once. Lines that aren't positions, or that the
+search fails on, get a result with only an error. The workers keep their transposition tables from one position to the
+next, like chessParallel's.
+'''
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import chessAI
+from chessCLI import analyse
+from chessEngine import GameState
+
+WORKERS = os.cpu_count() or 1 #default number of worker processes
+IN_FLIGHT_PER_WORKER = 4 #positions handed to each worker ahead of time, enough to keep it busy
+CHECKPOINT_EVERY = 200 #results written between checkpoints
+FIELDS = ('line', 'id', 'fen', 'bestmove', 'score', 'mate', 'depth', 'nodes', 'seconds', 'nps', 'error') #CSV columns
+worker_state = None #GameState every position of a process is loaded into, instead of building a new one each time
+
+'''
+yields (line number, byte offset just after the line, text) for every position in the file, starting at the byte
+offset given, which is the start of line number line_number + 1. Empty lines and lines starting with # are skipped
+'''
+def read_positions(path, offset=0, line_number=0):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            offset += len(raw)
+            line_number += 1
+            text = raw.decode('utf-8', 'replace').strip()
+            if text and not text.startswith('#'):
+                yield line_number, offset, text
+
+#the id operation of an EPD line (like id "WAC.001";), None if it hasn't got one
+def epd_id(text):
+    fields = text.split(None, 4)
+    if len(fields) < 5:
+        return None
+    for operation in fields[4].split(';'):
+        words = operation.strip().split(None, 1)
+        if len(words) == 2 and words[0] == 'id':
+            return words[1].strip().strip('"')
+    return None
+
+def init_worker(hash_mb):
+    chessAI.TT_SIZE_MB = hash_mb
+    chessAI.transposition_table = None #made again with the new size by the first search
+
+'''
+searches the position of one line, runs on the workers. returns the result as a dict with the keys of FIELDS
+'''
+def analyse_position(line_number, text, depth=None, node_limit=None, time_limit=None):
+    global worker_state
+    result = dict.fromkeys(FIELDS)
+    result['line'] = line_number
+    result['id'] = epd_id(text)
+    try:
+        if worker_state is None:
+            worker_state = GameState(text)
+        else:
+            worker_state.load_fen(text)
+    except ValueError as e:
+        result['fen'] = text
+        result['error'] = str(e)
+        return result
+    result['fen'] = worker_state.to_fen()
+    try:
+        result.update(analyse(worker_state, depth, time_limit, node_limit))
+    except Exception as e: #one position the search fails on gets an error row instead of stopping the whole job
+        worker_state = None #it may be left in the middle of a move, the next position starts on a new one
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    return result
+
+'''
+yields (position, result) for every (line number, offset, text) position of positions, in the same order. With more
+than one worker the positions are searched on a process pool, with at most IN_FLIGHT_PER_WORKER of them per worker
+handed out but not yet yielded, so positions is only read as fast as the results are used
+'''
+def analyse_stream(positions, depth=None, node_limit=None, time_limit=None, workers=None, hash_mb=chessAI.TT_SIZE_MB):
+    workers = workers or WORKERS
+    if workers <= 1:
+        init_worker(hash_mb)
+        for position in positions:
+            yield position, analyse_position(position[0], position[2], depth, node_limit, time_limit)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(hash_mb,)) as executor:
+        pending = deque()
+        for position in positions:
+            pending.append((position, executor.submit(analyse_position, position[0], position[2], depth, node_limit, time_limit)))
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                position, future = pending.popleft()
+                yield position, future.result()
+        while pending:
+            position, future = pending.popleft()
+            yield position, future.result()
+
+#writes one result per line, as JSON objects or as CSV rows under a header
+class ResultWriter():
+
+    def __init__(self, f, output_format, header):
+        self.f = f
+        self.csv_writer = None
+        if output_format == 'csv':
+            self.csv_writer = csv.DictWriter(f, FIELDS)
+            if header:
+                self.csv_writer.writeheader()
+
+    def write(self, result):
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(result)
+        else:
+            self.f.write(json.dumps(result) + '\n')
+
+def load_checkpoint(path):
+    with open(path) as f:
+        return json.load(f)
+
+#written to a temporary file first, so a crash while saving leaves the previous checkpoint
+def save_checkpoint(path, checkpoint):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+'''
+analyses every position of input_path into output_path (JSONL, or CSV if output_format is 'csv') and returns the number
+of results written. With resume, starts where the checkpoint of output_path says the last run got to, and raises
+ValueError if output_path no longer holds the results the checkpoint counts
+'''
+def run(input_path, output_path, depth=None, node_limit=None, time_limit=None, workers=None, output_format='jsonl',
+        resume=False, hash_mb=chessAI.TT_SIZE_MB, checkpoint_every=CHECKPOINT_EVERY, progress=None):
+    checkpoint_path = output_path + '.checkpoint'
+    checkpoint = {'offset': 0, 'line': 0, 'output_size': 0, 'results': 0}
+    if resume and os.path.exists(checkpoint_path):
+        checkpoint = load_checkpoint(checkpoint_path)
+        if not os.path.exists(output_path) or os.path.getsize(output_path) < checkpoint['output_size']:
+            raise ValueError('%s is missing or shorter than its checkpoint says (%d bytes), run again without --resume to '
+                             'start over' % (output_path, checkpoint['output_size']))
+        with open(output_path, 'r+b') as f:
+            f.truncate(checkpoint['output_size']) #results written after the checkpoint are analysed again
+    elif os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    start = time.perf_counter()
+    written = 0
+    with open(output_path, 'a' if checkpoint['output_size'] else 'w', newline='', encoding='utf-8') as f:
+        writer = ResultWriter(f, output_format, header=checkpoint['output_size'] == 0)
+        positions = read_positions(input_path, checkpoint['offset'], checkpoint['line'])
+        try:
+            for (line_number, offset, text), result in analyse_stream(positions, depth, node_limit, time_limit, workers, hash_mb):
+                writer.write(result)
+                written += 1
+                checkpoint['line'], checkpoint['offset'] = line_number, offset
+                if written % checkpoint_every == 0:
+                    f.flush()
+                    checkpoint['output_size'] = f.buffer.tell()
+                    checkpoint['results'] += checkpoint_every
+                    save_checkpoint(checkpoint_path, checkpoint)
+                    if progress is not None:
+                        progress(checkpoint['results'], written / (time.perf_counter() - start))
+        finally: #also when stopped or when a worker dies, so the job can be resumed from the last result written
+            f.flush()
+            checkpoint['output_size'] = f.buffer.tell()
+            checkpoint['results'] += written % checkpoint_every
+            save_checkpoint(checkpoint_path, checkpoint)
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='analyse every position of a FEN/EPD file')
+    parser.add_argument('input', help='FEN or EPD file, one position per line')
+    parser.add_argument('output', help='results file, CSV if it ends in .csv and JSONL otherwise')
+    parser.add_argument('--depth', type=int, help='plies to search every position')
+    parser.add_argument('--nodes', type=int, help='nodes to search every position')
+    parser.add_argument('--time', type=float, help='seconds to search every position')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help='output format, taken from the file name if left out')
+    parser.add_argument('--resume', action='store_true', help='carry on from the checkpoint of the output file')
+    parser.add_argument('--hash', type=int, default=chessAI.TT_SIZE_MB, help='transposition table size per worker in MB')
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY, help='results between checkpoints')
+    args = parser.parse_args(argv)
+
+    if args.depth is None and args.nodes is None and args.time is None:
+        args.depth = chessAI.DEPTH
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    report = lambda results, rate: print('%d positions, %.1f/s' % (results, rate), file=sys.stderr)
+    try:
+        written = run(args.input, args.output, args.depth, args.nodes, args.time, args.workers, output_format, args.resume,
+                      args.hash, args.checkpoint_every, report)
+    except KeyboardInterrupt:
+        print('stopped, run again with --resume to carry on', file=sys.stderr)
+        return 130
+    except ValueError as e:
+        print('error:', e, file=sys.stderr)
+        return 2
+    print('%d positions analysed' % written, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+'''
+Scores many positions in one call with NumPy, for analysis runs that evaluate a lot of leaves.
+Uses the same material and piece-square weights as chessEval, so a batch scores exactly what GameState.evaluation holds.
+
+Positions are either a (N, 64) int8 array with one code per square (0 empty, 1-6 for white pawn, knight, bishop, rook,
+queen, king and -1 to -6 for the black ones), or a (N, 12, 64) plane tensor with one 0/1 plane per piece in PIECES order.
+Squares are row*8 + col, like everywhere else.
+'''
+
+import random
+import time
+import numpy as np
+from chessEval import PIECES, PIECE_VALUES, PIECE_SQUARE_TABLES, evaluate_board
+
+PIECE_TYPES = 'pnbrqk'
+PIECE_CODES = {'--': 0}
+for piece in PIECES:
+    PIECE_CODES[piece] = (PIECE_TYPES.index(piece[1]) + 1) * (1 if piece[0] == 'w' else -1)
+
+#SQUARE_SCORES[code + 6][sq] is what that piece on that square adds to the score, from white's point of view
+SQUARE_SCORES = np.zeros((13, 64), dtype=np.int32)
+for piece in PIECES:
+    sign = 1 if piece[0] == 'w' else -1
+    SQUARE_SCORES[PIECE_CODES[piece] + 6] = [sign * (PIECE_VALUES[piece] + PIECE_SQUARE_TABLES[piece][sq]) for sq in range(64)]
+#the same weights laid out like the plane tensor
+PLANE_WEIGHTS = np.stack([SQUARE_SCORES[PIECE_CODES[piece] + 6] for piece in PIECES])
+SQUARE_INDEX = np.arange(64)
+
+#byte lookups that turn the two characters of a piece string into its code
+TYPE_CODES = np.zeros(256, dtype=np.int8)
+for i, piece_type in enumerate(PIECE_TYPES):
+    TYPE_CODES[ord(piece_type)] = i + 1
+COLOR_SIGNS = np.zeros(256, dtype=np.int8)
+COLOR_SIGNS[ord('w')] = 1
+COLOR_SIGNS[ord('b')] = -1
+
+'''
+encoding: board is the 8x8 list of strings of a GameState, squares the flat list of a BitboardGameState.
+the piece strings are joined into one byte string and decoded by NumPy, which is much faster than a lookup per square
+'''
+def decode_text(text):
+    pairs = np.frombuffer(text.encode('ascii'), dtype=np.uint8).reshape(-1, 64, 2)
+    return TYPE_CODES[pairs[:, :, 1]] * COLOR_SIGNS[pairs[:, :, 0]]
+
+def encode_board(board):
+    return decode_text(''.join([''.join(row) for row in board]))[0]
+
+def encode_boards(boards):
+    return decode_text(''.join([''.join(row) for board in boards for row in board]))
+
+def encode_squares(squares_list):
+    return decode_text(''.join([''.join(squares) for squares in squares_list]))
+
+#(N, 64) codes -> (N, 12, 64) planes
+def to_planes(codes):
+    codes = np.asarray(codes)
+    return (codes[:, None, :] == np.array([PIECE_CODES[piece] for piece in PIECES], dtype=np.int8)[None, :, None]).astype(np.int8)
+
+'''
+scores of N positions from white's point of view in centipawns, as an int32 array of length N.
+positions is either the (N, 64) codes or the (N, 12, 64) planes
+'''
+def evaluate_batch(positions):
+    positions = np.asarray(positions)
+    if positions.ndim == 3:
+        return np.tensordot(positions.astype(np.int32), PLANE_WEIGHTS, axes=([1, 2], [0, 1])).astype(np.int32)
+    return SQUARE_SCORES[positions.astype(np.intp) + 6, SQUARE_INDEX].sum(axis=1, dtype=np.int32)
+
+'''
+scores every position reached by one of moves from gs, from white's point of view.
+the children are made and undone one by one to encode them, then scored in a single evaluate_batch call
+'''
+def evaluate_children(gs, moves):
+    rows = []
+    for move in moves:
+        gs.make_move(move)
+        rows.extend([''.join(row) for row in gs.board])
+        gs.undo_move()
+    return evaluate_batch(decode_text(''.join(rows)))
+
+'''
+times per-leaf scoring (chessEval.evaluate_board on each board) against evaluate_batch for growing batch sizes,
+and returns the rows (batch size, per-leaf seconds, batch seconds, batch seconds including encoding) plus the
+smallest batch size where the batch is faster, counting the encoding or not
+'''
+def benchmark(positions=None, batch_sizes=(1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096), repeats=5):
+    if positions is None:
+        positions = random_boards(max(batch_sizes))
+    rows = []
+    crossover = crossover_with_encoding = None
+    for size in batch_sizes:
+        boards = [positions[i % len(positions)] for i in range(size)]
+        codes = encode_boards(boards)
+        per_leaf = best_time(lambda: [evaluate_board(board) for board in boards], repeats)
+        batch = best_time(lambda: evaluate_batch(codes), repeats)
+        with_encoding = best_time(lambda: evaluate_batch(encode_boards(boards)), repeats)
+        rows.append((size, per_leaf, batch, with_encoding))
+        if crossover is None and batch < per_leaf:
+            crossover = size
+        if crossover_with_encoding is None and with_encoding < per_leaf:
+            crossover_with_encoding = size
+    return rows, crossover, crossover_with_encoding
+
+def best_time(function, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+#positions from random games, for the benchmark
+def random_boards(count, seed=0):
+    from chessEngine import GameState #only needed here
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        gs = GameState()
+        for _ in range(rng.randint(0, 60)):
+            moves = gs.get_valid_moves()
+            if not moves:
+                break
+            gs.make_move(rng.choice(moves))
+        boards.append([row[:] for row in gs.board])
+    return boards
+
+
+if __name__ == '__main__':
+    rows, crossover, crossover_with_encoding = benchmark()
+    print('batch   per-leaf us   batch us   batch+encode us   (per position)')
+    for size, per_leaf, batch, with_encoding in rows:
+        print('%5d   %11.2f   %8.2f   %15.2f' % (size, per_leaf / size * 1e6, batch / size * 1e6, with_encoding / size * 1e6))
+    print('batch beats per-leaf scoring from', crossover, 'positions (' + str(crossover_with_encoding), 'counting the encoding)')
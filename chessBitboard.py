@@ -0,0 +1,478 @@
+'''
+Bitboard backend for the engine. BitboardGameState keeps the same make_move/undo_move/get_valid_moves
+API as chessEngine.GameState, so chessAI and chessMain can use either one.
+
+Every piece type of every colour is a 64 bit integer with one bit per square (bit row*8 + col, so bit 0 is a8
+and bit 63 is h1). Move generation and attack tests are set operations on those integers.
+'''
+
+from chessEngine import GameState, Castle_rights, Move, KNIGHT_ATTACK_BITS, KING_ATTACK_BITS, WHITE_PAWN_ATTACK_BITS, BLACK_PAWN_ATTACK_BITS, \
+    ZOBRIST_PIECES, ZOBRIST_BLACK_TO_MOVE, ZOBRIST_ENPASSANT, castling_key, compute_zobrist_key
+from chessEval import PIECE_VALUES, PIECE_SQUARE_TABLES
+
+PIECES = ('wp', 'wn', 'wb', 'wr', 'wq', 'wk', 'bp', 'bn', 'bb', 'br', 'bq', 'bk')
+FULL = (1 << 64) - 1
+FILE_A = sum(1 << (r * 8) for r in range(8))
+FILE_H = FILE_A << 7
+SQUARE_COORDS = [divmod(sq, 8) for sq in range(64)] #square index -> (row, col)
+
+#attack tables for the jumping pieces, flattened to square indices
+KNIGHT_ATTACKS = [KNIGHT_ATTACK_BITS[r][c] for r in range(8) for c in range(8)]
+KING_ATTACKS = [KING_ATTACK_BITS[r][c] for r in range(8) for c in range(8)]
+PAWN_ATTACKS = {'w': [WHITE_PAWN_ATTACK_BITS[r][c] for r in range(8) for c in range(8)],
+                'b': [BLACK_PAWN_ATTACK_BITS[r][c] for r in range(8) for c in range(8)]}
+
+'''
+rays for the sliding pieces. A direction is positive if it walks towards higher square indices,
+which decides whether the nearest blocker on a ray is its lowest or its highest set bit
+'''
+ROOK_DIRECTIONS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, -1), (-1, 1))
+
+def build_rays(d_row, d_col):
+    rays = []
+    for sq in range(64):
+        r, c = SQUARE_COORDS[sq]
+        ray = 0
+        for i in range(1, 8):
+            if not (0 <= r + d_row * i < 8 and 0 <= c + d_col * i < 8):
+                break
+            ray |= 1 << ((r + d_row * i) * 8 + c + d_col * i)
+        rays.append(ray)
+    return rays
+
+ROOK_RAYS = [(build_rays(d_row, d_col), d_row * 8 + d_col > 0) for d_row, d_col in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(build_rays(d_row, d_col), d_row * 8 + d_col > 0) for d_row, d_col in BISHOP_DIRECTIONS]
+#attacks on an empty board, used to find pieces that could pin or check along a line
+ROOK_EMPTY_ATTACKS = [sum(rays[sq] for rays, _ in ROOK_RAYS) for sq in range(64)]
+BISHOP_EMPTY_ATTACKS = [sum(rays[sq] for rays, _ in BISHOP_RAYS) for sq in range(64)]
+
+def build_between():
+    #between[a][b] holds the squares strictly between a and b if they share a line, otherwise 0
+    between = [[0] * 64 for _ in range(64)]
+    for rays, _ in ROOK_RAYS + BISHOP_RAYS:
+        for a in range(64):
+            ray = rays[a]
+            walked = 0
+            while ray:
+                #walk the ray outward from a, whatever direction its bits run in
+                nearest = min((ray & -ray).bit_length() - 1, ray.bit_length() - 1, key=lambda sq: abs(sq - a))
+                between[a][nearest] = walked
+                walked |= 1 << nearest
+                ray &= ~(1 << nearest)
+    return between
+
+BETWEEN = build_between()
+
+def slide(sq, occupied, ray_table):
+    attacks = 0
+    for rays, positive in ray_table:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            #cut the ray off behind the nearest blocker, the blocker itself stays attacked
+            blocker = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+            ray ^= rays[blocker]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(sq, occupied):
+    return slide(sq, occupied, ROOK_RAYS)
+
+def bishop_attacks(sq, occupied):
+    return slide(sq, occupied, BISHOP_RAYS)
+
+def squares_of(bb):
+    #yields the index of every set bit, lowest first
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+'''
+castling: the king's start square, the squares that have to be empty, the squares the king crosses
+(which must not be attacked, the last one is where it lands) and the rook's start square, for each of the four castling rights
+'''
+CASTLING = {'wks': (60, (1 << 61) | (1 << 62), (61, 62), 63),
+            'wqs': (60, (1 << 57) | (1 << 58) | (1 << 59), (59, 58), 56),
+            'bks': (4, (1 << 5) | (1 << 6), (5, 6), 7),
+            'bqs': (4, (1 << 1) | (1 << 2) | (1 << 3), (3, 2), 0)}
+#moving from or capturing on one of these squares loses the castling rights listed
+CASTLE_RIGHTS_SQUARES = {60: ('wks', 'wqs'), 63: ('wks',), 56: ('wqs',), 4: ('bks', 'bqs'), 7: ('bks',), 0: ('bqs',)}
+#what a piece on a square adds to the evaluation from white's point of view
+SIGNED_SCORES = {piece: [(1 if piece[0] == 'w' else -1) * (PIECE_VALUES[piece] + PIECE_SQUARE_TABLES[piece][sq]) for sq in range(64)]
+                 for piece in PIECES}
+
+
+class BitboardGameState():
+
+    #copies the position of a chessEngine.GameState, the default one if none is given
+    def __init__(self, game_state=None):
+        if game_state is None:
+            game_state = GameState()
+        self.pieces = {piece: 0 for piece in PIECES} #one bitboard per piece type and colour
+        self.squares = ['--'] * 64 #what is on each square, so captured pieces can be looked up directly
+        for r in range(8):
+            for c in range(8):
+                piece = game_state.board[r][c]
+                if piece != '--':
+                    self.pieces[piece] |= 1 << (r * 8 + c)
+                    self.squares[r * 8 + c] = piece
+        self.occupied = {'w': 0, 'b': 0}
+        for piece in PIECES:
+            self.occupied[piece[0]] |= self.pieces[piece]
+        #material and piece-square scores per colour in centipawns, kept up to date by put_piece and remove_piece
+        self.material = {'w': 0, 'b': 0}
+        self.piece_square = {'w': 0, 'b': 0}
+        for sq in range(64):
+            piece = self.squares[sq]
+            if piece != '--':
+                self.material[piece[0]] += PIECE_VALUES[piece]
+                self.piece_square[piece[0]] += PIECE_SQUARE_TABLES[piece][sq]
+        self.evaluation = self.material['w'] - self.material['b'] + self.piece_square['w'] - self.piece_square['b'] #positive is good for white
+        self.board_view = None #8x8 list of strings, built on demand for the GUI
+
+        self.white_to_move = game_state.white_to_move
+        self.halfmove_clock = game_state.halfmove_clock
+        self.fullmove_number = game_state.fullmove_number
+        self.moveLog = []
+        self.white_king_location = game_state.white_king_location
+        self.black_king_location = game_state.black_king_location
+        self.check_mate = False
+        self.stale_mate = False
+        self.enpassant_possible = game_state.enpassant_possible
+        self.enpassant_log = []
+        rights = game_state.current_castling_right
+        self.current_castling_right = Castle_rights(rights.wks, rights.bks, rights.wqs, rights.bqs)
+        self.castle_rights_log = [Castle_rights(rights.wks, rights.bks, rights.wqs, rights.bqs)]
+        #same keys as chessEngine.GameState, so both backends can share a transposition table
+        self.zobrist_key = compute_zobrist_key(game_state.board, self.white_to_move, rights, self.enpassant_possible)
+        self.zobrist_log = []
+
+    #FEN export only reads attributes both backends have
+    to_fen = GameState.to_fen
+
+    #pickled in the same compact form as chessEngine.GameState: the position only, without the move history
+    def __getstate__(self):
+        rights = self.current_castling_right
+        return ''.join(self.squares), self.white_to_move, (rights.wks, rights.bks, rights.wqs, rights.bqs), self.enpassant_possible
+
+    def __setstate__(self, state):
+        game_state = GameState.__new__(GameState)
+        game_state.__setstate__(state)
+        self.__init__(game_state)
+
+    '''
+    the 8x8 list of strings that chessEngine.GameState keeps, only built when something asks for it
+    '''
+    @property
+    def board(self):
+        if self.board_view is None:
+            self.board_view = [self.squares[r * 8:r * 8 + 8] for r in range(8)]
+        return self.board_view
+
+    #same names as chessEngine.GameState
+    @property
+    def white_material(self):
+        return self.material['w']
+
+    @property
+    def black_material(self):
+        return self.material['b']
+
+    @property
+    def white_piece_square(self):
+        return self.piece_square['w']
+
+    @property
+    def black_piece_square(self):
+        return self.piece_square['b']
+
+    def put_piece(self, piece, sq):
+        bit = 1 << sq
+        self.pieces[piece] |= bit
+        self.occupied[piece[0]] |= bit
+        self.squares[sq] = piece
+        self.zobrist_key ^= ZOBRIST_PIECES[piece][sq]
+        self.material[piece[0]] += PIECE_VALUES[piece]
+        self.piece_square[piece[0]] += PIECE_SQUARE_TABLES[piece][sq]
+        self.evaluation += SIGNED_SCORES[piece][sq]
+
+    def remove_piece(self, piece, sq):
+        bit = 1 << sq
+        self.pieces[piece] &= ~bit
+        self.occupied[piece[0]] &= ~bit
+        self.squares[sq] = '--'
+        self.zobrist_key ^= ZOBRIST_PIECES[piece][sq]
+        self.material[piece[0]] -= PIECE_VALUES[piece]
+        self.piece_square[piece[0]] -= PIECE_SQUARE_TABLES[piece][sq]
+        self.evaluation -= SIGNED_SCORES[piece][sq]
+
+    #zobrist key of the en passant square, only if a pawn of the side to move could actually capture there
+    def enpassant_key(self):
+        if not self.enpassant_possible:
+            return 0
+        ep_row, ep_col = self.enpassant_possible
+        us, them = ('w', 'b') if self.white_to_move else ('b', 'w')
+        if PAWN_ATTACKS[them][ep_row * 8 + ep_col] & self.pieces[us + 'p']:
+            return ZOBRIST_ENPASSANT[ep_col]
+        return 0
+
+    def make_move(self, move):
+        start = move.start_row * 8 + move.start_column
+        end = move.end_row * 8 + move.end_column
+        color = move.piece_moved[0]
+        self.zobrist_log.append(self.zobrist_key)
+        self.zobrist_key ^= self.enpassant_key() ^ castling_key(self.current_castling_right) ^ ZOBRIST_BLACK_TO_MOVE
+        if move.is_enpassant_move:
+            self.remove_piece(move.piece_captured, move.start_row * 8 + move.end_column) #the captured pawn is beside the start square
+        elif move.piece_captured != '--':
+            self.remove_piece(move.piece_captured, end)
+        self.remove_piece(move.piece_moved, start)
+        self.put_piece(color + move.promotion_piece if move.is_pawn_promotion else move.piece_moved, end)
+        if move.is_castle_move:
+            rook_start, rook_end = (end + 1, end - 1) if move.end_column > move.start_column else (end - 2, end + 1)
+            self.remove_piece(color + 'r', rook_start)
+            self.put_piece(color + 'r', rook_end)
+        self.board_view = None
+        self.moveLog.append(move)
+        self.white_to_move = not self.white_to_move
+        if move.piece_moved == 'wk':
+            self.white_king_location = (move.end_row, move.end_column)
+        elif move.piece_moved == 'bk':
+            self.black_king_location = (move.end_row, move.end_column)
+        self.enpassant_log.append(self.enpassant_possible)
+        if move.piece_moved[1] == 'p' and abs(move.start_row - move.end_row) == 2:
+            self.enpassant_possible = ((move.start_row + move.end_row) // 2, move.start_column)
+        else:
+            self.enpassant_possible = ()
+        #a king or rook leaving its square, or a rook being captured, loses the matching castling rights
+        rights = self.current_castling_right
+        rights = Castle_rights(rights.wks, rights.bks, rights.wqs, rights.bqs)
+        for sq in (start, end):
+            for right in CASTLE_RIGHTS_SQUARES.get(sq, ()):
+                setattr(rights, right, False)
+        self.current_castling_right = rights
+        self.castle_rights_log.append(Castle_rights(rights.wks, rights.bks, rights.wqs, rights.bqs))
+        self.zobrist_key ^= self.enpassant_key() ^ castling_key(rights)
+
+    def undo_move(self):
+        if len(self.moveLog) == 0:
+            return
+        move = self.moveLog.pop()
+        start = move.start_row * 8 + move.start_column
+        end = move.end_row * 8 + move.end_column
+        color = move.piece_moved[0]
+        if move.is_castle_move:
+            rook_start, rook_end = (end + 1, end - 1) if move.end_column > move.start_column else (end - 2, end + 1)
+            self.remove_piece(color + 'r', rook_end)
+            self.put_piece(color + 'r', rook_start)
+        self.remove_piece(self.squares[end], end)
+        self.put_piece(move.piece_moved, start)
+        if move.is_enpassant_move:
+            self.put_piece(move.piece_captured, move.start_row * 8 + move.end_column)
+        elif move.piece_captured != '--':
+            self.put_piece(move.piece_captured, end)
+        self.board_view = None
+        self.white_to_move = not self.white_to_move
+        if move.piece_moved == 'wk':
+            self.white_king_location = (move.start_row, move.start_column)
+        elif move.piece_moved == 'bk':
+            self.black_king_location = (move.start_row, move.start_column)
+        self.enpassant_possible = self.enpassant_log.pop()
+        self.castle_rights_log.pop()
+        rights = self.castle_rights_log[-1]
+        self.current_castling_right = Castle_rights(rights.wks, rights.bks, rights.wqs, rights.bqs)
+        self.zobrist_key = self.zobrist_log.pop() #put_piece and remove_piece changed it on the way, the saved key is exact
+        self.check_mate = False
+        self.stale_mate = False
+
+    #same as chessEngine.GameState.make_null_move
+    def make_null_move(self):
+        self.enpassant_log.append(self.enpassant_possible)
+        self.zobrist_log.append(self.zobrist_key)
+        self.zobrist_key ^= ZOBRIST_BLACK_TO_MOVE ^ self.enpassant_key()
+        self.enpassant_possible = ()
+        self.white_to_move = not self.white_to_move
+
+    def undo_null_move(self):
+        self.white_to_move = not self.white_to_move
+        self.enpassant_possible = self.enpassant_log.pop()
+        self.zobrist_key = self.zobrist_log.pop()
+
+    def has_non_pawn_material(self, white):
+        color = 'w' if white else 'b'
+        pieces = self.pieces
+        return bool(pieces[color + 'n'] | pieces[color + 'b'] | pieces[color + 'r'] | pieces[color + 'q'])
+
+    '''
+    bitboard of every piece of colour `color` that attacks square sq, given the occupied squares
+    '''
+    def attackers_to(self, sq, color, occupied):
+        pieces = self.pieces
+        queens = pieces[color + 'q']
+        enemy = 'b' if color == 'w' else 'w'
+        #a pawn of `color` attacks sq from the squares an enemy pawn on sq would attack
+        return (PAWN_ATTACKS[enemy][sq] & pieces[color + 'p']) | (KNIGHT_ATTACKS[sq] & pieces[color + 'n']) | \
+            (KING_ATTACKS[sq] & pieces[color + 'k']) | (rook_attacks(sq, occupied) & (pieces[color + 'r'] | queens)) | \
+            (bishop_attacks(sq, occupied) & (pieces[color + 'b'] | queens))
+
+    def is_square_attacked(self, r, c, by_white):
+        return self.attackers_to(r * 8 + c, 'w' if by_white else 'b', self.occupied['w'] | self.occupied['b']) != 0
+
+    def square_under_attack(self, r, c):
+        return self.is_square_attacked(r, c, not self.white_to_move)
+
+    def in_check(self):
+        king = self.pieces['wk' if self.white_to_move else 'bk']
+        if not king:
+            return False
+        return self.attackers_to(king.bit_length() - 1, 'b' if self.white_to_move else 'w', self.occupied['w'] | self.occupied['b']) != 0
+
+    #bitmap (bit row*8 + col) of every square attacked by one side
+    def get_attack_map(self, by_white):
+        color = 'w' if by_white else 'b'
+        pieces = self.pieces
+        occupied = self.occupied['w'] | self.occupied['b']
+        pawns = pieces[color + 'p']
+        if by_white:
+            attacks = ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+        else:
+            attacks = ((pawns & ~FILE_H) << 9) | ((pawns & ~FILE_A) << 7)
+        for sq in squares_of(pieces[color + 'n']):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in squares_of(pieces[color + 'k']):
+            attacks |= KING_ATTACKS[sq]
+        for sq in squares_of(pieces[color + 'r'] | pieces[color + 'q']):
+            attacks |= rook_attacks(sq, occupied)
+        for sq in squares_of(pieces[color + 'b'] | pieces[color + 'q']):
+            attacks |= bishop_attacks(sq, occupied)
+        return attacks
+
+    #like chessEngine.GameState.get_valid_moves, captures_only leaves out every move that isn't a capture or promotion
+    def get_valid_moves(self, captures_only=False):
+        moves = []
+        us, them = ('w', 'b') if self.white_to_move else ('b', 'w')
+        pieces = self.pieces
+        squares = self.squares
+        own = self.occupied[us]
+        occupied = own | self.occupied[them]
+        allowed = self.occupied[them] if captures_only else FULL #squares moves other than pawn moves may end on
+        king = pieces[us + 'k']
+
+        check_mask = FULL #squares a non-king piece may move to
+        pin_masks = {} #pinned piece square -> the line it may move along
+        checkers = 0
+        if king:
+            king_sq = king.bit_length() - 1
+            checkers = self.attackers_to(king_sq, them, occupied)
+            if checkers:
+                if checkers & (checkers - 1): #double check, only the king can move
+                    check_mask = 0
+                else:
+                    checker = checkers.bit_length() - 1
+                    check_mask = checkers | BETWEEN[king_sq][checker]
+            #an enemy slider on a line with the king and exactly one of our pieces in between pins that piece
+            snipers = (ROOK_EMPTY_ATTACKS[king_sq] & (pieces[them + 'r'] | pieces[them + 'q'])) | \
+                      (BISHOP_EMPTY_ATTACKS[king_sq] & (pieces[them + 'b'] | pieces[them + 'q']))
+            for sniper in squares_of(snipers):
+                blockers = BETWEEN[king_sq][sniper] & occupied
+                if blockers and not blockers & (blockers - 1) and blockers & own:
+                    pin_masks[blockers.bit_length() - 1] = BETWEEN[king_sq][sniper] | (1 << sniper)
+
+            #king moves: the target square must not be attacked once the king has left its square
+            king_start = SQUARE_COORDS[king_sq]
+            without_king = occupied ^ king
+            for sq in squares_of(KING_ATTACKS[king_sq] & ~own & allowed):
+                if not self.attackers_to(sq, them, without_king):
+                    moves.append(Move(king_start, SQUARE_COORDS[sq], None, piece_moved=us + 'k', piece_captured=squares[sq]))
+            if not checkers and not captures_only:
+                self.get_castle_moves(king_sq, us, them, occupied, moves)
+
+        if check_mask:
+            targets = ~own & check_mask & allowed
+            for piece, attack_function in (('n', None), ('b', bishop_attacks), ('r', rook_attacks), ('q', None)):
+                for sq in squares_of(pieces[us + piece]):
+                    if piece == 'n':
+                        if sq in pin_masks: #a pinned knight can never move
+                            continue
+                        attacks = KNIGHT_ATTACKS[sq]
+                    elif piece == 'q':
+                        attacks = rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+                    else:
+                        attacks = attack_function(sq, occupied)
+                    attacks &= targets & pin_masks.get(sq, FULL)
+                    start_sq = SQUARE_COORDS[sq]
+                    for end in squares_of(attacks):
+                        moves.append(Move(start_sq, SQUARE_COORDS[end], None, piece_moved=us + piece, piece_captured=squares[end]))
+            self.get_pawn_moves(us, them, occupied, check_mask, pin_masks, moves, captures_only)
+
+        if len(moves) == 0 and not captures_only: #if there is no valid moves, then the game has ended
+            if checkers:
+                self.check_mate = True
+            else:
+                self.stale_mate = True
+        return moves
+
+    '''
+    pawn moves are generated for all pawns at once by shifting the pawn bitboard, then traced back to their start squares
+    '''
+    def get_pawn_moves(self, us, them, occupied, check_mask, pin_masks, moves, captures_only=False):
+        pawns = self.pieces[us + 'p']
+        squares = self.squares
+        empty = ~occupied & FULL
+        enemies = self.occupied[them]
+        piece = us + 'p'
+        if us == 'w': #white pawns move towards row 0, i.e. to lower square indices
+            single = (pawns >> 8) & empty
+            double = ((single & (0xFF << 40)) >> 8) & empty
+            if captures_only: #pushes only if they promote
+                single &= 0xFF
+                double = 0
+            #(targets, start square offset from the target)
+            groups = ((single, 8), (double, 16), (((pawns & ~FILE_A) >> 9) & enemies, 9), (((pawns & ~FILE_H) >> 7) & enemies, 7))
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & (0xFF << 16)) << 8) & empty
+            if captures_only:
+                single &= 0xFF << 56
+                double = 0
+            groups = ((single, -8), (double, -16), (((pawns & ~FILE_H) << 9) & enemies, -9), (((pawns & ~FILE_A) << 7) & enemies, -7))
+        for targets, offset in groups:
+            for end in squares_of(targets & check_mask):
+                start = end + offset
+                if start in pin_masks and not pin_masks[start] >> end & 1:
+                    continue
+                if end < 8 or end >= 56: #reaching the last row, one move per promotion piece
+                    for promotion in ('q', 'r', 'b', 'n'):
+                        moves.append(Move(SQUARE_COORDS[start], SQUARE_COORDS[end], None, piece_moved=piece, piece_captured=squares[end],
+                                          promotion_piece=promotion))
+                else:
+                    moves.append(Move(SQUARE_COORDS[start], SQUARE_COORDS[end], None, piece_moved=piece, piece_captured=squares[end]))
+
+        if self.enpassant_possible:
+            ep_row, ep_col = self.enpassant_possible
+            ep = ep_row * 8 + ep_col
+            king = self.pieces[us + 'k']
+            for start in squares_of(PAWN_ATTACKS[them][ep] & pawns):
+                start_row = start // 8
+                captured = start_row * 8 + ep_col
+                #make the capture on the occupancy and check every attacker, since two pawns leave the king's row at once
+                after = occupied ^ (1 << start) ^ (1 << captured) | (1 << ep)
+                if king and self.attackers_to(king.bit_length() - 1, them, after) & ~(1 << captured):
+                    continue
+                moves.append(Move(SQUARE_COORDS[start], (ep_row, ep_col), None, is_enpassant_move=True,
+                                  piece_moved=piece, piece_captured=squares[ep]))
+
+    def get_castle_moves(self, king_sq, us, them, occupied, moves):
+        rights = self.current_castling_right
+        for right, allowed in ((us + 'ks', rights.wks if us == 'w' else rights.bks), (us + 'qs', rights.wqs if us == 'w' else rights.bqs)):
+            if not allowed:
+                continue
+            king_start, empty_squares, king_path, rook_start = CASTLING[right]
+            if king_sq != king_start or not self.pieces[us + 'r'] >> rook_start & 1 or occupied & empty_squares:
+                continue
+            if any(self.attackers_to(sq, them, occupied) for sq in king_path):
+                continue
+            moves.append(Move(SQUARE_COORDS[king_sq], SQUARE_COORDS[king_path[1]], None, is_castle_move=True,
+                              piece_moved=us + 'k', piece_captured='--'))
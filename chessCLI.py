@@ -0,0 +1,80 @@
+'''
+Headless command line entry point: searches one position and prints the best move, its score, the depth reached,
+nodes and nodes per second. It never imports pygame (or NumPy), so it starts quickly enough to run as many short-lived
+worker processes.
+
+    python chessCLI.py --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1" --time 0.5
+    python chessCLI.py --moves e2e4 e7e5 --depth 4 --json
+
+Without --fen the search starts from GameState's own starting position. Without --depth, --time or --nodes it
+searches chessAI.DEPTH plies.
+'''
+
+import argparse
+import json
+import sys
+import time
+import chessAI
+from chessEngine import GameState, move_from_notation
+
+'''
+the game state of fen (or the starting position if None) after playing moves (like e2e4 or e7e8q) from it.
+raises ValueError for a bad FEN or a move that isn't legal
+'''
+def load_game_state(fen=None, moves=(), bitboards=False):
+    gs = GameState(fen) if fen is not None else GameState()
+    for notation in moves:
+        move = move_from_notation(gs, notation)
+        if move is None:
+            raise ValueError('illegal move ' + notation)
+        gs.make_move(move)
+    if bitboards:
+        from chessBitboard import BitboardGameState #only loaded when asked for, its tables take a while to build
+        return BitboardGameState(gs)
+    return gs
+
+'''
+searches gs and returns the result as a dict: best move (None if there are no legal moves), score in centipawns for
+the side to move, mate in moves if the score is a mate, depth reached, nodes, seconds and nodes per second
+'''
+def analyse(gs, depth=None, time_limit=None, node_limit=None):
+    start = time.perf_counter()
+    move, score = chessAI.search(gs, gs.get_valid_moves(), depth, time_limit=time_limit, node_limit=node_limit)
+    seconds = time.perf_counter() - start
+    return {'bestmove': move.get_chess_notation() if move is not None else None,
+            'score': score, 'mate': chessAI.mate_distance(score) if move is not None else None,
+            'depth': chessAI.depth_reached, 'nodes': chessAI.nodes_searched, 'seconds': seconds,
+            'nps': round(chessAI.nodes_searched / seconds) if seconds else 0}
+
+def format_result(result):
+    if result['bestmove'] is None:
+        return 'bestmove (none)'
+    score = 'mate %d' % result['mate'] if result['mate'] is not None else 'cp %d' % result['score']
+    return 'bestmove %s score %s depth %d nodes %d time %.3f nps %d' % (result['bestmove'], score, result['depth'],
+                                                                       result['nodes'], result['seconds'], result['nps'])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='search a chess position without the GUI')
+    parser.add_argument('--fen', help='position to search, the starting position if left out')
+    parser.add_argument('--moves', nargs='*', default=[], help='moves to play from the position first, like e2e4 e7e5')
+    parser.add_argument('--depth', type=int, help='plies to search')
+    parser.add_argument('--time', type=float, help='seconds to search')
+    parser.add_argument('--nodes', type=int, help='nodes to search')
+    parser.add_argument('--hash', type=int, default=chessAI.TT_SIZE_MB, help='transposition table size in MB')
+    parser.add_argument('--bitboards', action='store_true', help='use the bitboard backend')
+    parser.add_argument('--json', action='store_true', help='print the result as one JSON object')
+    args = parser.parse_args(argv)
+
+    try:
+        gs = load_game_state(args.fen, args.moves, args.bitboards)
+    except ValueError as e:
+        print('error:', e, file=sys.stderr)
+        return 2
+    chessAI.TT_SIZE_MB = args.hash
+    result = analyse(gs, args.depth, args.time, args.nodes)
+    print(json.dumps(result) if args.json else format_result(result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
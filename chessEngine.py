@@ -1,55 +1,310 @@
 '''
 The main engine. Handles movement of pieces.
 '''
+import random
+from array import array
+from chessEval import PIECE_VALUES, PIECE_SQUARE_TABLES, evaluate_board
+
+'''
+lookup tables used by the attack queries, built once when the module is imported.
+squares are (row, col) tuples, and attack bitmaps use bit row*8 + col
+'''
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+def build_jump_table(offsets):
+    #every square a piece on (row, col) can jump to, already clipped to the board
+    return [[[(r + dr, c + dc) for dr, dc in offsets if 0 <= r + dr < 8 and 0 <= c + dc < 8] for c in range(8)] for r in range(8)]
+
+def build_ray_table(directions):
+    #for every square, the list of squares in each direction up to the edge of the board, nearest first
+    return [[[[(r + dr * i, c + dc * i) for i in range(1, 8) if 0 <= r + dr * i < 8 and 0 <= c + dc * i < 8]
+              for dr, dc in directions] for c in range(8)] for r in range(8)]
+
+def squares_to_bits(squares):
+    bits = 0
+    for r, c in squares:
+        bits |= 1 << (r * 8 + c)
+    return bits
+
+KNIGHT_TARGETS = build_jump_table(KNIGHT_OFFSETS)
+KING_TARGETS = build_jump_table(KING_OFFSETS)
+ROOK_RAYS = build_ray_table(ROOK_DIRECTIONS)
+BISHOP_RAYS = build_ray_table(BISHOP_DIRECTIONS)
+KNIGHT_ATTACK_BITS = [[squares_to_bits(KNIGHT_TARGETS[r][c]) for c in range(8)] for r in range(8)]
+KING_ATTACK_BITS = [[squares_to_bits(KING_TARGETS[r][c]) for c in range(8)] for r in range(8)]
+#squares attacked by a white pawn (which moves up the board) and a black pawn on (row, col)
+WHITE_PAWN_ATTACK_BITS = [[squares_to_bits(build_jump_table(((-1, -1), (-1, 1)))[r][c]) for c in range(8)] for r in range(8)]
+BLACK_PAWN_ATTACK_BITS = [[squares_to_bits(build_jump_table(((1, -1), (1, 1)))[r][c]) for c in range(8)] for r in range(8)]
+
+
+'''
+Zobrist keys: a random 64 bit number for every piece on every square, for black to move, for every castling right
+and for every en passant file. A position's key is the XOR of the numbers of everything in it, so make_move and
+undo_move can keep it up to date by XOR-ing in and out only what changed. The seed is fixed so keys are the same in
+every process
+'''
+zobrist_random = random.Random(20240229)
+ZOBRIST_PIECES = {piece: [zobrist_random.getrandbits(64) for sq in range(64)]
+                  for piece in ('wp', 'wn', 'wb', 'wr', 'wq', 'wk', 'bp', 'bn', 'bb', 'br', 'bq', 'bk')}
+ZOBRIST_BLACK_TO_MOVE = zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = {right: zobrist_random.getrandbits(64) for right in ('wks', 'wqs', 'bks', 'bqs')}
+ZOBRIST_ENPASSANT = [zobrist_random.getrandbits(64) for col in range(8)]
+
+def castling_key(rights):
+    key = 0
+    if rights.wks:
+        key ^= ZOBRIST_CASTLING['wks']
+    if rights.wqs:
+        key ^= ZOBRIST_CASTLING['wqs']
+    if rights.bks:
+        key ^= ZOBRIST_CASTLING['bks']
+    if rights.bqs:
+        key ^= ZOBRIST_CASTLING['bqs']
+    return key
+
+'''
+the en passant file only counts if a pawn of the side to move stands next to the pawn that just moved two squares,
+so positions that only differ by an en passant capture nobody can make still get the same key
+'''
+def enpassant_key(board, enpassant_possible):
+    if not enpassant_possible:
+        return 0
+    r, c = enpassant_possible
+    pawn_row, capturer = (3, 'wp') if r == 2 else (4, 'bp')
+    if (c > 0 and board[pawn_row][c-1] == capturer) or (c < 7 and board[pawn_row][c+1] == capturer):
+        return ZOBRIST_ENPASSANT[c]
+    return 0
+
+#the key of a position computed from scratch
+def compute_zobrist_key(board, white_to_move, castle_rights, enpassant_possible):
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            if board[r][c] != '--':
+                key ^= ZOBRIST_PIECES[board[r][c]][r * 8 + c]
+    if not white_to_move:
+        key ^= ZOBRIST_BLACK_TO_MOVE
+    return key ^ castling_key(castle_rights) ^ enpassant_key(board, enpassant_possible)
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1' #the standard starting position
+
+FEN_PIECES = {char: ('w' if char.isupper() else 'b') + char.lower() for char in 'PNBRQKpnbrqk'}
+FEN_RANK_CACHE_SIZE = 50000 #ranks kept by parse_fen_rank, the cache is emptied when it gets bigger
+FEN_RANK_CACHE = {}
+
+'''
+one rank of a FEN placement (like 'r3k2r') on row r: the 8 squares as a tuple, the XOR of their Zobrist piece keys and
+their (white material, black material, white piece-square, black piece-square) scores. Most ranks (empty ones, pawn
+rows, back ranks) come up again and again across positions, so the results are cached. fen is only for error messages
+'''
+def parse_fen_rank(r, rank, fen):
+    cached = FEN_RANK_CACHE.get((r, rank))
+    if cached is not None:
+        return cached
+    row = []
+    for char in rank:
+        if char in '12345678':
+            row.extend(['--'] * int(char))
+        elif char in FEN_PIECES:
+            row.append(FEN_PIECES[char])
+        else:
+            raise ValueError('bad piece ' + repr(char) + ' in FEN: ' + fen)
+    if len(row) != 8:
+        raise ValueError('rank ' + repr(rank) + ' is not 8 squares long in FEN: ' + fen)
+    key = 0
+    for c in range(8):
+        if row[c] != '--':
+            key ^= ZOBRIST_PIECES[row[c]][r * 8 + c]
+    board = [['--'] * 8 for _ in range(8)]
+    board[r] = row
+    cached = (tuple(row), key, evaluate_board(board))
+    if len(FEN_RANK_CACHE) >= FEN_RANK_CACHE_SIZE:
+        FEN_RANK_CACHE.clear()
+    FEN_RANK_CACHE[(r, rank)] = cached
+    return cached
+
+
 class GameState():
 
-    def __init__(self):
-        #Creating an 8 by 8 2D list, representing an 8 by 8 chessboard.
+    #starts from the position of a FEN string, the standard starting position if none is given
+    def __init__(self, fen=START_FEN):
+        #The board is an 8 by 8 2D list, representing an 8 by 8 chessboard.
         #The items in the list are pieces and blanks on the board.
         #items beginning with 'b' are black pieces
         #items beginning with 'w' are white pieces
-        # self.board = [
-        #     ["br", "bn", "bb", "bq", "bk", "bb", "bn", "br"],
-        #     ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
-        #     ["--", "--", "--", "--", "--", "--", "--", "--"],
-        #     ["--", "--", "--", "--", "--", "--", "--", "--"],
-        #     ["--", "--", "--", "--", "--", "--", "--", "--"],
-        #     ["--", "--", "--", "--", "--", "--", "--", "--"],
-        #     ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
-        #     ["wr", "wn", "wb", "wq", "wk", "wb", "wn", "wr"]]
- 
-        self.board = [
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "br", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "wp", "--", "--"],
-            ["--", "--", "--", "--", "--", "wn", "--", "--"],
-            ["--", "--", "wp", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"]]
-
+        #'--' is an empty square, row 0 is the 8th rank
         self.move_functions = {'p' : self.get_pawn_moves, 'r' : self.get_rook_moves, 'n' : self.get_knight_moves, 'b' : self.get_bishop_moves,
                               'k' : self.get_king_moves, 'q' : self.get_queen_moves}
+        self.load_fen(fen)
 
-        self.white_to_move = True
-        self.moveLog = []
-   
-        # keeping track of king locations
-        self.white_king_location = (7, 4)
-        self.black_king_location = (0, 4)
+    '''
+    sets up the position of a FEN string and clears the move history. EPD lines work too, anything after the en passant
+    field that isn't the two move counters is ignored. Castling rights are only kept if the king and rook are still on
+    their squares. raises ValueError for anything that isn't a position (bad fields, not exactly one king per side, a pawn
+    on the first or last rank, the side not to move in check).
+    the ranks go through FEN_RANK_CACHE, so loading many positions in a row mostly skips the per-square work
+    '''
+    def load_fen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError('not a FEN string: ' + fen)
+        placement, side, castling, enpassant = fields[:4]
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError('FEN does not have 8 ranks: ' + fen)
+        if side not in ('w', 'b'):
+            raise ValueError('bad side to move ' + repr(side) + ' in FEN: ' + fen)
+        board = []
+        key = 0
+        white_material = black_material = white_piece_square = black_piece_square = 0
+        for r in range(8):
+            row, row_key, row_scores = parse_fen_rank(r, ranks[r], fen)
+            board.append(list(row))
+            key ^= row_key
+            white_material += row_scores[0]
+            black_material += row_scores[1]
+            white_piece_square += row_scores[2]
+            black_piece_square += row_scores[3]
+        if placement.count('K') != 1 or placement.count('k') != 1:
+            raise ValueError('FEN needs exactly one king per side: ' + fen)
+        if 'p' in ranks[0].lower() or 'p' in ranks[7].lower(): #the move generator never looks past the last rank for pawns
+            raise ValueError('FEN has a pawn on the first or last rank: ' + fen)
+        if castling != '-' and castling.strip('KQkq'):
+            raise ValueError('bad castling field ' + repr(castling) + ' in FEN: ' + fen)
+        rights = Castle_rights('K' in castling and board[7][4] == 'wk' and board[7][7] == 'wr',
+                               'k' in castling and board[0][4] == 'bk' and board[0][7] == 'br',
+                               'Q' in castling and board[7][4] == 'wk' and board[7][0] == 'wr',
+                               'q' in castling and board[0][4] == 'bk' and board[0][0] == 'br')
+        #the side to move could take the other king
+        king = 'bk' if side == 'w' else 'wk'
+        king_row = next(r for r in range(8) if king in board[r])
+        if self.is_square_attacked(king_row, board[king_row].index(king), side == 'w', board): #self.board is only replaced once the FEN is known to be good
+            raise ValueError('the side not to move is in check in FEN: ' + fen)
+        if enpassant == '-':
+            ep = ()
+        elif len(enpassant) == 2 and enpassant[0] in Move.files_to_cols and enpassant[1] == ('6' if side == 'w' else '3'):
+            ep = (Move.ranks_to_rows[enpassant[1]], Move.files_to_cols[enpassant[0]])
+        else:
+            raise ValueError('bad en passant square ' + repr(enpassant) + ' in FEN: ' + fen)
+        counters = fields[4:6]
+        if len(counters) == 2 and counters[0].isdigit() and counters[1].isdigit():
+            self.halfmove_clock, self.fullmove_number = int(counters[0]), max(1, int(counters[1]))
+        else:
+            self.halfmove_clock, self.fullmove_number = 0, 1
+
+        self.board = board
+        self.white_to_move = side == 'w'
+        self.current_castling_right = rights
+        self.enpassant_possible = ep
+        for r in range(8):
+            if 'wk' in board[r]:
+                self.white_king_location = (r, board[r].index('wk'))
+            if 'bk' in board[r]:
+                self.black_king_location = (r, board[r].index('bk'))
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        #identifies the position for the transposition table, kept up to date by make_move and undo_move
+        self.zobrist_key = key ^ castling_key(rights) ^ enpassant_key(board, ep)
+        #material and piece-square scores of each side in centipawns, also kept up to date by make_move and undo_move
+        self.white_material, self.black_material = white_material, black_material
+        self.white_piece_square, self.black_piece_square = white_piece_square, black_piece_square
+        self.evaluation = white_material - black_material + white_piece_square - black_piece_square #positive is good for white
+        self.clear_history()
 
+    '''
+    replaces the position with the one given and clears the move history. Keys and scores are computed from scratch
+    '''
+    def set_position(self, board, white_to_move, castle_rights, enpassant_possible, halfmove_clock=0, fullmove_number=1):
+        self.board = board
+        self.white_king_location = (7, 4) #the usual squares, for boards without kings
+        self.black_king_location = (0, 4)
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] == 'wk':
+                    self.white_king_location = (r, c)
+                elif board[r][c] == 'bk':
+                    self.black_king_location = (r, c)
+        self.white_to_move = white_to_move
+        self.current_castling_right = Castle_rights(castle_rights.wks, castle_rights.bks, castle_rights.wqs, castle_rights.bqs)
+        self.enpassant_possible = enpassant_possible
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.zobrist_key = compute_zobrist_key(self.board, self.white_to_move, self.current_castling_right, self.enpassant_possible)
+        self.white_material, self.black_material, self.white_piece_square, self.black_piece_square = evaluate_board(self.board)
+        self.evaluation = self.white_material - self.black_material + self.white_piece_square - self.black_piece_square
+        self.clear_history()
+
+    #empties the move history, so the current position is where the game starts
+    def clear_history(self):
+        self.moveLog = []
         #if the game ends in check_mate or stale_mate
         self.check_mate = False
         self.stale_mate = False
-        self.enpassant_possible = () #stores the square for which enpassant is possible
-        self.current_castling_right = Castle_rights(True, True, True, True) #start off with all castling options available
-        self.castle_rights_log = [Castle_rights(self.current_castling_right.wks, self.current_castling_right.bks,
-                                                self.current_castling_right.wqs, self.current_castling_right.bqs)] #first object
+        self.pins = {} #pinned pieces of the side to move, filled in by get_valid_moves
+        self.checks = [] #pieces giving check to the side to move, filled in by get_valid_moves
+        self.quiet_moves = True #False while get_valid_moves generates captures only
+        rights = self.current_castling_right
+        self.castle_rights_log = [Castle_rights(rights.wks, rights.bks, rights.wqs, rights.bqs)] #first object
+        self.enpassant_log = [] #enpassant_possible before each move in moveLog
+        self.zobrist_log = [] #zobrist_key before each move in moveLog
+        self.evaluation_log = [] #the four scores before each move in moveLog
+
+    '''
+    the current position as a FEN string. The halfmove clock and move number carry on from the ones loaded
+    (0 and 1 if the position didn't come from a FEN), counting the moves in moveLog
+    '''
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1].upper() if piece[0] == 'w' else piece[1]
+            ranks.append(rank + str(empty) if empty else rank)
+        rights = self.current_castling_right
+        castling = ('K' if rights.wks else '') + ('Q' if rights.wqs else '') + ('k' if rights.bks else '') + ('q' if rights.bqs else '')
+        if self.enpassant_possible:
+            enpassant = Move.cols_to_files[self.enpassant_possible[1]] + Move.rows_to_ranks[self.enpassant_possible[0]]
+        else:
+            enpassant = '-'
+        halfmove_clock = self.halfmove_clock
+        for move in self.moveLog:
+            halfmove_clock = 0 if move.piece_moved[1] == 'p' or move.piece_captured != '--' else halfmove_clock + 1
+        black_started = self.white_to_move != (len(self.moveLog) % 2 == 0)
+        fullmove_number = self.fullmove_number + (len(self.moveLog) + black_started) // 2
+        return '%s %s %s %s %d %d' % ('/'.join(ranks), 'w' if self.white_to_move else 'b', castling or '-', enpassant,
+                                      halfmove_clock, fullmove_number)
+
+    '''
+    compact pickling, used to hand positions to worker processes: only the position itself is stored
+    (the board as one string, side to move, castling rights and en passant square), not the move history
+    '''
+    def __getstate__(self):
+        rights = self.current_castling_right
+        return (''.join([''.join(row) for row in self.board]), self.white_to_move,
+                (rights.wks, rights.bks, rights.wqs, rights.bqs), self.enpassant_possible)
+
+    def __setstate__(self, state):
+        squares, white_to_move, rights, enpassant_possible = state
+        self.move_functions = {'p' : self.get_pawn_moves, 'r' : self.get_rook_moves, 'n' : self.get_knight_moves, 'b' : self.get_bishop_moves,
+                              'k' : self.get_king_moves, 'q' : self.get_queen_moves}
+        board = [[squares[i:i + 2] for i in range(r * 16, r * 16 + 16, 2)] for r in range(8)]
+        self.set_position(board, white_to_move, Castle_rights(*rights), tuple(enpassant_possible))
 
 
     #This function does not work for en passant, casting, or pawn promotion. This just executes regular moves
     def make_move(self, move):
         #move is already valid when we move it, because the user is only allowed to make valid moves. Illegal moves are not options
+        old_enpassant_key = enpassant_key(self.board, self.enpassant_possible) #needs the board before the move
         self.board[move.start_row][move.start_column] = "--"
         self.board[move.end_row][move.end_column] = move.piece_moved
         self.moveLog.append(move) #stores the move in the log for future usage
@@ -61,11 +316,12 @@ class GameState():
             self.black_king_location = (move.end_row, move.end_column)
         #pawn promotion
         if move.is_pawn_promotion:
-            self.board[move.end_row][move.end_column] = move.piece_moved[0] + 'q' #gets the color of the pawn moved and make it a queen
+            self.board[move.end_row][move.end_column] = move.piece_moved[0] + move.promotion_piece #gets the color of the pawn moved and make it the chosen piece
         #en passant
         if move.is_enpassant_move:
             self.board[move.start_row][move.end_column] = '--' #to capture the pawn behind
         #update possible enpassant moves
+        self.enpassant_log.append(self.enpassant_possible)
         if move.piece_moved[1] == 'p' and abs(move.start_row - move.end_row) == 2: #if opponent moves pawn two squares
             self.enpassant_possible = ((move.start_row + move.end_row)//2, move.start_column)
         else:
@@ -83,19 +339,57 @@ class GameState():
                 self.board[move.end_row][move.end_column-2] = '--' #remove the old rook
 
         #update castling rights if a rook or king moves
+        old_castling_key = castling_key(self.current_castling_right)
         self.update_castle_rights(move)
         self.castle_rights_log.append(Castle_rights(self.current_castling_right.wks, self.current_castling_right.bks,
                                                 self.current_castling_right.wqs, self.current_castling_right.bqs))
 
+        #update the zobrist key and the evaluation with only the squares and state that changed
+        start = move.start_row * 8 + move.start_column
+        end = move.end_row * 8 + move.end_column
+        placed = self.board[move.end_row][move.end_column] #the moved piece, or what it promoted to
+        self.zobrist_log.append(self.zobrist_key)
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE ^ old_castling_key ^ castling_key(self.current_castling_right)
+        key ^= ZOBRIST_PIECES[move.piece_moved][start] ^ ZOBRIST_PIECES[placed][end]
+        self.evaluation_log.append((self.white_material, self.black_material, self.white_piece_square, self.black_piece_square))
+        material = PIECE_VALUES[placed] - PIECE_VALUES[move.piece_moved] #only changes on promotion
+        piece_square = PIECE_SQUARE_TABLES[placed][end] - PIECE_SQUARE_TABLES[move.piece_moved][start]
+        captured_material = captured_piece_square = 0
+        if move.piece_captured != '--':
+            captured_sq = move.start_row * 8 + move.end_column if move.is_enpassant_move else end
+            key ^= ZOBRIST_PIECES[move.piece_captured][captured_sq]
+            captured_material = PIECE_VALUES[move.piece_captured]
+            captured_piece_square = PIECE_SQUARE_TABLES[move.piece_captured][captured_sq]
+        if move.is_castle_move:
+            rook = move.piece_moved[0] + 'r'
+            rook_start, rook_end = (move.end_column+1, move.end_column-1) if move.end_column - move.start_column == 2 else (move.end_column-2, move.end_column+1)
+            rook_start += move.end_row * 8
+            rook_end += move.end_row * 8
+            key ^= ZOBRIST_PIECES[rook][rook_start] ^ ZOBRIST_PIECES[rook][rook_end]
+            piece_square += PIECE_SQUARE_TABLES[rook][rook_end] - PIECE_SQUARE_TABLES[rook][rook_start]
+        self.zobrist_key = key ^ old_enpassant_key ^ enpassant_key(self.board, self.enpassant_possible)
+        if move.piece_moved[0] == 'w':
+            self.white_material += material
+            self.white_piece_square += piece_square
+            self.black_material -= captured_material
+            self.black_piece_square -= captured_piece_square
+        else:
+            self.black_material += material
+            self.black_piece_square += piece_square
+            self.white_material -= captured_material
+            self.white_piece_square -= captured_piece_square
+        self.evaluation = self.white_material - self.black_material + self.white_piece_square - self.black_piece_square
+
 
     #undoes the move
     def undo_move(self):
-        if len(self.moveLog) != 0:
-            move = self.moveLog.pop()
-            self.board[move.start_row][move.start_column] = move.piece_moved
-            self.board[move.end_row][move.end_column] = move.piece_captured
-            self.white_to_move = not self.white_to_move
-            #update king location
+        if len(self.moveLog) == 0: #nothing to undo
+            return
+        move = self.moveLog.pop()
+        self.board[move.start_row][move.start_column] = move.piece_moved
+        self.board[move.end_row][move.end_column] = move.piece_captured
+        self.white_to_move = not self.white_to_move
+        #update king location
         if move.piece_moved == 'wk':
             self.white_king_location = (move.start_row, move.start_column)
         elif move.piece_moved == 'bk':
@@ -106,11 +400,11 @@ class GameState():
         if move.is_enpassant_move:
             self.board[move.end_row][move.end_column] = '--' #empties the square of the first move
             self.board[move.start_row][move.end_column] = move.piece_captured
-            self.enpassant_possible = (move.end_row, move.end_column) #ensures that enpassant is still possible after undoing the move
-        
-        #undo pawn 2 square move
-        if move.piece_moved[1] == 'p' and abs(move.start_row - move.end_row) == 2:
-            self.enpassant_possible = ()
+        #whatever en passant square there was before the move is possible again
+        self.enpassant_possible = self.enpassant_log.pop()
+        self.zobrist_key = self.zobrist_log.pop()
+        self.white_material, self.black_material, self.white_piece_square, self.black_piece_square = self.evaluation_log.pop()
+        self.evaluation = self.white_material - self.black_material + self.white_piece_square - self.black_piece_square
         #undoing castling rights
         self.castle_rights_log.pop() #remove new castle rights
         new_rights = self.castle_rights_log[-1]
@@ -130,6 +424,31 @@ class GameState():
         self.stale_mate = False
             
 
+    '''
+    passes the turn without moving, for the null move pruning of the search: only the side to move, the en passant
+    square and the key change. undo_null_move has to undo it before any earlier move is undone
+    '''
+    def make_null_move(self):
+        self.enpassant_log.append(self.enpassant_possible)
+        self.zobrist_log.append(self.zobrist_key)
+        self.zobrist_key ^= ZOBRIST_BLACK_TO_MOVE ^ enpassant_key(self.board, self.enpassant_possible)
+        self.enpassant_possible = ()
+        self.white_to_move = not self.white_to_move
+
+    def undo_null_move(self):
+        self.white_to_move = not self.white_to_move
+        self.enpassant_possible = self.enpassant_log.pop()
+        self.zobrist_key = self.zobrist_log.pop()
+
+    #whether white (or black) has anything besides king and pawns, positions without it are where zugzwang is common
+    def has_non_pawn_material(self, white):
+        pieces = ('wn', 'wb', 'wr', 'wq') if white else ('bn', 'bb', 'br', 'bq')
+        for row in self.board:
+            for piece in pieces:
+                if piece in row:
+                    return True
+        return False
+
     '''
     update the castle rights
     '''
@@ -152,39 +471,72 @@ class GameState():
                     self.current_castling_right.bqs = False
                 elif move.start_column == 7: #meaning this is right rook
                     self.current_castling_right.bks = False
+        #a rook captured on its starting square can't castle anymore either
+        if move.piece_captured == 'wr' and move.end_row == 7:
+            if move.end_column == 0:
+                self.current_castling_right.wqs = False
+            elif move.end_column == 7:
+                self.current_castling_right.wks = False
+        elif move.piece_captured == 'br' and move.end_row == 0:
+            if move.end_column == 0:
+                self.current_castling_right.bqs = False
+            elif move.end_column == 7:
+                self.current_castling_right.bks = False
 
 
     #all moves considering checks (if a piece is pinned, then it cannot be moved)
-    def get_valid_moves(self):
+    '''
+    every legal move of the side to move. With captures_only, only the legal captures and promotions (for the quiescence
+    search): quiet moves are never generated, and an empty list doesn't mean checkmate or stalemate
+    '''
+    def get_valid_moves(self, captures_only=False):
+        self.quiet_moves = not captures_only #read by the move generators
         #creating a copy of the enpassant move so that the value of enpassant_possible can be modified
         temp_enpassant = self.enpassant_possible
         #creating a copy of castle_rights
         temp_castle_rights = Castle_rights(self.current_castling_right.wks, self.current_castling_right.bks,
                                            self.current_castling_right.wqs, self.current_castling_right.bqs)
-        # first generate all possible moves
-        moves = self.get_all_possible_moves()
         if self.white_to_move:
-            self.get_castle_moves(self.white_king_location[0], self.white_king_location[1], moves)
+            king_row, king_col = self.white_king_location
         else:
-            self.get_castle_moves(self.black_king_location[0], self.black_king_location[1], moves)
+            king_row, king_col = self.black_king_location
+        #scan outward from the king once to find every pin and every check, instead of making and undoing every move
+        in_check, self.pins, self.checks = self.check_for_pins_and_checks(king_row, king_col)
+
+        if in_check:
+            if len(self.checks) == 1: #only one check: block it, capture the checking piece or move the king
+                moves = self.get_all_possible_moves()
+                check_row, check_col, d_row, d_col = self.checks[0]
+                valid_squares = set() #squares that non-king pieces can move to
+                if self.board[check_row][check_col][1] == 'n': #a knight check can't be blocked
+                    valid_squares.add((check_row, check_col))
+                else:
+                    for i in range(1, 8):
+                        valid_squares.add((king_row + d_row * i, king_col + d_col * i))
+                        if king_row + d_row * i == check_row and king_col + d_col * i == check_col: #stop once the checking piece is reached
+                            break
+                for i in range(len(moves)-1, -1, -1): #iterating through the list of moves backwards
+                    move = moves[i]
+                    #king moves and en passant captures are already fully checked when they are generated
+                    if move.piece_moved[1] != 'k' and not move.is_enpassant_move and (move.end_row, move.end_column) not in valid_squares:
+                        del moves[i]
+            else: #double check, the king has to move
+                moves = []
+                self.get_king_moves(king_row, king_col, moves)
+        else:
+            moves = self.get_all_possible_moves()
+            if not captures_only:
+                self.get_castle_moves(king_row, king_col, moves)
 
-        # next, make the move
-        for i in range(len(moves)-1, -1, -1): #iterating through the list of moves backwards
-            self.make_move(moves[i])
-            
-            # after move made, generate opponent moves and check for attacks on the king
-            self.white_to_move = not self.white_to_move #switch the turn back to white
-            if self.in_check():
-                moves.remove(moves[i]) # if found, then the move is not valid
-            self.white_to_move = not self.white_to_move    
-            self.undo_move() #to cancel out the make_move operation
-        
-        if len(moves) == 0: #if there is no valid moves, then the game has ended
-            if self.in_check(): #if the king is currently in check, then it is checkmate
+        if len(moves) == 0 and not captures_only: #if there is no valid moves, then the game has ended
+            if in_check: #if the king is currently in check, then it is checkmate
                 self.check_mate = True
             else: #if not, it is stalemate
                 self.stale_mate = True
 
+        self.pins = {}
+        self.checks = []
+        self.quiet_moves = True
         self.enpassant_possible = temp_enpassant
         self.current_castling_right = temp_castle_rights
         return moves
@@ -192,21 +544,152 @@ class GameState():
 
     def in_check(self):
         if self.white_to_move:
-            return self.square_under_attack(self.white_king_location[0], self.white_king_location[1])
+            return self.is_square_attacked(self.white_king_location[0], self.white_king_location[1], False)
         else:
-            return self.square_under_attack(self.black_king_location[0], self.black_king_location[1])
+            return self.is_square_attacked(self.black_king_location[0], self.black_king_location[1], True)
 
+    #is the square attacked by the opponent of the side to move
     def square_under_attack(self, r, c):
-        self.white_to_move = not self.white_to_move #switch turns
-        opp_moves = self.get_all_possible_moves()
-        self.white_to_move = not self.white_to_move #switch back turn order
-        for move in opp_moves:
-            if move.end_row == r and move.end_column == c: #check whether square is under attack
-                #if one of them is under attack
+        return self.is_square_attacked(r, c, not self.white_to_move)
+
+    '''
+    answers whether square (r, c) is attacked by white (by_white=True) or black pieces, on board if given and on the
+    position of the game state otherwise.
+    works outward from the target square: pawn, knight and king squares come from the jump tables,
+    and each ray stops at the first piece it hits. No moves are generated
+    '''
+    def is_square_attacked(self, r, c, by_white, board=None):
+        if board is None:
+            board = self.board
+        color = 'w' if by_white else 'b'
+        #a white pawn attacks upwards, so it has to stand one row below the square
+        pawn = color + 'p'
+        pawn_row = r + 1 if by_white else r - 1
+        if 0 <= pawn_row < 8:
+            if c > 0 and board[pawn_row][c-1] == pawn:
+                return True
+            if c < 7 and board[pawn_row][c+1] == pawn:
+                return True
+        knight = color + 'n'
+        for end_row, end_col in KNIGHT_TARGETS[r][c]:
+            if board[end_row][end_col] == knight:
                 return True
-        #if none
+        king = color + 'k'
+        for end_row, end_col in KING_TARGETS[r][c]:
+            if board[end_row][end_col] == king:
+                return True
+        queen = color + 'q'
+        for slider, rays in ((color + 'r', ROOK_RAYS[r][c]), (color + 'b', BISHOP_RAYS[r][c])):
+            for ray in rays:
+                for end_row, end_col in ray:
+                    piece = board[end_row][end_col]
+                    if piece != '--':
+                        if piece == slider or piece == queen:
+                            return True
+                        break #the first piece on the ray blocks everything behind it
         return False
-        
+
+    '''
+    returns a 64 bit bitmap (bit row*8 + col) of every square attacked by white (by_white=True) or black pieces.
+    one call answers any number of attack questions about the position, e.g. for evaluation terms
+    '''
+    def get_attack_map(self, by_white):
+        board = self.board
+        color = 'w' if by_white else 'b'
+        pawn_attack_bits = WHITE_PAWN_ATTACK_BITS if by_white else BLACK_PAWN_ATTACK_BITS
+        attacks = 0
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                piece = row[c]
+                if piece[0] != color:
+                    continue
+                kind = piece[1]
+                if kind == 'p':
+                    attacks |= pawn_attack_bits[r][c]
+                elif kind == 'n':
+                    attacks |= KNIGHT_ATTACK_BITS[r][c]
+                elif kind == 'k':
+                    attacks |= KING_ATTACK_BITS[r][c]
+                else:
+                    rays = ROOK_RAYS[r][c] if kind == 'r' else BISHOP_RAYS[r][c] if kind == 'b' else ROOK_RAYS[r][c] + BISHOP_RAYS[r][c]
+                    for ray in rays:
+                        for end_row, end_col in ray:
+                            attacks |= 1 << (end_row * 8 + end_col)
+                            if board[end_row][end_col] != '--':
+                                break
+        return attacks
+
+    '''
+    scan outward from the king of the side to move, standing on square (r, c).
+    returns whether the king is in check, a dict of pinned ally pieces -> pin direction, and a list of checks.
+    '''
+    def check_for_pins_and_checks(self, r, c):
+        pins = {} #(row, col) of a pinned ally piece -> direction from the king to that piece
+        checks = [] #(row, col, d_row, d_col) of every enemy piece giving check
+        in_check = False
+        if self.white_to_move:
+            enemy_color, ally_color = 'b', 'w'
+        else:
+            enemy_color, ally_color = 'w', 'b'
+        #the first four directions are orthogonal, the last four are diagonal
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(8):
+            d_row, d_col = directions[j]
+            possible_pin = None
+            for i in range(1, 8):
+                end_row = r + d_row * i
+                end_col = c + d_col * i
+                if not (0 <= end_row < 8 and 0 <= end_col < 8): #off the board
+                    break
+                end_piece = self.board[end_row][end_col]
+                if end_piece == '--':
+                    continue
+                if end_piece[0] == ally_color:
+                    if possible_pin is None: #first ally piece in this direction could be pinned
+                        possible_pin = (end_row, end_col)
+                    else: #second ally piece, so no pin or check from this direction
+                        break
+                else:
+                    piece_type = end_piece[1]
+                    #rooks attack orthogonally, bishops diagonally, queens both ways, kings one step in any direction,
+                    #and pawns one step diagonally towards the side they move to
+                    if (j <= 3 and piece_type == 'r') or (j >= 4 and piece_type == 'b') or piece_type == 'q' or \
+                            (i == 1 and piece_type == 'k') or \
+                            (i == 1 and piece_type == 'p' and ((enemy_color == 'w' and j >= 6) or (enemy_color == 'b' and 4 <= j <= 5))):
+                        if possible_pin is None: #no piece in between, so it is a check
+                            in_check = True
+                            checks.append((end_row, end_col, d_row, d_col))
+                        else: #an ally piece in between, so it is pinned
+                            pins[possible_pin] = (d_row, d_col)
+                    break #an enemy piece blocks everything behind it
+        #knight checks
+        enemy_knight = enemy_color + 'n'
+        for end_row, end_col in KNIGHT_TARGETS[r][c]:
+            if self.board[end_row][end_col] == enemy_knight:
+                in_check = True
+                checks.append((end_row, end_col, end_row - r, end_col - c))
+        return in_check, pins, checks
+
+    '''
+    checks whether a piece may move in direction (d_row, d_col). A pinned piece can only move along the line of its pin
+    '''
+    def pin_allows(self, r, c, d_row, d_col):
+        pin_direction = self.pins.get((r, c))
+        return pin_direction is None or pin_direction == (d_row, d_col) or pin_direction == (-d_row, -d_col)
+
+    '''
+    an en passant capture removes two pawns from the same row at once, which can expose the king in ways
+    that a pin scan doesn't see, so they are checked by actually making the move. They are rare enough that this is cheap
+    '''
+    def enpassant_is_legal(self, move):
+        self.make_move(move)
+        self.white_to_move = not self.white_to_move #switch the turn back to the side that made the capture
+        legal = not self.in_check()
+        self.white_to_move = not self.white_to_move
+        self.undo_move()
+        return legal
+
    #get all possible moves
     def get_all_possible_moves(self):
         moves = []
@@ -222,320 +705,101 @@ class GameState():
    
     #get all possible pawn moves at that location and add to list
     def get_pawn_moves(self, r, c, moves):
-        #FOR WHITE
         if self.white_to_move:
-            if self.board[r-1][c] == "--": #if the square in front of it is empty
-                moves.append(Move((r, c), (r-1, c), self.board))
-                if r == 6 and self.board[r-2][c] == "--": #if the second square in front it is ALSO empty
-                    moves.append(Move((r, c), (r-2, c), self.board))    
-            #Pawn capture options to the left and right
-            #ensure the piece does not capture off the board
-            if c-1 >= 0:
-                if self.board[r-1][c-1][0] == 'b': #if there is a black piece that can be captured
-                    moves.append(Move((r, c), (r-1, c-1), self.board))
-                elif (r-1, c-1) == self.enpassant_possible: #if the square that the pawn is going to is a possible enpassant move
-                    moves.append(Move((r, c), (r-1, c-1), self.board, is_enpassant_move=True))
-            if c+1 <= 7:
-                if self.board[r-1][c+1][0] == 'b':
-                    moves.append(Move((r, c), (r-1, c+1), self.board))
-                elif (r-1, c+1) == self.enpassant_possible: #if the square that the pawn is going to is a possible enpassant move
-                    moves.append(Move((r, c), (r-1, c+1), self.board, is_enpassant_move=True))
-    #FOR BLACK
-        elif not self.white_to_move:
-
-            if self.board[r+1][c] == "--": #if the square in front of it is empty
-                moves.append(Move((r, c), (r+1, c), self.board))
-                if r == 1 and self.board[r+2][c] == "--": #if the second square in front it is ALSO empty
-                    moves.append(Move((r, c), (r+2, c), self.board))
+            move_amount, start_row, enemy_color = -1, 6, 'b'
+        else:
+            move_amount, start_row, enemy_color = 1, 1, 'w'
+        if self.board[r+move_amount][c] == "--" and self.pin_allows(r, c, move_amount, 0): #if the square in front of it is empty
+            if self.quiet_moves or r+move_amount == 0 or r+move_amount == 7: #a push to the last row promotes, so it isn't quiet
+                self.add_pawn_move((r, c), (r+move_amount, c), moves)
+            if self.quiet_moves and r == start_row and self.board[r+2*move_amount][c] == "--": #if the second square in front it is ALSO empty
+                moves.append(Move((r, c), (r+2*move_amount, c), self.board))
         #Pawn capture options to the left and right
         #ensure the piece does not capture off the board
-            if c-1 >= 0:
-                if self.board[r+1][c-1][0] == 'w': #if there is a white piece that can be captured
-                    moves.append(Move((r, c), (r+1, c-1), self.board))
-                elif (r+1, c-1) == self.enpassant_possible: #if the square that the pawn is going to is a possible enpassant move
-                    moves.append(Move((r, c), (r+1, c-1), self.board, is_enpassant_move=True))  
-            if c+1 <= 7:
-                if self.board[r+1][c+1][0] == 'w':
-                    moves.append(Move((r, c), (r+1, c+1), self.board))
-                elif (r+1, c+1) == self.enpassant_possible: #if the square that the pawn is going to is a possible enpassant move
-                    moves.append(Move((r, c), (r+1, c+1), self.board, is_enpassant_move=True))  
-
-    def get_rook_moves(self, r, c, moves):
-        #FOR WHITE
-        if self.white_to_move:
-            #possible horizontal moves - to the right
-            for d in range(7-c):
-                if self.board[r][c+1+d] == "--":
-                    moves.append(Move((r, c), (r, c+1+d), self.board))
-                elif self.board[r][c+1+d][0] == 'b': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r, c+1+d), self.board))
-                    break
-                else: #can only be white piece if code reaches here
-                    break       
-            #possible horizontal moves - to the left
-            for d in range(c):
-                if self.board[r][c-1-d] == "--":
-                    moves.append(Move((r, c), (r, c-1-d), self.board))              
-                elif self.board[r][c-1-d][0] == 'b': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r, c-1-d), self.board))
-                    break
-                else:
-                    break         
-            #possible vertical moves - to the top
-            for d in range(r):
-                if self.board[r-1-d][c] == "--":
-                    moves.append(Move((r, c), (r-1-d, c), self.board))   
-                elif self.board[r-1-d][c][0] == 'b': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r-1-d, c), self.board))
-                    break
-                else:
-                    break
-            #possible vertical moves - to the bottom
-            for d in range(7-r):
-                if self.board[r+1+d][c] == "--":
-                    moves.append(Move((r, c), (r+1+d, c), self.board))
-                elif self.board[r+1+d][c][0] == 'b': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r+1+d, c), self.board))
-                    break
-                else: #can only be white piece if code reaches here
-                    break
-        #FOR BLACK
+        for d_col in (-1, 1):
+            if 0 <= c+d_col <= 7 and self.pin_allows(r, c, move_amount, d_col):
+                if self.board[r+move_amount][c+d_col][0] == enemy_color: #if there is an enemy piece that can be captured
+                    self.add_pawn_move((r, c), (r+move_amount, c+d_col), moves)
+                elif (r+move_amount, c+d_col) == self.enpassant_possible: #if the square that the pawn is going to is a possible enpassant move
+                    move = Move((r, c), (r+move_amount, c+d_col), self.board, is_enpassant_move=True)
+                    if self.enpassant_is_legal(move):
+                        moves.append(move)
+
+    #a pawn reaching the last row can promote to any of the four pieces, so it gets one move for each
+    def add_pawn_move(self, start_sq, end_sq, moves):
+        if end_sq[0] == 0 or end_sq[0] == 7:
+            for piece in ('q', 'r', 'b', 'n'):
+                moves.append(Move(start_sq, end_sq, self.board, promotion_piece=piece))
         else:
-            #possible horizontal moves - to the right
-            for d in range(7-c):
-                if self.board[r][c+1+d] == "--":
-                    moves.append(Move((r, c), (r, c+1+d), self.board))
-                elif self.board[r][c+1+d][0] == 'w': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r, c+1+d), self.board))
-                    break
-                else: #can only be white piece if code reaches here
-                    break
-            
-            #possible horizontal moves - to the left
-            for d in range(c):
-                if self.board[r][c-1-d] == "--":
-                    moves.append(Move((r, c), (r, c-1-d), self.board))              
-                elif self.board[r][c-1-d][0] == 'w': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r, c-1-d), self.board))
-                    break
-                else:
+            moves.append(Move(start_sq, end_sq, self.board))
+
+    '''
+    sliding moves for rooks, bishops and queens along the given directions
+    '''
+    def get_sliding_moves(self, r, c, moves, directions):
+        enemy_color = 'b' if self.white_to_move else 'w'
+        quiet_moves = self.quiet_moves
+        for d_row, d_col in directions:
+            if not self.pin_allows(r, c, d_row, d_col):
+                continue
+            for i in range(1, 8):
+                end_row = r + d_row * i
+                end_col = c + d_col * i
+                if not (0 <= end_row < 8 and 0 <= end_col < 8):
                     break
-            
-            #possible vertical moves - to the top
-            for d in range(r):
-                if self.board[r-1-d][c] == "--":
-                    moves.append(Move((r, c), (r-1-d, c), self.board))   
-                elif self.board[r-1-d][c][0] == 'w': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r-1-d, c), self.board))
+                end_piece = self.board[end_row][end_col]
+                if end_piece == "--":
+                    if quiet_moves:
+                        moves.append(Move((r, c), (end_row, end_col), self.board))
+                elif end_piece[0] == enemy_color: #if the square contains an opponent's piece
+                    moves.append(Move((r, c), (end_row, end_col), self.board))
                     break
-                else:
+                else: #can only be an ally piece if code reaches here
                     break
 
-            #possible vertical moves - to the bottom
-            for d in range(7-r):
-                if self.board[r+1+d][c] == "--":
-                    moves.append(Move((r, c), (r+1+d, c), self.board))
-                elif self.board[r+1+d][c][0] == 'w': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r+1+d, c), self.board))
-                    break
-                else: #can only be white piece if code reaches here
-                    break
+    def get_rook_moves(self, r, c, moves):
+        self.get_sliding_moves(r, c, moves, ((-1, 0), (0, -1), (1, 0), (0, 1)))
 
     def get_knight_moves(self, r, c, moves):
-        # #FOR WHITE
-        # if self.white_to_move:
-        #     if r-1 >= 0 and c-2 >= 0:
-        #         if self.board[r-1][c-2] == "--" or self.board[r-1][c-2][0] == "b":
-        #             moves.append(Move((r, c), (r-1, c-2), self.board))
-        #     if r-2 >= 0 and  c-1 >= 0:
-        #         if self.board[r-2][c-1] == "--" or self.board[r-2][c-1][0] == "b":
-        #             moves.append(Move((r, c), (r-2, c-1), self.board))
-        #     if r-2 >= 0 and c+1 <= 7:
-        #         if self.board[r-2][c+1] == "--" or self.board[r-2][c+1][0] == "b":
-        #             moves.append(Move((r, c), (r-2, c+1), self.board))
-        #     if r-1 >= 0 and c+2 <= 7:
-        #         if self.board[r-1][c+2] == "--" or self.board[r-1][c+2][0] == "b":
-        #             moves.append(Move((r, c), (r-1, c+2), self.board))
-        #     if r+1 <= 7 and c+2 <= 7:
-        #         if self.board[r+1][c+2] == "--" or self.board[r+1][c+2][0] == "b":
-        #             moves.append(Move((r, c), (r+1, c+2), self.board))
-        #     if r+2 <= 7 and c+1 <= 7:
-        #         if self.board[r+2][c+1] == "--" or self.board[r+2][c+1][0] == "b":
-        #             moves.append(Move((r, c), (r+2, c+1), self.board))
-        # #FOR BLACK
-        # if not self.white_to_move:
-        #     if r-1 >= 0 and c-2 >= 0:
-        #         if self.board[r-1][c-2] == "--" or self.board[r-1][c-2][0] == "w":
-        #             moves.append(Move((r, c), (r-1, c-2), self.board))
-        #     if r-2 >= 0 and  c-1 >= 0:
-        #         if self.board[r-2][c-1] == "--" or self.board[r-2][c-1][0] == "w":
-        #             moves.append(Move((r, c), (r-2, c-1), self.board))
-        #     if r-2 >= 0 and c+1 <= 7:
-        #         if self.board[r-2][c+1] == "--" or self.board[r-2][c+1][0] == "w":
-        #             moves.append(Move((r, c), (r-2, c+1), self.board))
-        #     if r-1 >= 0 and c+2 <= 7:
-        #         if self.board[r-1][c+2] == "--" or self.board[r-1][c+2][0] == "w":
-        #             moves.append(Move((r, c), (r-1, c+2), self.board))
-        #     if r+1 <= 7 and c+2 <= 7:
-        #         if self.board[r+1][c+2] == "--" or self.board[r+1][c+2][0] == "w":
-        #             moves.append(Move((r, c), (r+1, c+2), self.board))
-        #     if r+2 <= 7 and c+1 <= 7:
-        #         if self.board[r+2][c+1] == "--" or self.board[r+2][c+1][0] == "w":
-        #             moves.append(Move((r, c), (r+2, c+1), self.board))
-
-
-
-        knight_moves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        if (r, c) in self.pins: #a pinned knight can never move
+            return
         ally_color = 'w' if self.white_to_move else 'b'
-        for m in knight_moves:
-            end_row = r + m[0]
-            end_column = c + m[1]
-            if 0 <= end_row < 8 and 0 <= end_column < 8:
-                end_piece = self.board[end_row][end_column]
-                if end_piece[0] != ally_color:
-                    moves.append(Move((r, c), (end_row, end_column), self.board))
-
+        for end_row, end_column in KNIGHT_TARGETS[r][c]:
+            end_piece = self.board[end_row][end_column]
+            if end_piece[0] != ally_color and (self.quiet_moves or end_piece != '--'):
+                moves.append(Move((r, c), (end_row, end_column), self.board))
 
     def get_bishop_moves(self, r, c, moves):
-        #FOR WHITE
-        if self.white_to_move:
-            #top-right diagonal
-            for d in range(7-c):
-                if r-1-d < 0:
-                    break
-                if c+1+d > 7:
-                    break
-                if self.board[r-1-d][c+1+d] == "--":
-                    moves.append(Move((r, c), (r-1-d, c+1+d), self.board))
-                elif self.board[r-1-d][c+1+d][0] == 'b': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r-1-d, c+1+d), self.board))
-                    break
-                else: #can only be white piece if code reaches here
-                    break
-            #top-left diagonal
-            for d in range(c):
-                if r-1-d < 0:
-                    break
-                if c-1-d < 0:
-                    break
-                if self.board[r-1-d][c-1-d] == "--":
-                    moves.append(Move((r, c), (r-1-d, c-1-d), self.board))              
-                elif self.board[r-1-d][c-1-d][0] == 'b': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r-1-d, c-1-d), self.board))
-                    break
-                else:
-                    break      
-            #bottom-right diagonal
-            for d in range(7-r):
-                if r+1+d > 7:
-                    break
-                if c+1+d > 7:
-                    break
-                if self.board[r+1+d][c+1+d] == "--":
-                    moves.append(Move((r, c), (r+1+d, c+1+d), self.board))   
-                elif self.board[r+1+d][c+1+d][0] == 'b': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r+1+d, c+1+d), self.board))
-                    break
-                else:
-                    break
-            #bottom-left diagonal
-            for d in range(7-r):
-                if r+1+d > 7:
-                    break
-                if c-1-d < 0:
-                    break
-                if self.board[r+1+d][c-1-d] == "--":
-                    moves.append(Move((r, c), (r+1+d, c-1-d), self.board))
-                elif self.board[r+1+d][c-1-d][0] == 'b': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r+1+d, c-1-d), self.board))
-                    break
-                else: #can only be white piece if code reaches here
-                    break         
-        #FOR BLACK
-        if not self.white_to_move:
-            #top-right diagonal
-            for d in range(7-c):
-                if r-1-d < 0:
-                    break
-                if c+1+d > 7:
-                    break
-                if self.board[r-1-d][c+1+d] == "--":
-                    moves.append(Move((r, c), (r-1-d, c+1+d), self.board))
-                elif self.board[r-1-d][c+1+d][0] == 'w': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r-1-d, c+1+d), self.board))
-                    break
-                else: #can only be white piece if code reaches here
-                    break      
-            #top-left diagonal
-            for d in range(c):
-                if r-1-d < 0:
-                    break
-                if c-1-d < 0:
-                    break
-                if self.board[r-1-d][c-1-d] == "--":
-                    moves.append(Move((r, c), (r-1-d, c-1-d), self.board))              
-                elif self.board[r-1-d][c-1-d][0] == 'w': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r-1-d, c-1-d), self.board))
-                    break
-                else:
-                    break 
-            #bottom-right diagonal
-            for d in range(7-r):
-                if r+1+d > 7:
-                    break
-                if c+1+d > 7:
-                    break
-                if self.board[r+1+d][c+1+d] == "--":
-                    moves.append(Move((r, c), (r+1+d, c+1+d), self.board))   
-                elif self.board[r+1+d][c+1+d][0] == 'w': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r+1+d, c+1+d), self.board))
-                    break
-                else:
-                    break
-            #bottom-left diagonal
-            for d in range(7-r):
-                if r+1+d > 7:
-                    break
-                if c-1-d < 0:
-                    break
-                if self.board[r+1+d][c-1-d] == "--":
-                    moves.append(Move((r, c), (r+1+d, c-1-d), self.board))
-                elif self.board[r+1+d][c-1-d][0] == 'w': #if the square contains an opponent's piece
-                    moves.append(Move((r, c), (r+1+d, c-1-d), self.board))
-                    break
-                else: #can only be white piece if code reaches here
-                    break
+        self.get_sliding_moves(r, c, moves, ((-1, -1), (-1, 1), (1, -1), (1, 1)))
 
     def get_king_moves(self, r, c, moves):
 
-        king_moves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
         ally_color = "w" if self.white_to_move else "b"
-        for i in range(8):
-            end_row = r + king_moves[i][0]
-            end_col = c + king_moves[i][1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:
-                    moves.append(Move((r, c), (end_row, end_col), self.board))
-    
-        #self.get_castle_moves(r, c, moves, ally_color)
+        king = self.board[r][c]
+        self.board[r][c] = "--" #lift the king so that sliding pieces also attack the squares behind it
+        #only keep the squares where the king would not be in check
+        safe_squares = [(end_row, end_col) for end_row, end_col in KING_TARGETS[r][c]
+                        if self.board[end_row][end_col][0] != ally_color and (self.quiet_moves or self.board[end_row][end_col] != '--') and not self.is_square_attacked(end_row, end_col, not self.white_to_move)]
+        self.board[r][c] = king
+        for end_sq in safe_squares:
+            moves.append(Move((r, c), end_sq, self.board))
 
     '''
     using some helper functions to simplify castling mechanics
+    get_valid_moves only calls this when the king is not in check
     '''
     def get_castle_moves(self, r, c, moves):
-        if self.square_under_attack(r, c): #used in_check() function before, but gives infinite recursion, so switched to square_under_attack() function
-            return #if king is in check
         if (self.white_to_move and self.current_castling_right.wks) or (not self.white_to_move and self.current_castling_right.bks):
             self.get_ks_castle_moves(r, c, moves)
         if (self.white_to_move and self.current_castling_right.wqs) or (not self.white_to_move and self.current_castling_right.bqs):
             self.get_qs_castle_moves(r, c, moves)
     def get_ks_castle_moves(self, r, c, moves): #king side castle moves
-        if self.board[r][c+1] == '--' and self.board[r][c+2] == '--':
+        #the rook has to still be there, it may have been captured without ever moving
+        if self.board[r][c+1] == '--' and self.board[r][c+2] == '--' and self.board[r][c+3] == self.board[r][c][0] + 'r':
             if not self.square_under_attack(r, c+1) and not self.square_under_attack(r, c+2):
                 moves.append(Move((r, c), (r, c+2), self.board, is_castle_move=True))
     def get_qs_castle_moves(self, r, c, moves): #queen side castle moves
-        if self.board[r][c-1] == '--' and self.board[r][c-2] == '--' and self.board[r][c-3]:
+        if self.board[r][c-1] == '--' and self.board[r][c-2] == '--' and self.board[r][c-3] == '--' and self.board[r][c-4] == self.board[r][c][0] + 'r':
             if not self.square_under_attack(r, c-1) and not self.square_under_attack(r, c-2):
                 moves.append(Move((r, c), (r, c-2), self.board, is_castle_move=True))
 
@@ -553,7 +817,17 @@ class Castle_rights():
         self.bqs = bqs
 
 
+'''
+a move is created for every pseudo-legal move during a search, so it uses __slots__ instead of a __dict__.
+move_id packs the move into one 16 bit integer: bits 0-5 are the start square, bits 6-11 the end square
+(square = row*8 + col) and bits 12-14 the promotion piece. En passant and castling don't need bits of their own,
+since they follow from the squares and the position, so a list of moves can be kept as an array('H') of ids
+and turned back into Move objects with from_id
+'''
 class Move():
+    __slots__ = ('start_row', 'start_column', 'end_row', 'end_column', 'piece_moved', 'piece_captured',
+                 'is_pawn_promotion', 'promotion_piece', 'is_enpassant_move', 'is_castle_move', 'move_id')
+
     #map keys to values
     #key : value
     ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4,
@@ -563,26 +837,54 @@ class Move():
     files_to_cols = {"a": 0, "b": 1, "c": 2, "d": 3,
                      "e": 4, "f": 5, "g": 6, "h": 7,}
     cols_to_files = {v: k for k, v in files_to_cols.items()}
-
-    def __init__(self, start_sq, end_sq, board, is_enpassant_move=False, is_castle_move=False):
-        self.start_row = start_sq[0]
-        self.start_column = start_sq[1]
-        self.end_row = end_sq[0]
-        self.end_column = end_sq[1]
-        self.piece_moved = board[self.start_row][self.start_column]
-        self.piece_captured = board[self.end_row][self.end_column]
+    promotion_codes = {'n': 1, 'b': 2, 'r': 3, 'q': 4}
+    promotion_pieces = {v: k for k, v in promotion_codes.items()}
+
+    #board can be None if piece_moved and piece_captured are given directly (e.g. by the bitboard backend)
+    def __init__(self, start_sq, end_sq, board, is_enpassant_move=False, is_castle_move=False, piece_moved=None, piece_captured=None,
+                 promotion_piece='q'):
+        start_row, start_column = start_sq
+        end_row, end_column = end_sq
+        self.start_row = start_row
+        self.start_column = start_column
+        self.end_row = end_row
+        self.end_column = end_column
+        if board is not None:
+            piece_moved = board[start_row][start_column]
+            piece_captured = board[end_row][end_column]
+        self.piece_moved = piece_moved
+        self.piece_captured = piece_captured
+        self.move_id = start_row * 8 + start_column + ((end_row * 8 + end_column) << 6)
         #pawn promotion
-        self.is_pawn_promotion = False #flags whether there is a pawn promotion move
-        if (self.piece_moved == 'wp' and self.end_row == 0) or (self.piece_moved == 'bp' and self.end_row == 7):
-            self.is_pawn_promotion = True #record a pawn promotion move once it reaches the edge of the board
+        #record a pawn promotion move once it reaches the edge of the board, and which piece it becomes
+        #(a pawn can never stand on its own back row, so any pawn reaching row 0 or 7 is promoting)
+        self.is_pawn_promotion = (end_row == 0 or end_row == 7) and piece_moved[1] == 'p'
+        if self.is_pawn_promotion:
+            self.promotion_piece = promotion_piece
+            self.move_id |= self.promotion_codes[promotion_piece] << 12
+        else:
+            self.promotion_piece = None
         #en passant
         self.is_enpassant_move = is_enpassant_move
-        if self.is_enpassant_move:
-            self.piece_captured = 'wp' if self.piece_moved == 'bp' else 'bp' #manually telling the engine that a pawn has been captured
+        if is_enpassant_move:
+            self.piece_captured = 'wp' if piece_moved == 'bp' else 'bp' #manually telling the engine that a pawn has been captured
         #castle move
         self.is_castle_move = is_castle_move
-        #move ID
-        self.move_id = self.start_row * 1000 + self.start_column * 100 + self.end_row * 10 + self.end_column #assigning a unique ID to each move
+
+    '''
+    rebuilds the move with the given move_id in the position on board
+    '''
+    @classmethod
+    def from_id(cls, move_id, board):
+        start_row, start_column = divmod(move_id & 63, 8)
+        end_row, end_column = divmod((move_id >> 6) & 63, 8)
+        piece_moved = board[start_row][start_column]
+        #a pawn moving diagonally onto an empty square is capturing en passant, a king moving two squares is castling
+        is_enpassant_move = piece_moved[1] == 'p' and start_column != end_column and board[end_row][end_column] == '--'
+        is_castle_move = piece_moved[1] == 'k' and abs(start_column - end_column) == 2
+        return cls((start_row, start_column), (end_row, end_column), board, is_enpassant_move, is_castle_move,
+                   promotion_piece=cls.promotion_pieces.get(move_id >> 12, 'q'))
+
     '''
     Overriding the equals method
     '''
@@ -591,9 +893,111 @@ class Move():
             return self.move_id == other.move_id
         return False
 
+    def __hash__(self):
+        return self.move_id
+
     def get_chess_notation(self):
         #this converts position to proper chess notation so that it can be stored and analyzed
-        return self.get_rank_file(self.start_row, self.start_column) + self.get_rank_file(self.end_row, self.end_column) 
+        notation = self.get_rank_file(self.start_row, self.start_column) + self.get_rank_file(self.end_row, self.end_column)
+        if self.is_pawn_promotion:
+            notation += self.promotion_piece
+        return notation
 
     def get_rank_file(self, r, c):
-        return self.cols_to_files[c] + self.rows_to_ranks[r]
\ No newline at end of file
+        return self.cols_to_files[c] + self.rows_to_ranks[r]
+
+
+'''
+packs a list of moves into an array of 16 bit move ids, 2 bytes per move
+'''
+def pack_moves(moves):
+    return array('H', [move.move_id for move in moves])
+
+def unpack_moves(move_ids, board):
+    return [Move.from_id(move_id, board) for move_id in move_ids]
+
+'''
+the legal move of gs written as notation (the way get_chess_notation writes it: e2e4, e7e8q), or None if there isn't
+one. A promotion without a piece letter promotes to a queen
+'''
+def move_from_notation(gs, notation, valid_moves=None):
+    if valid_moves is None:
+        valid_moves = gs.get_valid_moves()
+    notation = notation.strip().lower()
+    for move in valid_moves:
+        move_notation = move.get_chess_notation()
+        if move_notation == notation or (len(notation) == 4 and move_notation == notation + 'q'):
+            return move
+    return None
+
+'''
+move of gs in standard algebraic notation (Nf3, exd5, O-O, e8=Q+, Rad1#), as PGN files write it.
+valid_moves are gs's legal moves, generated if not given
+'''
+def move_to_san(gs, move, valid_moves=None):
+    if valid_moves is None:
+        valid_moves = gs.get_valid_moves()
+    if move.is_castle_move:
+        san = 'O-O' if move.end_column > move.start_column else 'O-O-O'
+    else:
+        piece = move.piece_moved[1]
+        target = move.get_rank_file(move.end_row, move.end_column)
+        capture = 'x' if move.piece_captured != '--' else ''
+        if piece == 'p':
+            san = (move.cols_to_files[move.start_column] + capture if capture else '') + target
+            if move.is_pawn_promotion:
+                san += '=' + move.promotion_piece.upper()
+        else:
+            #another piece of the same kind that can go to the same square: name the file, the rank or both of this one
+            others = [other for other in valid_moves if other.piece_moved == move.piece_moved and other.move_id != move.move_id and
+                      other.end_row == move.end_row and other.end_column == move.end_column]
+            disambiguation = ''
+            if others:
+                if all(other.start_column != move.start_column for other in others):
+                    disambiguation = move.cols_to_files[move.start_column]
+                elif all(other.start_row != move.start_row for other in others):
+                    disambiguation = move.rows_to_ranks[move.start_row]
+                else:
+                    disambiguation = move.get_rank_file(move.start_row, move.start_column)
+            san = piece.upper() + disambiguation + capture + target
+    gs.make_move(move)
+    if gs.in_check():
+        san += '#' if len(gs.get_valid_moves()) == 0 else '+'
+    gs.undo_move()
+    return san
+
+'''
+the legal move of gs written in standard algebraic notation (as move_to_san writes it, but also without the check
+sign, with annotations like ! or ?, 0-0 for castling or e8Q for a promotion), or None if there isn't exactly one
+'''
+def move_from_san(gs, san, valid_moves=None):
+    if valid_moves is None:
+        valid_moves = gs.get_valid_moves()
+    san = san.strip().rstrip('+#!?')
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        kingside = len(san) == 3
+        found = [move for move in valid_moves if move.is_castle_move and (move.end_column > move.start_column) == kingside]
+        return found[0] if len(found) == 1 else None
+    promotion = None
+    if '=' in san:
+        san, promotion = san.split('=', 1)
+    elif san[-1:] in 'NBRQ' and len(san) > 2:
+        san, promotion = san[:-1], san[-1]
+    if promotion is not None:
+        promotion = promotion.lower()
+    target = san[-2:]
+    if len(target) != 2 or target[0] not in Move.files_to_cols or target[1] not in Move.ranks_to_rows:
+        return None
+    end_row, end_column = Move.ranks_to_rows[target[1]], Move.files_to_cols[target[0]]
+    rest = san[:-2].replace('x', '')
+    piece = 'p'
+    if rest and rest[0] in 'NBRQK':
+        piece, rest = rest[0].lower(), rest[1:]
+    found = []
+    for move in valid_moves:
+        if move.end_row != end_row or move.end_column != end_column or move.piece_moved[1] != piece or move.promotion_piece != promotion:
+            continue
+        #whatever is left (a file, a rank or both) tells pieces that can go to the same square apart
+        if all(move.start_column == Move.files_to_cols[c] if c in Move.files_to_cols else move.start_row == Move.ranks_to_rows.get(c) for c in rest):
+            found.append(move)
+    return found[0] if len(found) == 1 else None
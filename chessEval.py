@@ -0,0 +1,103 @@
+'''
+Evaluation weights. They live in their own module because chessEngine keeps the evaluation of a GameState
+up to date in make_move/undo_move, and chessAI reads it at the leaves of the search.
+All scores are in centipawns, positive for white.
+'''
+
+piece_score = {'k': 0, 'q': 10, 'r': 5, 'b': 3, 'n': 3, 'p': 1} #assigning a value for every piece on the board, in pawns
+
+PIECES = ('wp', 'wn', 'wb', 'wr', 'wq', 'wk', 'bp', 'bn', 'bb', 'br', 'bq', 'bk')
+PIECE_VALUES = {piece: piece_score[piece[1]] * 100 for piece in PIECES}
+
+'''
+piece-square tables: a bonus for a piece standing on each square, written from white's point of view
+with row 0 (the 8th rank) first. Black uses the same tables flipped upside down
+'''
+PAWN_TABLE = [
+    0,  0,  0,  0,  0,  0,  0,  0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5,  5, 10, 25, 25, 10,  5,  5,
+    0,  0,  0, 20, 20,  0,  0,  0,
+    5, -5,-10,  0,  0,-10, -5,  5,
+    5, 10, 10,-20,-20, 10, 10,  5,
+    0,  0,  0,  0,  0,  0,  0,  0]
+
+KNIGHT_TABLE = [
+    -50,-40,-30,-30,-30,-30,-40,-50,
+    -40,-20,  0,  0,  0,  0,-20,-40,
+    -30,  0, 10, 15, 15, 10,  0,-30,
+    -30,  5, 15, 20, 20, 15,  5,-30,
+    -30,  0, 15, 20, 20, 15,  0,-30,
+    -30,  5, 10, 15, 15, 10,  5,-30,
+    -40,-20,  0,  5,  5,  0,-20,-40,
+    -50,-40,-30,-30,-30,-30,-40,-50]
+
+BISHOP_TABLE = [
+    -20,-10,-10,-10,-10,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5, 10, 10,  5,  0,-10,
+    -10,  5,  5, 10, 10,  5,  5,-10,
+    -10,  0, 10, 10, 10, 10,  0,-10,
+    -10, 10, 10, 10, 10, 10, 10,-10,
+    -10,  5,  0,  0,  0,  0,  5,-10,
+    -20,-10,-10,-10,-10,-10,-10,-20]
+
+ROOK_TABLE = [
+    0,  0,  0,  0,  0,  0,  0,  0,
+    5, 10, 10, 10, 10, 10, 10,  5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    0,  0,  0,  5,  5,  0,  0,  0]
+
+QUEEN_TABLE = [
+    -20,-10,-10, -5, -5,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5,  5,  5,  5,  0,-10,
+    -5,  0,  5,  5,  5,  5,  0, -5,
+    0,  0,  5,  5,  5,  5,  0, -5,
+    -10,  5,  5,  5,  5,  5,  0,-10,
+    -10,  0,  5,  0,  0,  0,  0,-10,
+    -20,-10,-10, -5, -5,-10,-10,-20]
+
+KING_TABLE = [
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -20,-30,-30,-40,-40,-30,-30,-20,
+    -10,-20,-20,-20,-20,-20,-20,-10,
+    20, 20,  0,  0,  0,  0, 20, 20,
+    20, 30, 10,  0,  0, 10, 30, 20]
+
+WHITE_TABLES = {'p': PAWN_TABLE, 'n': KNIGHT_TABLE, 'b': BISHOP_TABLE, 'r': ROOK_TABLE, 'q': QUEEN_TABLE, 'k': KING_TABLE}
+#piece -> bonus for every square index (row*8 + col)
+PIECE_SQUARE_TABLES = {}
+for piece in PIECES:
+    table = WHITE_TABLES[piece[1]]
+    if piece[0] == 'w':
+        PIECE_SQUARE_TABLES[piece] = list(table)
+    else:
+        PIECE_SQUARE_TABLES[piece] = [table[(7 - sq // 8) * 8 + sq % 8] for sq in range(64)]
+
+'''
+material and piece-square totals of both sides, computed from scratch:
+(white material, black material, white piece-square, black piece-square)
+'''
+def evaluate_board(board):
+    white_material = black_material = white_piece_square = black_piece_square = 0
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece == '--':
+                continue
+            if piece[0] == 'w':
+                white_material += PIECE_VALUES[piece]
+                white_piece_square += PIECE_SQUARE_TABLES[piece][r * 8 + c]
+            else:
+                black_material += PIECE_VALUES[piece]
+                black_piece_square += PIECE_SQUARE_TABLES[piece][r * 8 + c]
+    return white_material, black_material, white_piece_square, black_piece_square
@@ -5,13 +5,23 @@ MIN MAX CHESS by KEN WU
 """
 The main driver file. Responsible for handling user input and displaying the current GameState.
 """
+import copy, os, queue, threading
+from collections import OrderedDict
 import pygame as p
-import chessEngine, chessAI
+import chessEngine, chessAI, chessBitboard
 
 WIDTH = HEIGHT = 512
 DIMENSION = 8 #dimensions of board
 SQ_SIZE = HEIGHT // DIMENSION
 IMAGES = {} #of pieces
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images') #next to this file, wherever the game is started from
+BITBOARDS = False #if True, the game state uses the bitboard backend in chessBitboard
+AI_TIME_LIMIT = 1.0 #seconds the AI may think about each move
+MAX_FPS = 30 #the loop redraws at most this often, also while the AI is thinking
+IDLE_FPS = 10 #how often the loop polls for events while nothing on the screen changes
+DIRTY_RECTS = True #if True, only the squares that changed are redrawn and pushed to the display, else the whole window every frame
+HIGHLIGHT_ALPHA = 100 #transparent value of highlights. 0 = transparent, 255 = opaque
+RENDER_CACHE_SIZE = 32 #fonts and surfaces kept by render_cache before the least recently used is dropped
 
 """
 Load in the images.
@@ -22,15 +32,42 @@ def load_images():
     pieces = ['wp', 'wr', 'wb', 'wn', 'wk', 'wq',
             'bp', 'br', 'bb', 'bn', 'bk', 'bq']
     for piece in pieces:
-        IMAGES[piece] = p.transform.scale(p.image.load("Chess/images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+        IMAGES[piece] = p.transform.scale(p.image.load(os.path.join(IMAGE_DIR, piece + ".png")), (SQ_SIZE, SQ_SIZE))
     #now we can access every image through the IMAGES dictionary
 
+def new_game_state():
+    return chessBitboard.BitboardGameState() if BITBOARDS else chessEngine.GameState()
+
+'''
+The AI searches on a background thread so the window keeps handling events and drawing while it thinks.
+It searches a copy of the game state, and hands back the id of its move through a queue.
+Returns (thread, result queue, stop event)
+'''
+def start_ai_search(gs):
+    results = queue.Queue()
+    stop = threading.Event()
+    thread = threading.Thread(target=ai_search_worker, args=(copy.copy(gs), results, stop), daemon=True)
+    thread.start()
+    return thread, results, stop
+
+def ai_search_worker(position, results, stop):
+    move = chessAI.find_best_move(position, position.get_valid_moves(), time_limit=AI_TIME_LIMIT, stop=stop)
+    results.put(move.move_id if move is not None else None)
+
+#stops a running search and waits for it, which only takes a few nodes. Its move is never collected
+def cancel_ai_search(ai_search):
+    if ai_search is not None:
+        thread, results, stop = ai_search
+        stop.set()
+        thread.join()
+    return None
+
 def main():
     p.init()
     screen = p.display.set_mode((WIDTH, HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color('white'))
-    gs = chessEngine.GameState()
+    gs = new_game_state()
     valid_moves = gs.get_valid_moves() #we can only make the moves in the valid_moves list
     move_made = False #flag variable for when a move is made
     load_images()
@@ -40,13 +77,17 @@ def main():
     game_over = False
     player1 = True #if human plays white, then True. If AI plays white, then False
     player2 = False #same for black
-
+    ai_search = None #(thread, result queue, stop event) of the search running for the AI, None if it isn't thinking
+    renderer = DirtyRectRenderer(screen) if DIRTY_RECTS else None
 
     while running:
         human_turn = (gs.white_to_move and player1) or (not gs.white_to_move and player2)
         for e in p.event.get():
             if e.type == p.QUIT:
+                ai_search = cancel_ai_search(ai_search)
                 running = False
+            elif e.type in (p.VIDEOEXPOSE, p.WINDOWEXPOSED) and renderer is not None: #the window was covered, so its contents are gone
+                renderer.full_redraw = True
             #below handles mouse actions
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not game_over and human_turn: #only allowed to move pieces if the game is not over and human player is playing
@@ -78,11 +119,13 @@ def main():
             #below handles key actions
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z: #if the key Z is pressed, call undo_move() function
+                    ai_search = cancel_ai_search(ai_search) #the AI's move would be for the position before the undo
                     gs.undo_move()
                     move_made = True #if a move is undone, generate a new set of valid moves, because undoing a move will change the set of valid moves.
                     game_over = False #if game is over, then undoing a move should undo the 'game over' too.
                 if e.key == p.K_r: #reset the board
-                    gs = chessEngine.GameState()
+                    ai_search = cancel_ai_search(ai_search)
+                    gs = new_game_state()
                     valid_moves = gs.get_valid_moves()
                     sq_selected = ()
                     player_clicks = []
@@ -90,48 +133,74 @@ def main():
                     game_over = False
         
         #Chess AI
-        if not game_over and not human_turn:
-            AI_move = chessAI.find_best_move(gs, valid_moves)
-            if AI_move is None: #if the engine sees it has lost the game, then it should generate random moves
-                AI_move = chessAI.find_random_move(valid_moves)
-            gs.make_move(AI_move)
-            move_made = True
+        human_turn = (gs.white_to_move and player1) or (not gs.white_to_move and player2) #undo or reset may have changed it
+        if not game_over and not human_turn and not move_made: #only once valid_moves and game_over are up to date
+            if ai_search is None:
+                ai_search = start_ai_search(gs)
+            else:
+                try:
+                    move_id = ai_search[1].get_nowait()
+                except queue.Empty: #still thinking
+                    pass
+                else:
+                    ai_search[0].join()
+                    ai_search = None
+                    AI_move = None
+                    for move in valid_moves:
+                        if move.move_id == move_id:
+                            AI_move = move
+                    if AI_move is None: #if the engine sees it has lost the game, then it should generate random moves
+                        AI_move = chessAI.find_random_move(valid_moves)
+                    gs.make_move(AI_move)
+                    move_made = True
 
         #if a move is made, set flag to false again, and generate a new set of valid moves.
         if move_made:
             valid_moves = gs.get_valid_moves()
             move_made = False
 
-        draw_gamestate(screen, gs, valid_moves, sq_selected)
+        text = None
         if gs.check_mate:
             game_over = True
             if gs.white_to_move:
-                draw_text(screen, 'Black Wins By Checkmate!')
+                text = 'Black Wins By Checkmate!'
             else:
-                draw_text(screen, 'White Wins By Checkmate!')
+                text = 'White Wins By Checkmate!'
         elif gs.stale_mate:
             game_over = True
-            draw_text(screen, 'Stalemate!')
+            text = 'Stalemate!'
 
-        p.display.flip()
+        if renderer is not None:
+            changed = renderer.draw(gs, valid_moves, sq_selected, text)
+        else:
+            draw_gamestate(screen, gs, valid_moves, sq_selected)
+            if text is not None:
+                draw_text(screen, text)
+            p.display.flip()
+            changed = True
+        #nothing to show and nobody thinking: poll slowly so a static position doesn't keep a core busy
+        clock.tick(MAX_FPS if changed or ai_search is not None else IDLE_FPS)
 
 
 '''
 Highlight squares
 '''
 def highlight_squares(screen, gs, valid_moves, sq_selected):
+    for (r, c), color in highlighted_squares(gs, valid_moves, sq_selected).items():
+        screen.blit(render_cache.highlight(color), (c*SQ_SIZE, r*SQ_SIZE))
+
+#the colour of every highlighted square: the selected piece in blue and the squares it can move to in yellow
+def highlighted_squares(gs, valid_moves, sq_selected):
+    highlights = {}
     if sq_selected != ():
         r, c = sq_selected
         if gs.board[r][c][0] == ('w' if gs.white_to_move else 'b'): #if the square selected is a valid piece that can be moved
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100) #transparent value. 0 = transparent, 255 = opaque
-            s.fill(p.Color('blue'))
-            screen.blit(s, (c*SQ_SIZE, r*SQ_SIZE))
+            highlights[(r, c)] = 'blue'
             #highlight moves from square
-            s.fill(p.Color('yellow'))
             for move in valid_moves:
                 if move.start_row == r and move.start_column == c:
-                    screen.blit(s, (move.end_column*SQ_SIZE, move.end_row*SQ_SIZE))
+                    highlights[(move.end_row, move.end_column)] = 'yellow'
+    return highlights
 
 
 '''
@@ -157,13 +226,117 @@ def draw_pieces(screen, board):
                 screen.blit(IMAGES[piece], p.Rect(x*SQ_SIZE, y*SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
 
+#returns the area drawn on
 def draw_text(screen, text):
-    font = p.font.SysFont('Helvitca', 40, True, False)
-    text_object = font.render(text, 0, p.Color('Gray'))
-    text_location = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - text_object.get_width()/2, HEIGHT/2 - text_object.get_height()/2)
-    screen.blit(text_object, text_location)
-    text_object = font.render(text, 0, p.Color('Black'))
-    screen.blit(text_object, text_location.move(2, 2))
+    banner = render_cache.banner(text)
+    #centre the text itself, which is 2 pixels smaller than the banner with its shadow
+    text_location = banner.get_rect().move(WIDTH/2 - (banner.get_width() - 2)/2, HEIGHT/2 - (banner.get_height() - 2)/2)
+    screen.blit(banner, text_location)
+    return text_location
+
+'''
+Fonts, rendered text and highlight surfaces, so drawing a frame doesn't look up a system font or build surfaces
+again. Everything is keyed by what it depends on (font, size, colour, text) and the least recently used entry is
+dropped once there are more than `size`. One cache, render_cache, is shared by draw_text, highlight_squares and
+DirtyRectRenderer
+'''
+class RenderCache():
+
+    def __init__(self, size=RENDER_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, make):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        value = self.entries[key] = make()
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return value
+
+    def font(self, name, size, bold=False, italic=False):
+        return self.get(('font', name, size, bold, italic), lambda: p.font.SysFont(name, size, bold, italic))
+
+    def text(self, text, color, name='Helvitca', size=40, bold=True):
+        return self.get(('text', text, color, name, size, bold),
+                        lambda: self.font(name, size, bold).render(text, 0, p.Color(color)))
+
+    #the end of game message: gray text with the black text 2 pixels below and to the right of it
+    def banner(self, text):
+        def make():
+            shadow = self.text(text, 'Gray')
+            front = self.text(text, 'Black')
+            surface = p.Surface((front.get_width() + 2, front.get_height() + 2), p.SRCALPHA)
+            surface.blit(shadow, (0, 0))
+            surface.blit(front, (2, 2))
+            return surface
+        return self.get(('banner', text), make)
+
+    def highlight(self, color, alpha=HIGHLIGHT_ALPHA):
+        def make():
+            surface = p.Surface((SQ_SIZE, SQ_SIZE))
+            surface.set_alpha(alpha)
+            surface.fill(p.Color(color))
+            return surface
+        return self.get(('highlight', color, alpha), make)
+
+    def clear(self):
+        self.entries.clear()
+
+render_cache = RenderCache()
+
+'''
+Draws the same picture as draw_gamestate and draw_text, but only repaints the squares whose piece or highlight changed
+since the last frame and only pushes those to the display. The empty board is drawn once and copied from
+'''
+class DirtyRectRenderer():
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.board_surface = p.Surface((WIDTH, HEIGHT))
+        draw_board(self.board_surface)
+        self.shown = [[None] * DIMENSION for _ in range(DIMENSION)] #(piece, highlight colour) on every square of the screen
+        self.text = None
+        self.full_redraw = True #set when the whole window has to be repainted, like after it was covered
+
+    #returns whether anything was drawn
+    def draw(self, gs, valid_moves, sq_selected, text):
+        highlights = highlighted_squares(gs, valid_moves, sq_selected)
+        if text != self.text: #the banner covers squares that don't change, so it can only be taken away by a full redraw
+            self.full_redraw = True
+            self.text = text
+        rects = []
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                square = (gs.board[r][c], highlights.get((r, c)))
+                if self.full_redraw or square != self.shown[r][c]:
+                    rects.append(self.draw_square(r, c, square))
+                    self.shown[r][c] = square
+        if not rects:
+            return False
+        if text is not None:
+            rects.append(draw_text(self.screen, text))
+        if self.full_redraw:
+            p.display.flip()
+        else:
+            p.display.update(rects)
+        self.full_redraw = False
+        return True
+
+    def draw_square(self, r, c, square):
+        piece, highlight = square
+        rect = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        self.screen.blit(self.board_surface, rect, rect)
+        if highlight is not None:
+            self.screen.blit(render_cache.highlight(highlight), rect)
+        if piece != "--":
+            self.screen.blit(IMAGES[piece], rect)
+        return rect
 
 if __name__ == "__main__":
     main()
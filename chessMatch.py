@@ -0,0 +1,270 @@
+'''
+Headless self-play: two engine configurations play each other in many games at once on worker processes, starting
+from a bundled set of openings with colours swapped every other game. Games end in checkmate, stalemate, threefold
+repetition, the fifty-move rule or a draw at the move limit. Every finished game is appended to a PGN file right away,
+and at the end it prints wins/draws/losses, the Elo difference with a 95% error bar and nodes per second per engine.
+
+    python chessMatch.py "new:depth=4" "old:depth=3" --games 40 --workers 8 --pgn match.pgn
+    python chessMatch.py "pst:time=0.1" "material:time=0.1,eval=material"
+
+An engine is name:settings, settings separated by commas: depth, time (seconds per move), nodes (per move), hash (MB),
+eval (a name in EVALUATIONS) and any upper case chessAI setting, like BATCH_LEAVES=True, which is only changed while
+that engine searches. Each engine has its own transposition table, cleared at the start of every game.
+'''
+
+import argparse
+import ast
+import math
+import os
+import sys
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import chessAI
+from chessEngine import GameState, move_from_notation, move_to_san
+
+WORKERS = os.cpu_count() or 1 #default number of worker processes
+MAX_PLIES = 200 #games still going after this many plies are drawn
+OPENINGS = [ #(name, moves played before the engines take over)
+    ('Ruy Lopez', 'e2e4 e7e5 g1f3 b8c6 f1b5 a7a6'),
+    ('Italian Game', 'e2e4 e7e5 g1f3 b8c6 f1c4 f8c5'),
+    ('Scotch Game', 'e2e4 e7e5 g1f3 b8c6 d2d4 e5d4'),
+    ('Petrov Defence', 'e2e4 e7e5 g1f3 g8f6 f3e5 d7d6'),
+    ('Sicilian Najdorf', 'e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6'),
+    ('Sicilian Dragon', 'e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 g7g6'),
+    ('French Defence', 'e2e4 e7e6 d2d4 d7d5 b1c3 g8f6'),
+    ('Caro-Kann Defence', 'e2e4 c7c6 d2d4 d7d5 b1c3 d5e4 c3e4'),
+    ('Pirc Defence', 'e2e4 d7d6 d2d4 g8f6 b1c3 g7g6'),
+    ('Scandinavian Defence', 'e2e4 d7d5 e4d5 d8d5 b1c3 d5a5'),
+    ("Queen's Gambit Declined", 'd2d4 d7d5 c2c4 e7e6 b1c3 g8f6'),
+    ('Slav Defence', 'd2d4 d7d5 c2c4 c7c6 g1f3 g8f6'),
+    ("Queen's Gambit Accepted", 'd2d4 d7d5 c2c4 d5c4 g1f3 g8f6'),
+    ("King's Indian Defence", 'd2d4 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6'),
+    ('Nimzo-Indian Defence', 'd2d4 g8f6 c2c4 e7e6 b1c3 f8b4'),
+    ('Grunfeld Defence', 'd2d4 g8f6 c2c4 g7g6 b1c3 d7d5'),
+    ('Dutch Defence', 'd2d4 f7f5 c2c4 g8f6 g2g3 e7e6'),
+    ('English Opening', 'c2c4 e7e5 b1c3 g8f6 g2g3 d7d5'),
+    ('Reti Opening', 'g1f3 d7d5 c2c4 e7e6 g2g3 g8f6'),
+    ('London System', 'd2d4 d7d5 c1f4 g8f6 e2e3 c7c5'),
+]
+player_tables = {} #transposition table of each engine in this process, by name
+
+def material_only(gs):
+    return gs.white_material - gs.black_material
+
+#leaf evaluations an engine can use, None is chessAI's own (material plus piece-square tables)
+EVALUATIONS = {'default': None, 'material': material_only}
+
+class Player():
+
+    #parses an engine like "deep:depth=4,hash=32", raises ValueError for settings it doesn't know
+    def __init__(self, spec):
+        self.name, _, settings = spec.rpartition(':')
+        self.name = self.name or settings
+        self.depth = self.time_limit = self.node_limit = None
+        self.hash_mb = chessAI.TT_SIZE_MB
+        self.evaluation = 'default'
+        self.options = {} #chessAI settings changed while this engine searches
+        for setting in filter(None, settings.split(',')):
+            name, _, value = setting.partition('=')
+            name, value = name.strip(), value.strip()
+            if name == 'depth':
+                self.depth = int(value)
+            elif name == 'time':
+                self.time_limit = float(value)
+            elif name == 'nodes':
+                self.node_limit = int(value)
+            elif name == 'hash':
+                self.hash_mb = int(value)
+            elif name == 'eval':
+                if value not in EVALUATIONS:
+                    raise ValueError('unknown evaluation ' + repr(value) + ', pick one of ' + ', '.join(EVALUATIONS))
+                self.evaluation = value
+            elif name.isupper() and hasattr(chessAI, name):
+                try:
+                    self.options[name] = ast.literal_eval(value)
+                except (ValueError, SyntaxError):
+                    self.options[name] = value
+            else:
+                raise ValueError('unknown engine setting ' + repr(setting))
+        if self.depth is None and self.time_limit is None and self.node_limit is None:
+            self.depth = chessAI.DEPTH
+
+'''
+the move player picks in gs and the nodes it searched. chessAI's settings are changed to the player's only for the search
+'''
+def search_move(player, gs, valid_moves):
+    tt = player_tables.get(player.name)
+    if tt is None:
+        tt = player_tables[player.name] = chessAI.TranspositionTable(player.hash_mb)
+    saved = {name: getattr(chessAI, name) for name in player.options}
+    saved_evaluation = chessAI.LEAF_EVALUATION
+    try:
+        for name, value in player.options.items():
+            setattr(chessAI, name, value)
+        chessAI.LEAF_EVALUATION = EVALUATIONS[player.evaluation]
+        move = chessAI.search(gs, list(valid_moves), player.depth, tt, player.time_limit, player.node_limit)[0]
+    finally:
+        for name, value in saved.items():
+            setattr(chessAI, name, value)
+        chessAI.LEAF_EVALUATION = saved_evaluation
+    return move if move is not None else valid_moves[0], chessAI.nodes_searched
+
+'''
+plays one game from the opening and returns it as a dict: round, white and black (names), opening, result ('1-0',
+'0-1' or '1/2-1/2'), termination, the moves in SAN, and nodes and seconds searched per engine name
+'''
+def play_game(round_number, white, black, opening, max_plies=MAX_PLIES):
+    for player in (white, black):
+        if player.name in player_tables:
+            player_tables[player.name].clear()
+    gs = GameState()
+    san_moves = []
+    for notation in opening[1].split():
+        move = move_from_notation(gs, notation)
+        san_moves.append(move_to_san(gs, move))
+        gs.make_move(move)
+    stats = {white.name: [0, 0.0], black.name: [0, 0.0]}
+    repetitions = {gs.zobrist_key: 1}
+    halfmove_clock = 0
+    while True:
+        valid_moves = gs.get_valid_moves()
+        if len(valid_moves) == 0:
+            if gs.check_mate:
+                result, termination = ('0-1' if gs.white_to_move else '1-0'), 'checkmate'
+            else:
+                result, termination = '1/2-1/2', 'stalemate'
+            break
+        if repetitions[gs.zobrist_key] >= 3:
+            result, termination = '1/2-1/2', 'threefold repetition'
+            break
+        if halfmove_clock >= 100:
+            result, termination = '1/2-1/2', 'fifty-move rule'
+            break
+        if len(san_moves) >= max_plies:
+            result, termination = '1/2-1/2', 'move limit'
+            break
+        player = white if gs.white_to_move else black
+        start = time.perf_counter()
+        move, nodes = search_move(player, gs, valid_moves)
+        stats[player.name][0] += nodes
+        stats[player.name][1] += time.perf_counter() - start
+        san_moves.append(move_to_san(gs, move, valid_moves))
+        halfmove_clock = 0 if move.piece_moved[1] == 'p' or move.piece_captured != '--' else halfmove_clock + 1
+        gs.make_move(move)
+        repetitions[gs.zobrist_key] = repetitions.get(gs.zobrist_key, 0) + 1
+    return {'round': round_number, 'white': white.name, 'black': black.name, 'opening': opening[0], 'result': result,
+            'termination': termination, 'moves': san_moves, 'stats': stats}
+
+def game_to_pgn(game, event='chessAI self-play', date=None):
+    tags = [('Event', event), ('Site', '?'), ('Date', date or time.strftime('%Y.%m.%d')), ('Round', str(game['round'])),
+            ('White', game['white']), ('Black', game['black']), ('Result', game['result']), ('Opening', game['opening']),
+            ('Termination', 'adjudication' if game['termination'] == 'move limit' else 'normal'),
+            ('PlyCount', str(len(game['moves'])))]
+    words = []
+    for i, san in enumerate(game['moves']):
+        if i % 2 == 0:
+            words.append('%d.' % (i // 2 + 1))
+        words.append(san)
+    words += ['{' + game['termination'] + '}', game['result']]
+    header = ''.join('[%s "%s"]\n' % (name, value.replace('\\', '\\\\').replace('"', '\\"')) for name, value in tags)
+    return header + '\n' + textwrap.fill(' '.join(words), 79) + '\n\n'
+
+#Elo difference for an expected score between 0 and 1, infinite for a score of 0 or 1
+def elo_difference(score):
+    if score <= 0 or score >= 1:
+        return math.copysign(float('inf'), score - 0.5)
+    return 400 * math.log10(score / (1 - score))
+
+'''
+wins, draws and losses from a list of game scores (1, 0.5 or 0), the score fraction, the Elo difference it means and
+the 95% error bar of that difference. the error comes from the trinomial distribution of the results (each of win,
+draw and loss weighted by how often it happened), and is infinite while that distribution has no spread (every game
+the same result) or the interval reaches a score of 0 or 1, since so few games can't bound the difference
+'''
+def match_stats(scores):
+    games = len(scores)
+    stats = {'games': games, 'wins': scores.count(1), 'draws': scores.count(0.5), 'losses': scores.count(0),
+             'score': 0.5, 'elo': 0.0, 'elo_error': float('inf')}
+    if games == 0:
+        return stats
+    mean = (stats['wins'] + 0.5 * stats['draws']) / games
+    stats['score'] = mean
+    stats['elo'] = elo_difference(mean)
+    variance = (stats['wins'] * (1 - mean) ** 2 + stats['draws'] * (0.5 - mean) ** 2 + stats['losses'] * mean ** 2) / games
+    deviation = math.sqrt(variance / games)
+    if deviation > 0:
+        low, high = mean - 1.96 * deviation, mean + 1.96 * deviation
+        if low > 0 and high < 1:
+            stats['elo_error'] = (elo_difference(high) - elo_difference(low)) / 2
+    return stats
+
+'''
+plays games games between the two players, alternating colours and going through OPENINGS in order, on workers processes.
+every game is appended to pgn_path (if given) and passed to on_game as it finishes. returns match_stats from first's
+point of view and the nodes per second of each player by name
+'''
+def run_match(first, second, games, workers=None, pgn_path=None, max_plies=MAX_PLIES, on_game=None):
+    workers = min(workers or WORKERS, games) or 1
+    pairings = []
+    for i in range(games):
+        white, black = (first, second) if i % 2 == 0 else (second, first)
+        pairings.append((i + 1, white, black, OPENINGS[(i // 2) % len(OPENINGS)], max_plies))
+    scores = []
+    totals = {first.name: [0, 0.0], second.name: [0, 0.0]}
+    pgn = open(pgn_path, 'w') if pgn_path else None
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is None:
+            finished = (play_game(*pairing) for pairing in pairings)
+        else:
+            finished = (future.result() for future in as_completed([executor.submit(play_game, *pairing) for pairing in pairings]))
+        for game in finished:
+            if pgn is not None:
+                pgn.write(game_to_pgn(game))
+                pgn.flush()
+            points = {'1-0': 1, '0-1': 0}.get(game['result'], 0.5)
+            scores.append(points if game['white'] == first.name else 1 - points)
+            for name, (nodes, seconds) in game['stats'].items():
+                totals[name][0] += nodes
+                totals[name][1] += seconds
+            if on_game is not None:
+                on_game(game)
+    finally: #also when a game fails, so no worker is left running the rest of the match
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if pgn is not None:
+            pgn.close()
+    nps = {name: nodes / seconds if seconds else 0 for name, (nodes, seconds) in totals.items()}
+    return match_stats(scores), nps
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='play two engine configurations against each other')
+    parser.add_argument('engines', nargs=2, help='two engines like "new:depth=4" "old:time=0.2,eval=material"')
+    parser.add_argument('--games', type=int, default=2 * len(OPENINGS))
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--pgn', help='file to write the games to')
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES, help='plies after which a game is drawn')
+    args = parser.parse_args(argv)
+
+    try:
+        first, second = Player(args.engines[0]), Player(args.engines[1])
+    except ValueError as e:
+        print('error:', e, file=sys.stderr)
+        return 2
+    if first.name == second.name:
+        second.name += ' (2)'
+    report = lambda game: print('game %d: %s - %s %s (%s, %s)' % (game['round'], game['white'], game['black'], game['result'],
+                                                                  game['termination'], game['opening']), file=sys.stderr)
+    stats, nps = run_match(first, second, args.games, args.workers, args.pgn, args.max_plies, report)
+    error = '%.0f' % stats['elo_error'] if math.isfinite(stats['elo_error']) else 'n/a'
+    print('%s vs %s: +%d =%d -%d in %d games, score %.1f%%, Elo %+.0f +/- %s' % (
+        first.name, second.name, stats['wins'], stats['draws'], stats['losses'], stats['games'], 100 * stats['score'],
+        stats['elo'], error))
+    for name, rate in nps.items():
+        print('%s: %.0f nodes/s' % (name, rate))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,357 @@
+'''
+Root-parallel search: the root moves are shared out to worker processes, each worker searches the position after its
+move with chessAI's negamax, and the best result is picked back at the root. The workers share the best score found so
+far (alpha), so a move that can't beat it is cut off early instead of being searched exactly.
+
+Positions go to the workers in the compact pickled form of GameState/BitboardGameState, and every worker keeps its own
+transposition table between searches. With one worker, or where processes can't be started, it falls back to chessAI.search.
+
+Lazy SMP (lazy_smp_search) instead lets every worker search the whole root, at slightly different depths and move
+orders, and share what they find through one transposition table in shared memory.
+
+    python chessParallel.py --workers 8 --depth 4   #speedup curve from 1 to 8 workers on a fixed set of positions
+    python chessParallel.py --workers 8 --depth 4 --lazy-smp
+'''
+
+import argparse
+import atexit
+import copy
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory, util
+import chessAI
+from chessEngine import Move
+
+WORKERS = os.cpu_count() or 1 #default number of worker processes
+pool = None #kept between searches so workers (and their transposition tables) are only started once
+pool_workers = 0
+shared_alpha = None #multiprocessing.Value with the best root score so far, in the parent and in every worker
+search_id = 0 #counts the root searches, so a worker knows when one of its tasks belongs to a new search
+worker_search_id = None #in a worker, the search its last task belonged to
+nodes_searched = 0 #positions visited by all workers in the last search
+smp_pool = None #helper processes of lazy_smp_search, with the shared table and stop event they were started with
+smp_workers = 0
+shared_tt = None
+smp_stop = None
+
+'''
+best move and score like chessAI.search, searching the root moves in parallel on `workers` processes.
+each iteration of the deepening hands out the moves best first, so good scores are shared early
+'''
+def search(gs, valid_moves, depth=None, workers=None):
+    global nodes_searched, search_id
+    if depth is None:
+        depth = chessAI.DEPTH
+    if workers is None:
+        workers = WORKERS
+    nodes_searched = 0
+    if workers <= 1 or len(valid_moves) <= 1:
+        return serial_search(gs, valid_moves, depth)
+    try:
+        executor = get_pool(workers)
+    except (OSError, NotImplementedError, ImportError): #no working process support here
+        return serial_search(gs, valid_moves, depth)
+
+    moves = chessAI.order_moves(valid_moves)
+    best_move, best_score = None, 0
+    search_id += 1
+    try:
+        for current_depth in range(1, depth + 1):
+            best_move, best_score = search_iteration(executor, gs, moves, current_depth)
+            if abs(best_score) > chessAI.CHECKMATE - 500: #a forced mate was found, deeper won't change it
+                break
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+    except BrokenProcessPool: #a worker died, finish on this process
+        shutdown_pool()
+        return serial_search(gs, valid_moves, depth)
+    return best_move, best_score
+
+def serial_search(gs, valid_moves, depth):
+    global nodes_searched
+    result = chessAI.search(gs, valid_moves, depth)
+    nodes_searched = chessAI.nodes_searched
+    return result
+
+#one depth: every root move searched by whichever worker is free, then the results reduced to the best one
+def search_iteration(executor, gs, moves, depth):
+    global nodes_searched
+    with shared_alpha.get_lock():
+        shared_alpha.value = -chessAI.CHECKMATE - 1
+    futures = [executor.submit(search_root_move, gs, move.move_id, depth, search_id) for move in moves]
+    best = None
+    for index, future in enumerate(futures):
+        move_id, score, exact, nodes = future.result()
+        nodes_searched += nodes
+        #a score that failed low is only an upper bound, so an exact one wins a tie, and then the earlier move
+        if best is None or (score, exact) > (best[1], best[2]):
+            best = (index, score, exact)
+    return moves[best[0]], best[1]
+
+'''
+runs in a worker: searches the position after move_id from gs and returns (move id, score for the side to move at
+the root, whether the score is exact, nodes searched). Only moves that might beat the shared alpha are searched exactly.
+The first task of every new root search (new_search_id) ages the table and clears the killers and history, like
+chessAI.search does, and the later ones of the same search keep what the earlier ones found
+'''
+def search_root_move(gs, move_id, depth, new_search_id):
+    global worker_search_id
+    chessAI.nodes_searched = 0
+    tt = chessAI.default_transposition_table()
+    if new_search_id != worker_search_id:
+        worker_search_id = new_search_id
+        tt.new_search()
+        chessAI.clear_move_ordering()
+    turn_multiplier = 1 if gs.white_to_move else -1
+    alpha = shared_alpha.value
+    gs.make_move(Move.from_id(move_id, gs.board))
+    score = -chessAI.negamax(gs, depth - 1, -chessAI.CHECKMATE - 1, -alpha, -turn_multiplier, 1, tt)
+    gs.undo_move()
+    if score > alpha:
+        with shared_alpha.get_lock():
+            if score > shared_alpha.value:
+                shared_alpha.value = score
+    return move_id, score, score > alpha, chessAI.nodes_searched
+
+def init_worker(alpha):
+    global shared_alpha
+    shared_alpha = alpha
+
+def get_pool(workers):
+    global pool, pool_workers, shared_alpha
+    if pool is None or pool_workers != workers:
+        shutdown_pool()
+        shared_alpha = multiprocessing.Value('i', 0)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(shared_alpha,))
+        pool_workers = workers
+    return pool
+
+def shutdown_pool():
+    global pool, pool_workers
+    if pool is not None:
+        pool.shutdown()
+    pool = None
+    pool_workers = 0
+
+'''
+transposition table in multiprocessing.shared_memory, so every process of a Lazy SMP search reads and writes the
+same entries. Same buckets and replacement as chessAI.TranspositionTable, but without locks: each slot stores the key
+XOR-ed with the data next to the data itself, and a probe only accepts a slot if the two still XOR back to the key.
+A slot that another process was halfway through writing then just looks like a miss instead of returning wrong data.
+create one with size_mb in the parent, and attach to it by name and bucket count in the workers
+'''
+class SharedTranspositionTable(chessAI.TranspositionTable):
+
+    def __init__(self, size_mb=chessAI.TT_SIZE_MB, name=None, buckets=None):
+        if name is None:
+            buckets = self.bucket_count(size_mb)
+            self.shm = shared_memory.SharedMemory(create=True, size=buckets * 2 * self.ENTRY_BYTES)
+            self.shm.buf[:buckets * 2 * self.ENTRY_BYTES] = bytes(buckets * 2 * self.ENTRY_BYTES)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.buckets = buckets
+        self.mask = buckets - 1
+        self.words = self.shm.buf[:buckets * 2 * self.ENTRY_BYTES].cast('Q') #key ^ data, data, for every slot
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __len__(self):
+        return self.buckets * 2
+
+    def probe(self, key):
+        i = (key & self.mask) << 2
+        words = self.words
+        data = words[i+1]
+        if words[i] ^ data != key:
+            data = words[i+3]
+            if words[i+2] ^ data != key:
+                self.misses += 1
+                return None
+        self.hits += 1
+        return (data >> 16) & 0xFF, ((data >> 26) & 0xFFFF) - 32768, (data >> 24) & 3, data & 0xFFFF
+
+    def store(self, key, depth, score, bound, move_id):
+        i = (key & self.mask) << 2
+        words = self.words
+        data = move_id | (depth << 16) | (bound << 24) | ((score + 32768) << 26) | (self.age << 42)
+        old = words[i+1]
+        old_key = words[i] ^ old
+        if old_key == key or depth >= (old >> 16) & 0xFF or (old >> 42) & 0xFF != self.age:
+            if old_key != key and old: #demote the replaced entry instead of losing it
+                words[i+2] = words[i]
+                words[i+3] = old
+            words[i] = key ^ data
+            words[i+1] = data
+        else:
+            words[i+2] = key ^ data
+            words[i+3] = data
+        self.stores += 1
+
+    def clear(self):
+        self.shm.buf[:len(self.words) * 8] = bytes(len(self.words) * 8)
+        self.hits = self.misses = self.stores = 0
+
+    def stats(self):
+        probes = self.hits + self.misses
+        sample = self.words[1:2000:2]
+        return {'size_mb': len(self) * self.ENTRY_BYTES / (1024 * 1024), 'entries': len(self),
+                'hits': self.hits, 'misses': self.misses, 'stores': self.stores,
+                'hit_rate': self.hits / probes if probes else 0.0,
+                'fill_rate': sum(1 for data in sample if data) / len(sample)}
+
+    #stops using the shared block in this process
+    def detach(self):
+        if self.words is None:
+            return
+        self.words.release()
+        self.words = None
+        self.shm.close()
+
+    #detaches, and removes the block if this process created it
+    def close(self):
+        if self.words is not None:
+            self.detach()
+            if self.owner:
+                self.shm.unlink()
+
+'''
+Lazy SMP: the main search runs here while workers - 1 helper processes search the same root, every other one a ply
+deeper and each with its own random move order. Nothing is split up or reduced; the processes only help each other
+through the shared transposition table, where the helpers leave results the main search then finds instead of searching.
+When the main search is done (depth, time_limit or node_limit) the helpers are stopped and its result is returned
+'''
+def lazy_smp_search(gs, valid_moves, depth=None, workers=None, time_limit=None, node_limit=None):
+    global nodes_searched
+    if workers is None:
+        workers = WORKERS
+    if workers <= 1 or len(valid_moves) <= 1:
+        result = chessAI.search(gs, valid_moves, depth, time_limit=time_limit, node_limit=node_limit)
+        nodes_searched = chessAI.nodes_searched
+        return result
+    try:
+        executor = get_smp_pool(workers)
+    except (OSError, NotImplementedError, ImportError):
+        result = chessAI.search(gs, valid_moves, depth, time_limit=time_limit, node_limit=node_limit)
+        nodes_searched = chessAI.nodes_searched
+        return result
+
+    shared_tt.new_search()
+    smp_stop.clear()
+    helper_depth = depth if depth is not None else chessAI.MAX_DEPTH
+    position = copy.copy(gs) #the main search changes gs while the helpers' arguments may still be pickled
+    helpers = [executor.submit(smp_helper, position, helper_depth + i % 2, shared_tt.age, random.getrandbits(32))
+               for i in range(1, workers)]
+    try:
+        best_move, best_score = chessAI.search(gs, valid_moves, depth, tt=shared_tt, time_limit=time_limit, node_limit=node_limit)
+        nodes_searched = chessAI.nodes_searched
+    finally:
+        smp_stop.set()
+        for helper in helpers:
+            try:
+                nodes_searched += helper.result()
+            except BrokenProcessPool:
+                shutdown_smp_pool()
+                break
+    return best_move, best_score
+
+#runs in a helper process: searches the root until it reaches depth or the main search stops it, returns nodes searched
+def smp_helper(gs, depth, age, seed):
+    random.seed(seed) #chessAI.search shuffles the root moves, so every helper starts with a different order
+    shared_tt.age = age
+    chessAI.search(gs, gs.get_valid_moves(), depth, tt=shared_tt, stop=smp_stop)
+    return chessAI.nodes_searched
+
+def init_smp_worker(name, buckets, stop):
+    global shared_tt, smp_stop
+    if shared_tt is not None: #the parent's table, inherited through fork
+        shared_tt.detach()
+    shared_tt = SharedTranspositionTable(name=name, buckets=buckets)
+    smp_stop = stop
+    util.Finalize(shared_tt, shared_tt.close, exitpriority=10) #detach before the process exits
+
+def get_smp_pool(workers):
+    global smp_pool, smp_workers, shared_tt, smp_stop
+    if smp_pool is None or smp_workers != workers:
+        shutdown_smp_pool()
+        shared_tt = SharedTranspositionTable(chessAI.TT_SIZE_MB)
+        smp_stop = multiprocessing.Event()
+        smp_pool = ProcessPoolExecutor(max_workers=workers - 1, initializer=init_smp_worker,
+                                       initargs=(shared_tt.name, shared_tt.buckets, smp_stop))
+        smp_workers = workers
+    return smp_pool
+
+def shutdown_smp_pool():
+    global smp_pool, smp_workers, shared_tt
+    if smp_pool is not None:
+        smp_pool.shutdown()
+    if shared_tt is not None:
+        shared_tt.close()
+    smp_pool = None
+    smp_workers = 0
+    shared_tt = None
+
+#registered once, both do nothing if their pool was never started
+atexit.register(shutdown_pool)
+atexit.register(shutdown_smp_pool)
+
+BENCHMARK_POSITIONS = [
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+    'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+]
+
+'''
+the time to search every benchmark position with 1, 2, ... max_workers workers, as (workers, seconds, nodes, speedup)
+rows. Every worker count starts with fresh workers so no transposition table carries over
+'''
+def speedup_curve(max_workers, depth, fens=BENCHMARK_POSITIONS, lazy_smp=False):
+    from chessEngine import GameState
+    rows = []
+    for workers in range(1, max_workers + 1):
+        shutdown_pool()
+        shutdown_smp_pool()
+        if workers > 1: #start the processes before the clock does
+            if lazy_smp:
+                get_smp_pool(workers).submit(int).result()
+            else:
+                get_pool(workers).submit(int).result()
+        seconds = 0.0
+        nodes = 0
+        for fen in fens:
+            gs = GameState(fen)
+            chessAI.transposition_table = None
+            start = time.perf_counter()
+            if lazy_smp:
+                lazy_smp_search(gs, gs.get_valid_moves(), depth, workers)
+            else:
+                search(gs, gs.get_valid_moves(), depth, workers)
+            seconds += time.perf_counter() - start
+            nodes += nodes_searched
+        rows.append((workers, seconds, nodes, rows[0][1] / seconds if rows else 1.0))
+    shutdown_pool()
+    shutdown_smp_pool()
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='speedup of the parallel searches from 1 to N workers')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--depth', type=int, default=chessAI.DEPTH)
+    parser.add_argument('--lazy-smp', action='store_true', help='time lazy_smp_search instead of the root-parallel search')
+    args = parser.parse_args()
+    print('workers  seconds      nodes  speedup')
+    for workers, seconds, nodes, speedup in speedup_curve(args.workers, args.depth, lazy_smp=args.lazy_smp):
+        print('%7d  %7.2f  %9d  %7.2f' % (workers, seconds, nodes, speedup))
@@ -0,0 +1,225 @@
+'''
+Perft: counts the leaf nodes of the move tree to a fixed depth, to check the move generator against known
+numbers and to measure how fast it is. Runs without pygame:
+
+    python chessPerft.py                        #every bundled position to depth 3, compared against perft_baseline.json
+    python chessPerft.py --depth 4 --backend all
+    python chessPerft.py --fen "<fen>" --depth 3 --divide
+    python chessPerft.py --save-baseline        #store the current speed as the new baseline
+
+The exit status is 1 if a node count is wrong or a position got slower than the baseline allows, so it can run before a deploy.
+Speeds only mean something on the machine they were measured on, so perft_baseline.json isn't part of the repository:
+run --save-baseline once on the machine the checks run on. Without a baseline only the node counts are checked.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from chessEngine import GameState
+from chessBitboard import BitboardGameState
+
+try:
+    import resource #not available on Windows
+except ImportError:
+    resource = None
+
+'''
+standard test positions and their known node counts for depth 1, 2, 3...
+together they cover castling (also through and out of check), en passant, promotion and underpromotion
+'''
+POSITIONS = [
+    ('start', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862, 4085603]),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238, 674624]),
+    ('promotions', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467, 422333]),
+    ('mirrored', 'r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1', [6, 264, 9467, 422333]),
+    ('discovered', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379, 2103487]),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10', [46, 2079, 89890, 3894594]),
+    ('illegal ep', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1', [18, 92, 1670, 10138, 185429]),
+    ('ep check', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1', [15, 126, 1928, 13931, 206379]),
+    ('ep pin', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1', [13, 102, 1266, 10276, 135655]),
+]
+BACKENDS = ('list', 'bitboard')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perft_baseline.json')
+SLOWDOWN_ALLOWED = 0.2 #a position may run this much slower than the baseline before the check fails
+MIN_TIMED_SECONDS = 0.1 #runs shorter than this are too noisy to compare with the baseline on their own
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.get_valid_moves()
+    if depth == 1: #every legal move is a leaf, no need to make them
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.make_move(move)
+        nodes += perft(gs, depth - 1)
+        gs.undo_move()
+    return nodes
+
+'''
+the perft count below every legal move, as (move, count) pairs sorted by move.
+comparing this with another engine's divide shows which move the generator gets wrong
+'''
+def divide(gs, depth):
+    counts = []
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        counts.append((move.get_chess_notation(), perft(gs, depth - 1)))
+        gs.undo_move()
+    return sorted(counts)
+
+def load_position(fen, backend='list'):
+    gs = GameState(fen)
+    if backend == 'bitboard':
+        return BitboardGameState(gs)
+    return gs
+
+'''
+runs perft on one position and returns a dict with the node count, the time taken, nodes per second and,
+if trace_memory is set, the peak memory Python allocated during the run (tracing makes the run itself slower)
+'''
+def run_position(name, fen, depth, backend='list', expected=None, trace_memory=False):
+    gs = load_position(fen, backend)
+    key = gs.zobrist_key
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    nodes = perft(gs, depth)
+    seconds = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if gs.zobrist_key != key or gs.moveLog:
+        raise RuntimeError('undo_move did not restore the position ' + name)
+    return {'name': name, 'backend': backend, 'depth': depth, 'nodes': nodes, 'expected': expected,
+            'seconds': seconds, 'nps': nodes / seconds if seconds else 0.0, 'peak_bytes': peak}
+
+#every bundled position that has a known count at depth, on every backend given
+def run_suite(depth, backends=('list',), trace_memory=False):
+    results = []
+    for backend in backends:
+        for name, fen, counts in POSITIONS:
+            if depth <= len(counts):
+                results.append(run_position(name, fen, depth, backend, counts[depth - 1], trace_memory))
+    return results
+
+#one result per backend adding up all of its positions, so short runs still count towards a speed check
+def totals(results):
+    summed = {}
+    for result in results:
+        if result['backend'] not in summed:
+            summed[result['backend']] = {'name': 'total', 'backend': result['backend'], 'depth': result['depth'], 'nodes': 0,
+                                         'expected': None, 'seconds': 0.0, 'nps': 0.0, 'peak_bytes': None}
+        total = summed[result['backend']]
+        total['nodes'] += result['nodes']
+        total['seconds'] += result['seconds']
+        total['nps'] = total['nodes'] / total['seconds'] if total['seconds'] else 0.0
+    return list(summed.values())
+
+#largest resident size of this process so far, in bytes, or None where the OS doesn't report it
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 #macOS reports bytes, Linux kilobytes
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(results, path=BASELINE_FILE):
+    baseline = load_baseline(path)
+    for result in results:
+        baseline[baseline_key(result)] = {'nodes': result['nodes'], 'nps': round(result['nps'])}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def baseline_key(result):
+    return '%s/%s/%d' % (result['backend'], result['name'], result['depth'])
+
+'''
+the problems with results: wrong node counts, and positions that ran more than `allowed` slower than the baseline
+'''
+def compare(results, baseline, allowed=SLOWDOWN_ALLOWED):
+    problems = []
+    for result in results:
+        if result['expected'] is not None and result['nodes'] != result['expected']:
+            problems.append('%s: %d nodes, expected %d' % (baseline_key(result), result['nodes'], result['expected']))
+        stored = baseline.get(baseline_key(result))
+        if stored and result['seconds'] >= MIN_TIMED_SECONDS and result['nps'] < stored['nps'] * (1 - allowed):
+            problems.append('%s: %.0f nodes/s, baseline %d' % (baseline_key(result), result['nps'], stored['nps']))
+    return problems
+
+def print_results(results, baseline):
+    print('%-9s %-14s %5s %10s %8s %10s %9s %10s' % ('backend', 'position', 'depth', 'nodes', 'seconds', 'nodes/s', 'baseline', 'peak KiB'))
+    for result in results:
+        stored = baseline.get(baseline_key(result))
+        status = '' if result['expected'] is None or result['nodes'] == result['expected'] else '  WRONG, expected %d' % result['expected']
+        print('%-9s %-14s %5d %10d %8.3f %10.0f %9s %10s%s' % (result['backend'], result['name'], result['depth'], result['nodes'],
+              result['seconds'], result['nps'], stored['nps'] if stored else '-',
+              result['peak_bytes'] // 1024 if result['peak_bytes'] is not None else '-', status))
+    for total in totals(results):
+        stored = baseline.get(baseline_key(total))
+        print('%s total: %d nodes in %.2f s, %.0f nodes/s (baseline %s)' % (total['backend'], total['nodes'], total['seconds'],
+              total['nps'], stored['nps'] if stored else '-'))
+    rss = peak_rss()
+    if rss is not None:
+        print('peak process memory %.1f MiB' % (rss / (1024 * 1024)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='count move tree leaves to check and time the move generator')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--backend', choices=BACKENDS + ('all',), default='list')
+    parser.add_argument('--fen', help='run this position instead of the bundled ones')
+    parser.add_argument('--divide', action='store_true', help='with --fen, print the count below every move')
+    parser.add_argument('--trace-memory', action='store_true', help='measure the peak Python allocations of every run (slower)')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='store these speeds as the new baseline')
+    parser.add_argument('--allowed-slowdown', type=float, default=SLOWDOWN_ALLOWED)
+    args = parser.parse_args(argv)
+    backends = BACKENDS if args.backend == 'all' else (args.backend,)
+
+    if args.fen:
+        for backend in backends:
+            if args.divide:
+                gs = load_position(args.fen, backend)
+                counts = divide(gs, args.depth)
+                for notation, count in counts:
+                    print('%s: %d' % (notation, count))
+                print('%s: %d moves, %d nodes' % (backend, len(counts), sum(count for _, count in counts)))
+            else:
+                print_results([run_position('fen', args.fen, args.depth, backend, trace_memory=args.trace_memory)], {})
+        return 0
+
+    results = run_suite(args.depth, backends, args.trace_memory)
+    if not results:
+        print('no bundled position has a known count at depth', args.depth)
+        return 1
+    baseline = load_baseline(args.baseline)
+    print_results(results, baseline)
+    results += totals(results)
+    if args.save_baseline:
+        wrong = [result for result in results if result['expected'] is not None and result['nodes'] != result['expected']]
+        if wrong:
+            print('not saving a baseline with wrong node counts')
+            return 1
+        save_baseline(results, args.baseline)
+        print('saved baseline to', args.baseline)
+        return 0
+    problems = compare(results, baseline, args.allowed_slowdown)
+    for problem in problems:
+        print('FAIL', problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,432 @@
+'''
+Endgame tablebases for the small endings the search can't see the end of: KQK, KRK, KPK and KBNK. Every position of an
+ending gets its distance to mate, so the AI plays the shortest way to mate instead of shuffling pieces around.
+
+    python chessTablebase.py generate tablebases --workers 8
+    python chessTablebase.py probe tablebases --fen "8/8/8/4k3/8/8/8/KBN5 w - - 0 1"
+
+Tables are generated by retrograde analysis, from the checkmates backwards. First every position is set up in a
+chessEngine GameState and the moves of the defending king are generated, in chunks on a pool of worker processes.
+Then, one ply of distance at a time, positions where the defender is mated in n make every position the attacker can
+reach them from by one (unmade) move a win in n + 1, and a defender position is lost in n + 2 once all of its moves
+lead to such wins. Positions never reached are draws.
+
+The stronger side is always white in the tables; positions where it is black are looked up with the board flipped.
+Without pawns, the eight symmetries of the board put the white king in the a1-d1-d4 triangle (10 squares instead of
+64); with a pawn, mirroring puts the pawn on files a to d. A table file holds one byte per position, first with white
+to move and then with black to move: 0 for a draw (or a position that can't happen), otherwise the distance to mate in
+plies + 1. An odd distance is a win for the side to move, an even one a loss. Files are read through mmap, so any
+number of engine processes share one copy of them in the page cache.
+'''
+
+import argparse
+import mmap
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from chessEngine import GameState, Castle_rights
+
+ENDGAMES = ('KQK', 'KRK', 'KPK', 'KBNK') #in the order they are generated
+DEPENDENCIES = {'KPK': ('KQK', 'KRK')} #tables the promotions of an ending are looked up in
+DRAWN_MATERIAL = ('KK', 'KBK', 'KNK') #no mate is possible, so these need no table
+PIECE_ORDER = 'kqrbnp' #order of the pieces in a table name
+WORKERS = os.cpu_count() or 1 #default number of worker processes
+CHUNK_SIZE = 1 << 16 #positions examined per worker task
+WIN, DRAW, LOSS = 1, 0, -1
+NO_CASTLING = Castle_rights(False, False, False, False)
+
+#status of the positions with black (the defending side) to move, found by examine_positions
+ILLEGAL, OPEN, MATED, DRAWN = 0, 1, 2, 3
+
+'''
+square numbers are row * 8 + column, like everywhere else (0 is a8). The symmetries of the board are mirroring the
+columns, the rows, both, and each of those followed by mirroring along the a1-h8 diagonal
+'''
+def square_transform(mirror_columns, mirror_rows, transpose):
+    transform = []
+    for square in range(64):
+        r, c = divmod(square, 8)
+        if mirror_columns:
+            c = 7 - c
+        if mirror_rows:
+            r = 7 - r
+        if transpose:
+            r, c = 7 - c, 7 - r
+        transform.append(r * 8 + c)
+    return transform
+
+TRANSFORMS = [square_transform(columns, rows, transpose) for transpose in (False, True) for rows in (False, True)
+              for columns in (False, True)]
+IDENTITY = TRANSFORMS[0]
+MIRROR_COLUMNS = TRANSFORMS[1]
+TRANSPOSE = square_transform(False, False, True)
+FLIP_ROWS = TRANSFORMS[2] #for looking up positions where black is the stronger side
+#squares of the a1-d1-d4 triangle: files a to d and the file at least the rank
+TRIANGLE = [square for square in range(64) if square % 8 <= 3 and 7 - square // 8 <= square % 8]
+DIAGONAL = [square for square in TRIANGLE if 7 - square // 8 == square % 8]
+#for every square the first symmetry that takes it into the triangle
+TRIANGLE_TRANSFORMS = [next(transform for transform in TRANSFORMS if transform[square] in TRIANGLE) for square in range(64)]
+#pawns stand on ranks 2 to 7, and after mirroring on files a to d
+PAWN_SQUARES = [square for square in range(8, 56) if square % 8 <= 3]
+
+def steps(square, directions, slide):
+    r, c = divmod(square, 8)
+    rays = []
+    for dr, dc in directions:
+        ray = []
+        row, column = r + dr, c + dc
+        while 0 <= row < 8 and 0 <= column < 8:
+            ray.append(row * 8 + column)
+            if not slide:
+                break
+            row, column = row + dr, column + dc
+        if ray:
+            rays.append(ray)
+    return rays
+
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (0, 1), (1, 0))
+KING_DIRECTIONS = BISHOP_DIRECTIONS + ROOK_DIRECTIONS
+KNIGHT_DIRECTIONS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = [[ray[0] for ray in steps(square, KING_DIRECTIONS, False)] for square in range(64)]
+KNIGHT_JUMPS = [[ray[0] for ray in steps(square, KNIGHT_DIRECTIONS, False)] for square in range(64)]
+KING_ZONE = [set(KING_STEPS[square]) | {square} for square in range(64)] #squares the other king can't stand on
+RAYS = {'b': [steps(square, BISHOP_DIRECTIONS, True) for square in range(64)],
+        'r': [steps(square, ROOK_DIRECTIONS, True) for square in range(64)]}
+RAYS['q'] = [RAYS['b'][square] + RAYS['r'][square] for square in range(64)]
+
+'''
+one ending, and how its positions are numbered. A position is the list of squares of the white king, the black king and
+the other white pieces in the order of the name. Its index is the square of the anchor (the white king without pawns,
+the pawn with one) among the squares the symmetries leave it on, followed by the other squares, 6 bits each
+'''
+class Endgame():
+
+    def __init__(self, name):
+        self.name = name
+        self.pieces = name[1:name.index('K', 1)].lower()
+        if self.pieces.count('p') > 1 or name[name.index('K', 1) + 1:]:
+            raise ValueError('only endings of a lone king against at most one pawn are supported: ' + name)
+        self.pawns = 'p' in self.pieces
+        self.anchor = 2 + self.pieces.index('p') if self.pawns else 0
+        self.anchor_squares = PAWN_SQUARES if self.pawns else TRIANGLE
+        self.anchor_index = [-1] * 64
+        for i, square in enumerate(self.anchor_squares):
+            self.anchor_index[square] = i
+        self.size = len(self.anchor_squares) * 64 ** (len(self.pieces) + 1)
+
+    def transform(self, squares):
+        anchor = squares[self.anchor]
+        if self.pawns:
+            return MIRROR_COLUMNS if anchor % 8 > 3 else IDENTITY
+        return TRIANGLE_TRANSFORMS[anchor]
+
+    def index(self, squares):
+        transform = self.transform(squares)
+        index = self.anchor_index[transform[squares[self.anchor]]]
+        for i, square in enumerate(squares):
+            if i != self.anchor:
+                index = index * 64 + transform[square]
+        return index
+
+    '''
+    index of squares, and of its mirror image along the diagonal too if the white king is on the diagonal, where both
+    of them are in the triangle
+    '''
+    def indices(self, squares):
+        index = self.index(squares)
+        if self.pawns:
+            return (index,)
+        transform = self.transform(squares)
+        if transform[squares[0]] not in DIAGONAL:
+            return (index,)
+        twin = self.index([TRANSPOSE[transform[square]] for square in squares])
+        return (index,) if twin == index else (index, twin)
+
+    def squares(self, index):
+        rest = []
+        for i in range(len(self.pieces) + 1):
+            index, square = divmod(index, 64)
+            rest.append(square)
+        rest.reverse()
+        rest.insert(self.anchor, self.anchor_squares[index])
+        return rest
+
+    def board(self, squares):
+        board = [['--'] * 8 for r in range(8)]
+        for square, piece in zip(squares, ['wk', 'bk'] + ['w' + piece for piece in self.pieces]):
+            board[square // 8][square % 8] = piece
+        return board
+
+    #positions (as squares, with white to move) that a move of a white piece (not a capture) leads to squares from
+    def white_unmoves(self, squares):
+        occupied = set(squares)
+        white_king, black_king = squares[0], squares[1]
+        for square in KING_STEPS[white_king]:
+            if square not in occupied and square not in KING_ZONE[black_king]:
+                yield [square] + squares[1:]
+        for i, piece in enumerate(self.pieces, 2):
+            square = squares[i]
+            if piece == 'n':
+                origins = [origin for origin in KNIGHT_JUMPS[square] if origin not in occupied]
+            elif piece == 'p':
+                origins = []
+                #a white pawn came from the row below, or two rows below if it is on the fourth rank
+                if square // 8 <= 5 and square + 8 not in occupied:
+                    origins.append(square + 8)
+                    if square // 8 == 4 and square + 16 not in occupied:
+                        origins.append(square + 16)
+            else:
+                origins = []
+                for ray in RAYS[piece][square]:
+                    for origin in ray:
+                        if origin in occupied:
+                            break
+                        origins.append(origin)
+            for origin in origins:
+                yield squares[:i] + [origin] + squares[i + 1:]
+
+    #positions (with black to move) that a move of the black king leads to squares from
+    def black_unmoves(self, squares):
+        occupied = set(squares)
+        for square in KING_STEPS[squares[1]]:
+            if square not in occupied and square not in KING_ZONE[squares[0]]:
+                yield [squares[0], square] + squares[2:]
+
+'''
+first pass over the positions start to stop of an ending, on the workers: sets every position up with black to move
+and generates its moves with chessEngine. Returns for each of them whether it is legal with white to move, the status
+with black to move and (if OPEN) the positions black's moves lead to. With pawns, also the wins by promotion, as
+(index, plies) of the positions with white to move, looked up in the tables of directory
+'''
+def examine_positions(name, start, stop, directory):
+    endgame = Endgame(name)
+    tablebases = Tablebases(directory) if endgame.pawns else None
+    gs = GameState()
+    white_legal = bytearray(stop - start)
+    status = bytearray(stop - start)
+    counts = bytearray(stop - start)
+    successors = array('I')
+    promotions = []
+    for index in range(start, stop):
+        squares = endgame.squares(index)
+        if len(set(squares)) < len(squares) or squares[1] in KING_ZONE[squares[0]]:
+            continue #ILLEGAL either way
+        gs.set_position(endgame.board(squares), False, NO_CASTLING, ())
+        moves = gs.get_valid_moves()
+        white_legal[index - start] = not gs.in_check() #white can't be to move with black in check
+        if not moves:
+            status[index - start] = MATED if gs.check_mate else DRAWN
+        elif any(move.piece_captured != '--' for move in moves): #taking a piece leaves no mating material
+            status[index - start] = DRAWN
+        else:
+            status[index - start] = OPEN
+            counts[index - start] = len(moves)
+            for move in moves:
+                successors.append(endgame.index([squares[0], move.end_row * 8 + move.end_column] + squares[2:]))
+        if endgame.pawns and white_legal[index - start] and 8 <= squares[endgame.anchor] < 16:
+            gs.set_position(endgame.board(squares), True, NO_CASTLING, ())
+            best = None
+            for move in gs.get_valid_moves():
+                if move.is_pawn_promotion and move.promotion_piece in ('q', 'r'):
+                    promoted = squares[:endgame.anchor] + [move.end_row * 8 + move.end_column] + squares[endgame.anchor + 1:]
+                    result = tablebases.probe_squares('K' + move.promotion_piece.upper() + 'K', promoted, False)
+                    if result is not None and result[0] == LOSS and (best is None or result[1] + 1 < best):
+                        best = result[1] + 1
+            if best is not None:
+                promotions.append((index, best))
+    return white_legal, status, counts, successors, promotions
+
+'''
+the retrograde analysis of one ending, from what examine_positions found. Returns the bytes of the table file
+'''
+def solve(endgame, white_legal, status, offsets, successors, promotions):
+    size = endgame.size
+    white = bytearray(size) #distance to mate in plies + 1, 0 while not known to be won (or lost)
+    black = bytearray(size)
+    waiting = {} #plies -> positions with white to move won by a promotion in that many plies
+    for index, plies in promotions:
+        waiting.setdefault(plies, []).append(index)
+    lost = [index for index in range(size) if status[index] == MATED]
+    for index in lost:
+        black[index] = 1
+    plies = 0 #of the positions in lost
+    while lost or waiting:
+        won = []
+        for index in lost:
+            for squares in endgame.white_unmoves(endgame.squares(index)):
+                for previous in endgame.indices(squares):
+                    if white_legal[previous] and not white[previous]:
+                        white[previous] = plies + 2
+                        won.append(previous)
+        plies += 1
+        for index in waiting.pop(plies, ()):
+            if not white[index]:
+                white[index] = plies + 1
+                won.append(index)
+        lost = []
+        for index in won:
+            for squares in endgame.black_unmoves(endgame.squares(index)):
+                previous = endgame.index(squares)
+                if status[previous] == OPEN and not black[previous] and \
+                        all(white[successor] for successor in successors[offsets[previous]:offsets[previous + 1]]):
+                    black[previous] = plies + 2
+                    lost.append(previous)
+        plies += 1
+        if plies > 253:
+            raise ValueError(endgame.name + ' has mates too long for one byte')
+    return bytes(white) + bytes(black)
+
+'''
+generates the table of one ending into directory, its positions examined on executor (in this process if None)
+'''
+def generate_table(name, directory, executor=None):
+    endgame = Endgame(name)
+    chunks = [(start, min(start + CHUNK_SIZE, endgame.size)) for start in range(0, endgame.size, CHUNK_SIZE)]
+    args = ([name] * len(chunks), [start for start, stop in chunks], [stop for start, stop in chunks], [directory] * len(chunks))
+    results = executor.map(examine_positions, *args) if executor is not None else map(examine_positions, *args)
+    white_legal, status, counts, successors, promotions = bytearray(), bytearray(), bytearray(), array('I'), []
+    for chunk_legal, chunk_status, chunk_counts, chunk_successors, chunk_promotions in results:
+        white_legal += chunk_legal
+        status += chunk_status
+        counts += chunk_counts
+        successors.extend(chunk_successors)
+        promotions.extend(chunk_promotions)
+    offsets = array('I', [0]) #successors of position i are successors[offsets[i]:offsets[i + 1]]
+    total = 0
+    for count in counts:
+        total += count
+        offsets.append(total)
+    del counts
+    table = solve(endgame, white_legal, status, offsets, successors, promotions)
+    path = os.path.join(directory, name + '.tb')
+    with open(path + '.tmp', 'wb') as f:
+        f.write(table)
+    os.replace(path + '.tmp', path)
+    return path
+
+'''
+generates the tables of names (all ENDGAMES if None) into directory, with the tables they depend on first if those
+aren't there yet. progress(name, seconds) is called after each one
+'''
+def generate(directory, names=None, workers=None, progress=None):
+    names = list(names or ENDGAMES)
+    for name in list(names):
+        for dependency in DEPENDENCIES.get(name, ()):
+            if dependency not in names and not os.path.exists(os.path.join(directory, dependency + '.tb')):
+                names.append(dependency)
+    names.sort(key=lambda name: ENDGAMES.index(name) if name in ENDGAMES else len(ENDGAMES))
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or WORKERS
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for name in names:
+            start = time.perf_counter()
+            generate_table(name, directory, executor)
+            if progress is not None:
+                progress(name, time.perf_counter() - start)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+#the tables of a directory, each opened through mmap the first time it is needed
+class Tablebases():
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {} #name -> (Endgame, mmap), or None if there is no file for it
+
+    def table(self, name):
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + '.tb')
+            self.tables[name] = None
+            if os.path.exists(path):
+                endgame = Endgame(name)
+                with open(path, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size != 2 * endgame.size:
+                        raise ValueError('%s is not a table of %s' % (path, name))
+                    self.tables[name] = (endgame, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return self.tables[name]
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table[1].close()
+        self.tables = {}
+
+    #(WIN, DRAW or LOSS for the side to move, distance to mate in plies) of the squares of an ending, None if no table
+    def probe_squares(self, name, squares, white_to_move):
+        table = self.table(name)
+        if table is None:
+            return None
+        endgame, data = table
+        value = data[endgame.index(squares) + (0 if white_to_move else endgame.size)]
+        if value == 0:
+            return DRAW, 0
+        return (WIN if value % 2 == 0 else LOSS), value - 1
+
+    '''
+    (WIN, DRAW or LOSS for the side to move, distance to mate in plies) of the position of gs (either backend), or
+    None if it isn't one of the endings there are tables for. Castling rights and the fifty-move rule are ignored
+    '''
+    def probe(self, gs):
+        board = gs.board
+        if sum(row.count('--') for row in board) < 60: #more than 4 pieces, quick way out in the middle of a search
+            return None
+        white, black = [], []
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece != '--':
+                    (white if piece[0] == 'w' else black).append((piece[1], r * 8 + c))
+        white.sort(key=lambda piece: PIECE_ORDER.index(piece[0]))
+        black.sort(key=lambda piece: PIECE_ORDER.index(piece[0]))
+        white_to_move = gs.white_to_move
+        if len(black) > len(white): #black is the stronger side, look it up with the colours swapped
+            white, black = [(piece, FLIP_ROWS[square]) for piece, square in black], [(piece, FLIP_ROWS[square]) for piece, square in white]
+            white_to_move = not white_to_move
+        name = ''.join(piece for piece, square in white).upper() + ''.join(piece for piece, square in black).upper()
+        if name in DRAWN_MATERIAL:
+            return DRAW, 0
+        if len(black) != 1 or name not in ENDGAMES:
+            return None
+        return self.probe_squares(name, [white[0][1], black[0][1]] + [square for piece, square in white[1:]], white_to_move)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='generate or probe endgame tablebases')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('generate', help='generate the tables of some or all endings')
+    build.add_argument('directory')
+    build.add_argument('endings', nargs='*', help='some of %s, all of them if none are given' % ', '.join(ENDGAMES))
+    build.add_argument('--workers', type=int, default=WORKERS)
+    probe = commands.add_parser('probe', help='look up a position')
+    probe.add_argument('directory')
+    probe.add_argument('--fen', required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        for name in args.endings:
+            if name not in ENDGAMES:
+                parser.error('no tables for ' + name)
+        report = lambda name, seconds: print('%s: %.1fs' % (name, seconds), file=sys.stderr)
+        generate(args.directory, args.endings, args.workers, report)
+        return 0
+    try:
+        gs = GameState(args.fen)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    result = Tablebases(args.directory).probe(gs)
+    if result is None:
+        print('not in the tables')
+    elif result[0] == DRAW:
+        print('draw')
+    else:
+        print('%s in %d plies' % ('win' if result[0] == WIN else 'loss', result[1]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
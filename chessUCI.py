@@ -0,0 +1,202 @@
+'''
+UCI front end, so the engine can be used from chess GUIs and tournament managers over stdin/stdout:
+
+    python chessUCI.py
+
+Supports uci, isready, ucinewgame, setoption (Hash, Bitboards), position startpos/fen ... moves ..., go with depth,
+movetime, wtime/btime/winc/binc/movestogo, nodes and infinite, stop and quit. The search runs on a worker thread and
+reports an info line with depth, score, nodes, nps, time and pv after every iteration. On stop the best move of the last
+finished iteration is sent straight away, while the worker is still winding down. Like chessCLI, it never imports pygame.
+'''
+
+import sys
+import threading
+import time
+import chessAI
+from chessCLI import load_game_state
+from chessEngine import START_FEN
+
+ENGINE_NAME = 'chessAI'
+ENGINE_AUTHOR = 'Ken Wu'
+MOVE_OVERHEAD = 0.03 #seconds kept back from every move for the GUI and the pipes
+DEFAULT_MOVES_TO_GO = 30 #moves the remaining clock time is shared out over when the GUI doesn't say
+SWITCH_INTERVAL = 0.0002 #seconds, the search thread hands the GIL to the stdin thread at least this often so stop is read quickly
+
+class UCIEngine():
+
+    def __init__(self, output=None):
+        self.output = output if output is not None else sys.stdout
+        self.output_lock = threading.Lock() #the worker and the command loop both write
+        self.bitboards = False
+        self.gs = load_game_state(START_FEN)
+        self.worker = None #thread running the current search
+        self.stop = None #stop event of the current search
+        self.result_lock = threading.Lock()
+        self.best_move = None #notation of the best move of the last finished iteration
+        self.bestmove_sent = True
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    '''
+    handles one line from the GUI, returns False once the engine should quit
+    '''
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send('id name ' + ENGINE_NAME)
+            self.send('id author ' + ENGINE_AUTHOR)
+            self.send('option name Hash type spin default %d min 1 max 4096' % chessAI.TT_SIZE_MB)
+            self.send('option name Bitboards type check default false')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'ucinewgame':
+            self.finish_search()
+            chessAI.default_transposition_table().clear()
+            self.gs = load_game_state(START_FEN, bitboards=self.bitboards)
+        elif command == 'setoption':
+            self.finish_search()
+            self.set_option(args)
+        elif command == 'position':
+            self.finish_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.finish_search()
+            self.go(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'quit':
+            self.finish_search()
+            return False
+        else:
+            self.send('info string unknown command ' + command)
+        return True
+
+    def set_option(self, args):
+        if 'name' not in args or 'value' not in args:
+            return
+        name = ' '.join(args[args.index('name') + 1:args.index('value')]).lower()
+        value = ' '.join(args[args.index('value') + 1:])
+        if name == 'hash':
+            chessAI.TT_SIZE_MB = max(1, int(value))
+            chessAI.transposition_table = None #made again with the new size on the next search
+        elif name == 'bitboards':
+            self.bitboards = value.lower() == 'true'
+            self.gs = load_game_state(START_FEN, bitboards=self.bitboards)
+        else:
+            self.send('info string unknown option ' + name)
+
+    #position startpos [moves ...] or position fen <six fields> [moves ...]
+    def set_position(self, args):
+        moves = args[args.index('moves') + 1:] if 'moves' in args else []
+        setup = args[:args.index('moves')] if 'moves' in args else args
+        if setup and setup[0] == 'fen':
+            fen = ' '.join(setup[1:])
+        else:
+            fen = START_FEN
+        try:
+            self.gs = load_game_state(fen, moves, self.bitboards)
+        except ValueError as e:
+            self.send('info string ' + str(e))
+
+    def go(self, args):
+        params = {}
+        infinite = 'infinite' in args
+        for name in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'nodes'):
+            if name in args and args.index(name) + 1 < len(args):
+                try:
+                    params[name] = int(args[args.index(name) + 1])
+                except ValueError:
+                    self.send('info string ignoring %s %s' % (name, args[args.index(name) + 1]))
+        time_limit = self.time_for_move(params)
+        depth = params.get('depth')
+        if depth is None and time_limit is None and 'nodes' not in params:
+            infinite = True #a bare go searches until stop
+        self.stop = threading.Event()
+        with self.result_lock:
+            self.best_move = None
+            self.bestmove_sent = False
+        self.worker = threading.Thread(target=self.run_search, args=(self.gs, depth, time_limit, params.get('nodes'), infinite, self.stop),
+                                       daemon=True)
+        self.worker.start()
+
+    #seconds to search for this move: movetime if given, else a share of the remaining clock plus most of the increment
+    def time_for_move(self, params):
+        if 'movetime' in params:
+            return max(0.001, params['movetime'] / 1000 - MOVE_OVERHEAD)
+        remaining = params.get('wtime' if self.gs.white_to_move else 'btime')
+        if remaining is None:
+            return None
+        increment = params.get('winc' if self.gs.white_to_move else 'binc', 0)
+        budget = remaining / params.get('movestogo', DEFAULT_MOVES_TO_GO) + increment * 0.75
+        return max(0.001, min(budget, remaining / 2) / 1000 - MOVE_OVERHEAD)
+
+    #runs on the worker thread
+    def run_search(self, gs, depth, time_limit, node_limit, infinite, stop):
+        valid_moves = gs.get_valid_moves()
+        tt = chessAI.default_transposition_table()
+        start = time.perf_counter()
+
+        def report(current_depth, move, score):
+            with self.result_lock:
+                self.best_move = move.get_chess_notation()
+            seconds = time.perf_counter() - start
+            mate = chessAI.mate_distance(score)
+            pv = chessAI.principal_variation(gs, move, tt, current_depth)
+            self.send('info depth %d score %s nodes %d nps %d time %d pv %s' % (
+                current_depth, 'mate %d' % mate if mate is not None else 'cp %d' % score, chessAI.nodes_searched,
+                chessAI.nodes_searched / seconds if seconds else 0, seconds * 1000, ' '.join(m.get_chess_notation() for m in pv)))
+
+        move, score = chessAI.search(gs, list(valid_moves), depth, tt, time_limit, node_limit, stop, report)
+        if infinite:
+            stop.wait() #in infinite mode the answer only goes out once the GUI says stop
+        with self.result_lock:
+            if move is not None:
+                self.best_move = move.get_chess_notation()
+            elif self.best_move is None and valid_moves: #stopped before the first iteration finished
+                self.best_move = valid_moves[0].get_chess_notation()
+            self.send_bestmove()
+
+    #call with result_lock held, sends the answer to go once
+    def send_bestmove(self):
+        if not self.bestmove_sent:
+            self.bestmove_sent = True
+            self.send('bestmove ' + (self.best_move if self.best_move is not None else '0000'))
+
+    '''
+    stop: answers with the last finished iteration right away if there is one, the worker then only has to unwind.
+    Otherwise the worker answers once it has stopped, which takes a few nodes
+    '''
+    def stop_search(self):
+        if self.stop is None:
+            return
+        self.stop.set()
+        with self.result_lock:
+            if self.best_move is not None:
+                self.send_bestmove()
+
+    #stops the running search if there is one and waits for it, so the game state can be changed
+    def finish_search(self):
+        if self.worker is not None:
+            self.stop_search()
+            self.worker.join()
+            self.worker = None
+            self.stop = None
+
+def main():
+    sys.setswitchinterval(SWITCH_INTERVAL)
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.finish_search()
+
+
+if __name__ == '__main__':
+    main()
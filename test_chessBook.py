@@ -0,0 +1,120 @@
+'''
+checks of chessBook: Polyglot keys against the reference values published with the format, move codes, and a book
+built from PGN and EPD files read back through OpeningBook
+
+    python -m pytest test_chessBook.py
+'''
+
+import os
+import tempfile
+import unittest
+from chessBook import EPD_BEST_MOVE_WEIGHT, OpeningBook, build_book, encode_move, polyglot_key
+from chessEngine import GameState, move_from_notation, move_from_san, move_to_san
+
+#(moves from the starting position, key), from the Polyglot book format description
+REFERENCE_KEYS = [
+    ([], 0x463B96181691FC9C),
+    (['e2e4'], 0x823C9B50FD114196), #e3 doesn't count, no black pawn can take there
+    (['e2e4', 'd7d5'], 0x0756B94461C50FB0),
+    (['e2e4', 'd7d5', 'e4e5'], 0x662FAFB965DB29D4),
+    (['e2e4', 'd7d5', 'e4e5', 'f7f5'], 0x22A48B5A8E47FF78), #e5 can take on f6
+    (['e2e4', 'd7d5', 'e4e5', 'f7f5', 'e1e2'], 0x652A607CA3F242C1),
+    (['e2e4', 'd7d5', 'e4e5', 'f7f5', 'e1e2', 'e8f7'], 0x00FDD303C946BDD9),
+    (['a2a4', 'b7b5', 'h2h4', 'b5b4', 'c2c4'], 0x3C8123EA7B067637), #b4 can take on c3
+    (['a2a4', 'b7b5', 'h2h4', 'b5b4', 'c2c4', 'b4c3', 'a1a3'], 0x5C3F9B829B279560),
+]
+
+#plays moves (in coordinate notation) from the starting position
+def play(moves):
+    gs = GameState()
+    for notation in moves:
+        move = move_from_notation(gs, notation)
+        assert move is not None, notation
+        gs.make_move(move)
+    return gs
+
+class PolyglotKeyTest(unittest.TestCase):
+
+    def test_reference_keys(self):
+        for moves, key in REFERENCE_KEYS:
+            self.assertEqual(polyglot_key(play(moves)), key, moves)
+
+    def test_reference_keys_from_fen(self):
+        for moves, key in REFERENCE_KEYS:
+            self.assertEqual(polyglot_key(GameState(play(moves).to_fen())), key, moves)
+
+    def test_key_after_undo(self):
+        gs = play(['e2e4', 'd7d5', 'e4e5', 'f7f5'])
+        for _ in range(4):
+            gs.undo_move()
+        self.assertEqual(polyglot_key(gs), REFERENCE_KEYS[0][1])
+
+class EncodeMoveTest(unittest.TestCase):
+
+    def test_plain_moves(self):
+        gs = GameState()
+        self.assertEqual(encode_move(move_from_notation(gs, 'e2e4')), 1 << 9 | 4 << 6 | 3 << 3 | 4)
+        self.assertEqual(encode_move(move_from_notation(gs, 'g1f3')), 0 << 9 | 6 << 6 | 2 << 3 | 5)
+
+    def test_castling_is_king_takes_rook(self):
+        white = GameState('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+        self.assertEqual(encode_move(move_from_san(white, 'O-O')), 0 << 9 | 4 << 6 | 0 << 3 | 7) #e1h1
+        self.assertEqual(encode_move(move_from_san(white, 'O-O-O')), 0 << 9 | 4 << 6 | 0 << 3 | 0) #e1a1
+        black = GameState('r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1')
+        self.assertEqual(encode_move(move_from_san(black, 'O-O')), 7 << 9 | 4 << 6 | 7 << 3 | 7) #e8h8
+        self.assertEqual(encode_move(move_from_san(black, 'O-O-O')), 7 << 9 | 4 << 6 | 7 << 3 | 0) #e8a8
+
+    def test_promotion(self):
+        gs = GameState('8/4P3/8/8/8/8/k7/4K3 w - - 0 1')
+        self.assertEqual(encode_move(move_from_san(gs, 'e8=Q')), 4 << 12 | 6 << 9 | 4 << 6 | 7 << 3 | 4)
+        self.assertEqual(encode_move(move_from_san(gs, 'e8=N')), 1 << 12 | 6 << 9 | 4 << 6 | 7 << 3 | 4)
+
+class BuildBookTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    #{SAN: weight} of the book moves of gs
+    def book_moves(self, book, gs):
+        return {move_to_san(gs, move): weight for move, weight in book.moves(gs)}
+
+    def test_build_then_probe(self):
+        pgn = self.write('games.pgn', '[Result "1-0"]\n\n1. e4 e5 2. Nf3 1-0\n\n'
+                                      '[Result "0-1"]\n\n1. e4 c5 0-1\n\n'
+                                      '[Result "1/2-1/2"]\n\n1. d4 {a comment} d5 (1... Nf6) 1/2-1/2\n')
+        epd = self.write('positions.epd', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - bm Nf3; id "start";\n')
+        path = os.path.join(self.directory.name, 'book.bin')
+        self.assertEqual(build_book([pgn, epd], path), 7) #3 first moves, 2 replies to e4, Nf3 and d5
+        with OpeningBook(path) as book:
+            gs = GameState()
+            self.assertEqual(self.book_moves(book, gs), {'e4': 2, 'Nf3': EPD_BEST_MOVE_WEIGHT, 'd4': 1})
+            gs.make_move(move_from_san(gs, 'e4'))
+            self.assertEqual(self.book_moves(book, gs), {'c5': 2, 'e5': 0})
+            self.assertEqual(move_to_san(gs, book.book_move(gs)), 'c5') #e5 has weight 0 and is never played
+            self.assertEqual([weight for code, weight, learn in book.lookup(polyglot_key(gs))], [2, 0]) #highest first
+            gs.make_move(move_from_san(gs, 'c5'))
+            self.assertEqual(book.moves(gs), [])
+            self.assertIsNone(book.book_move(gs))
+
+    def test_min_games(self):
+        pgn = self.write('games.pgn', '[Result "1-0"]\n\n1. e4 e5 1-0\n\n[Result "1-0"]\n\n1. e4 c5 1-0\n\n')
+        path = os.path.join(self.directory.name, 'book.bin')
+        build_book([pgn], path, min_games=2)
+        with OpeningBook(path) as book:
+            self.assertEqual(self.book_moves(book, GameState()), {'e4': 4})
+
+    def test_not_a_book(self):
+        path = self.write('book.bin', 'not sixteen bytes')
+        with self.assertRaises(ValueError):
+            OpeningBook(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+'''
+checks of chessEngine's game state beyond move generation (which chessPerft covers): FEN loading and export, and
+moves in standard algebraic notation, and the Zobrist key and evaluation kept up to date by make_move and undo_move on both backends
+
+    python -m pytest test_chessEngine.py
+'''
+
+import random
+import unittest
+from chessBitboard import BitboardGameState
+from chessEval import evaluate_board
+from chessEngine import GameState, START_FEN, compute_zobrist_key, move_from_notation, move_from_san, move_to_san
+
+FENS = [
+    START_FEN,
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+    'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+    'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3',
+    'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1',
+    '4k3/8/8/8/8/8/8/4K3 b - - 57 112',
+]
+
+BAD_FENS = [
+    '',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1', #7 ranks
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQxq - 0 1',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e4 0 1',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQQBNR w kq - 0 1', #no white king
+    'rnbqkbnr/ppppppXp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'P3k3/8/8/8/8/8/8/4K3 w - - 0 1', #pawn on the last rank
+    '4k3/8/8/8/8/8/8/p3K3 b - - 0 1', #pawn on the first rank
+    '4k2R/8/8/8/8/8/8/4K3 w - - 0 1', #black is in check with white to move
+]
+
+class FenTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for fen in FENS:
+            self.assertEqual(GameState(fen).to_fen(), fen)
+
+    def test_reload(self):
+        gs = GameState()
+        for fen in FENS:
+            gs.load_fen(fen)
+            self.assertEqual(gs.to_fen(), fen)
+            self.assertEqual(gs.zobrist_key, GameState(fen).zobrist_key)
+
+    def test_epd(self):
+        gs = GameState('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - bm Qxf6; id "kiwipete";')
+        self.assertEqual(gs.to_fen(), FENS[1])
+
+    def test_castling_needs_king_and_rook(self):
+        self.assertEqual(GameState('r3k3/8/8/8/8/8/8/4K2R w KQkq - 0 1').to_fen(), 'r3k3/8/8/8/8/8/8/4K2R w Kq - 0 1')
+
+    def test_counters_after_moves(self):
+        gs = GameState()
+        for notation in ('g1f3', 'g8f6', 'f3g1', 'f6g8', 'e2e4'):
+            gs.make_move(move_from_notation(gs, notation))
+        self.assertEqual(gs.to_fen(), 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 3')
+        gs.undo_move()
+        self.assertEqual(gs.to_fen(), 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 4 3')
+
+    def test_bad_fens(self):
+        gs = GameState(FENS[1])
+        for fen in BAD_FENS:
+            with self.assertRaises(ValueError, msg=fen):
+                gs.load_fen(fen)
+            self.assertEqual(gs.to_fen(), FENS[1]) #a FEN that fails to load leaves the position as it was
+
+#(FEN, move in coordinate notation, SAN)
+SAN_MOVES = [
+    (START_FEN, 'e2e4', 'e4'),
+    (START_FEN, 'g1f3', 'Nf3'),
+    (FENS[1], 'e1g1', 'O-O'),
+    (FENS[1], 'e1c1', 'O-O-O'),
+    (FENS[1], 'f3f6', 'Qxf6'),
+    (FENS[1], 'e5d7', 'Nxd7'),
+    (FENS[5], 'e5f6', 'exf6'), #en passant
+    ('4k3/8/8/8/8/4K3/8/R6R w - - 0 1', 'a1d1', 'Rad1'),
+    ('4k3/8/8/R7/8/4K3/8/R7 w - - 0 1', 'a1a3', 'R1a3'),
+    ('8/8/k7/8/4Q2Q/8/8/K6Q w - - 0 1', 'h4e1', 'Qh4e1'),
+    ('8/4P3/8/8/k7/8/8/4K3 w - - 0 1', 'e7e8q', 'e8=Q+'),
+    ('8/4P3/8/8/k7/8/8/4K3 w - - 0 1', 'e7e8n', 'e8=N'),
+    ('r3k3/1P6/8/8/8/8/8/4K3 w - - 0 1', 'b7a8q', 'bxa8=Q+'),
+    ('rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq - 0 2', 'd8h4', 'Qh4#'),
+]
+
+class SanTest(unittest.TestCase):
+
+    def test_move_to_san(self):
+        for fen, notation, san in SAN_MOVES:
+            gs = GameState(fen)
+            self.assertEqual(move_to_san(gs, move_from_notation(gs, notation)), san)
+            self.assertEqual(gs.to_fen(), fen) #the move is made and taken back to look for check
+
+    def test_move_from_san(self):
+        for fen, notation, san in SAN_MOVES:
+            gs = GameState(fen)
+            self.assertEqual(move_from_san(gs, san), move_from_notation(gs, notation))
+        gs = GameState(START_FEN)
+        self.assertEqual(move_from_san(gs, 'Nf3!?'), move_from_notation(gs, 'g1f3'))
+        self.assertIsNone(move_from_san(gs, 'Nd2')) #no knight can go there
+        self.assertIsNone(move_from_san(GameState(SAN_MOVES[7][0]), 'Rd1')) #either rook can
+
+    def test_every_move_round_trips(self):
+        for fen in FENS:
+            gs = GameState(fen)
+            valid_moves = gs.get_valid_moves()
+            sans = [move_to_san(gs, move, valid_moves) for move in valid_moves]
+            self.assertEqual(len(set(sans)), len(sans), fen)
+            for move, san in zip(valid_moves, sans):
+                self.assertEqual(move_from_san(gs, san, valid_moves), move, san)
+
+#a GameState and a BitboardGameState of every position of FENS
+def game_states():
+    for fen in FENS:
+        yield GameState(fen)
+        yield BitboardGameState(GameState(fen))
+
+'''
+calls check(gs) on every position of the tree depth plies deep below gs, once after the move leading there is made and
+once after the moves below it are taken back
+'''
+def walk(gs, depth, check):
+    check(gs)
+    if depth == 0:
+        return
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        walk(gs, depth - 1, check)
+        gs.undo_move()
+        check(gs)
+
+#plays plies random moves from gs with a fixed seed, calling check(gs) after each, then takes them all back
+def random_game(gs, plies, check, seed=1):
+    rng = random.Random(seed)
+    played = 0
+    for _ in range(plies):
+        valid_moves = gs.get_valid_moves()
+        if not valid_moves:
+            break
+        gs.make_move(rng.choice(valid_moves))
+        played += 1
+        check(gs)
+    for _ in range(played):
+        gs.undo_move()
+        check(gs)
+
+class ZobristTest(unittest.TestCase):
+
+    def check_key(self, gs):
+        key = compute_zobrist_key(gs.board, gs.white_to_move, gs.current_castling_right, gs.enpassant_possible)
+        self.assertEqual(gs.zobrist_key, key, gs.to_fen())
+
+    def test_key_after_make_and_undo(self):
+        for gs in game_states():
+            walk(gs, 2, self.check_key)
+            random_game(gs, 200, self.check_key)
+
+    def test_same_position_same_key(self):
+        gs = GameState()
+        for notation in ('g1f3', 'g8f6', 'f3g1', 'f6g8'):
+            gs.make_move(move_from_notation(gs, notation))
+        self.assertEqual(gs.zobrist_key, GameState().zobrist_key)
+        for fen in FENS:
+            self.assertEqual(BitboardGameState(GameState(fen)).zobrist_key, GameState(fen).zobrist_key)
+
+    def test_side_castling_and_enpassant_change_the_key(self):
+        keys = {GameState(fen).zobrist_key for fen in (START_FEN, START_FEN.replace(' w ', ' b '),
+                                                       START_FEN.replace('KQkq', 'Qkq'), FENS[5], FENS[5].replace('f6', '-'))}
+        self.assertEqual(len(keys), 5)
+
+class EvaluationTest(unittest.TestCase):
+
+    def check_scores(self, gs):
+        scores = evaluate_board(gs.board)
+        self.assertEqual((gs.white_material, gs.black_material, gs.white_piece_square, gs.black_piece_square), scores,
+                         gs.to_fen())
+        self.assertEqual(gs.evaluation, scores[0] - scores[1] + scores[2] - scores[3], gs.to_fen())
+
+    def test_scores_after_make_and_undo(self):
+        for gs in game_states():
+            walk(gs, 2, self.check_scores)
+            random_game(gs, 200, self.check_scores, seed=2)
+
+    def test_promotion_and_capture(self):
+        gs = GameState('r3k3/1P6/8/8/8/8/8/4K3 w - - 0 1')
+        for move in gs.get_valid_moves():
+            if move.is_pawn_promotion:
+                gs.make_move(move)
+                self.check_scores(gs)
+                gs.undo_move()
+        self.check_scores(gs)
+
+
+if __name__ == '__main__':
+    unittest.main()